@@ -5,10 +5,15 @@ reference + alternate bases/variant type combination, as well as matching
 start or end position.
 """
 
-from typing import Dict, Tuple, List, Optional
+import time
+
+from functools import partial
+from typing import Any, Dict, Tuple, List, Optional
 from ..utils.logging import LOG
 from .. import __apiVersion__, __handover_beacon__, __handover_drs__
-from ..utils.data_query import filter_exists, find_datasets, fetch_datasets_access
+from ..utils.catalog import CATALOG
+from ..utils.data_query import filter_exists, find_datasets, find_exact_variants
+from ..utils.results import RESULTS, result_key
 from ..extensions.handover import make_handover
 from ..extensions.mate_name import find_fusion
 from .exceptions import BeaconUnauthorised, BeaconForbidden, BeaconBadRequest
@@ -62,14 +67,51 @@ def access_resolution(
     return permissions, list(accessible_datasets)
 
 
-async def query_request_handler(params: Tuple) -> Dict:
-    """Handle the parameters of the query endpoint in order to find the required datasets.
+async def find_request_datasets(
+    connection, request: Dict[str, Any], requested_position: Tuple, alternate: Tuple, accessible_datasets: List[str], access_type: List[str]
+) -> List[Dict]:
+    """Find the responses of the accessible datasets to a request over a connection, of breakends or of other variants."""
+    if "mateName" in request or request.get("variantType") == "BND":
+        return await find_fusion(
+            connection,
+            request["assemblyId"],
+            requested_position,
+            request["referenceName"],
+            request["referenceBases"],
+            request.get("mateName"),
+            accessible_datasets,
+            access_type,
+            request.get("includeDatasetResponses", "NONE"),
+        )
+    return await find_datasets(
+        connection,
+        request["assemblyId"],
+        requested_position,
+        request["referenceName"],
+        request["referenceBases"],
+        alternate,
+        accessible_datasets,
+        access_type,
+        request.get("includeDatasetResponses", "NONE"),
+    )
 
-    params = db_pool, method, request, token, host
-    """
-    LOG.info(f'{params[1]} request to beacon endpoint "/query"')
-    request = params[2]
 
+async def lookup_datasets(
+    db_pool, request: Dict, requested_position: Tuple, alternate: Tuple, accessible_datasets: List[str], access_type: List[str]
+) -> List[Dict]:
+    """Find the responses of the accessible datasets to a request, over one connection and one read-only snapshot."""
+    started = time.monotonic()
+    async with db_pool.acquire(timeout=180) as connection:
+        LOG.info(f"Waited {(time.monotonic() - started) * 1000:.1f} ms for a database connection")
+        async with connection.transaction(isolation="serializable", readonly=True, deferrable=True):
+            return await find_request_datasets(connection, request, requested_position, alternate, accessible_datasets, access_type)
+
+
+def parse_allele_request(request: Dict, host: str) -> Tuple[Dict, Tuple[Optional[int], ...], Tuple]:
+    """Return the allele request of the response to a request, and its positions and alternate alleles.
+
+    Positions out of order are rejected with :class:`BeaconBadRequest`.
+    """
     # Fills the Beacon variable with the found data.
     alleleRequest = {
         "referenceName": request.get("referenceName"),
@@ -91,53 +133,23 @@ async def query_request_handler(params: Tuple) -> Dict:
     alternate = alleleRequest.get("variantType"), alleleRequest.get("alternateBases")
 
     # Initialising the values of the positions, based on what we get from request
-    if request.get("variantType") != "BND" and request.get("end") and request.get("end") < request.get("start"):
-        raise BeaconBadRequest(request, params[4], "end value Must be greater than start value")
-    if request.get("endMin") and request.get("endMin") > request.get("endMax"):
-        raise BeaconBadRequest(request, params[4], "endMin value Must be smaller than endMax value")
-    if request.get("startMin") and request.get("startMin") > request.get("startMax"):
-        raise BeaconBadRequest(request, params[4], "startMin value Must be smaller than startMax value")
-    requested_position: Tuple[Optional[int], ...] = (
-        request.get("start", None),
-        request.get("end", None),
-        request.get("startMin", None),
-        request.get("startMax", None),
-        request.get("endMin", None),
-        request.get("endMax", None),
-    )
-
-    # Get dataset ids that were requested, sort by access level
-    # If request is empty (default case) the three dataset variables contain all datasets by access level
-    # Datasets are further filtered using permissions from token
-    public_datasets, registered_datasets, controlled_datasets = await fetch_datasets_access(params[0], request.get("datasetIds"))
-    access_type, accessible_datasets = access_resolution(request, params[3], params[4], public_datasets, registered_datasets, controlled_datasets)
-    if "mateName" in request or alleleRequest.get("variantType") == "BND":
-        datasets = await find_fusion(
-            params[0],
-            request.get("assemblyId"),
-            requested_position,
-            request.get("referenceName"),
-            request.get("referenceBases"),
-            request.get("mateName"),
-            accessible_datasets,
-            access_type,
-            request.get("includeDatasetResponses", "NONE"),
-        )
-    else:
-        datasets = await find_datasets(
-            params[0],
-            request.get("assemblyId"),
-            requested_position,
-            request.get("referenceName"),
-            request.get("referenceBases"),
-            alternate,
-            accessible_datasets,
-            access_type,
-            request.get("includeDatasetResponses", "NONE"),
-        )
-
+    start, end = request.get("start"), request.get("end")
+    start_min, start_max = request.get("startMin"), request.get("startMax")
+    end_min, end_max = request.get("endMin"), request.get("endMax")
+    if request.get("variantType") != "BND" and end and start is not None and end < start:
+        raise BeaconBadRequest(request, host, "end value Must be greater than start value")
+    if end_min and end_max is not None and end_min > end_max:
+        raise BeaconBadRequest(request, host, "endMin value Must be smaller than endMax value")
+    if start_min and start_max is not None and start_min > start_max:
+        raise BeaconBadRequest(request, host, "startMin value Must be smaller than startMax value")
+    requested_position: Tuple[Optional[int], ...] = (start, end, start_min, start_max, end_min, end_max)
+    return alleleRequest, requested_position, alternate
+
+
+def allele_response(request: Dict, host: str, alleleRequest: Dict, datasets: List[Dict]) -> Dict:
+    """Construct the response to a request from the responses of its datasets."""
     beacon_response = {
-        "beaconId": ".".join(reversed(params[4].split("."))),
+        "beaconId": ".".join(reversed(host.split("."))),
         "apiVersion": __apiVersion__,
         "exists": any([x["exists"] for x in datasets]),
         # Error is not required and should not be shown unless exists is null
@@ -152,3 +164,78 @@ async def query_request_handler(params: Tuple) -> Dict:
         beacon_response["beaconHandover"] = make_handover(__handover_beacon__, [x["datasetId"] for x in datasets])
 
     return beacon_response
+
+
+async def query_request_handler(params: Tuple) -> Dict:
+    """Handle the parameters of the query endpoint in order to find the required datasets.
+
+    params = db_pool, method, request, token, host
+
+    Datasets are looked up over one connection of ``db_pool``, in a read-only snapshot.
+    Their access types are kept in memory, see :mod:`beacon_api.utils.catalog`, and so are the
+    results of recent requests, see :mod:`beacon_api.utils.results`, which identical concurrent requests share.
+    """
+    LOG.info(f'{params[1]} request to beacon endpoint "/query"')
+    request = params[2]
+
+    alleleRequest, requested_position, alternate = parse_allele_request(request, params[4])
+
+    # Get dataset ids that were requested, sort by access level, from the dataset catalog
+    # If request is empty (default case) the three dataset variables contain all datasets by access level
+    # Datasets are further filtered using permissions from token
+    public_datasets, registered_datasets, controlled_datasets = await CATALOG.access(params[0], request.get("datasetIds"))
+    access_type, accessible_datasets = access_resolution(request, params[3], params[4], public_datasets, registered_datasets, controlled_datasets)
+
+    # Repeated requests are answered from the result cache, concurrent ones share one lookup
+    key = result_key(request, accessible_datasets, access_type)
+    datasets = await RESULTS.find(
+        key, accessible_datasets, partial(lookup_datasets, params[0], request, requested_position, alternate, accessible_datasets, access_type)
+    )
+
+    return allele_response(request, params[4], alleleRequest, datasets)
+
+
+def exact_variant(request: Dict) -> bool:
+    """Return True for requests of one variant, by its start and alleles without wildcards, see :func:`find_exact_variants`."""
+    if any(name in request for name in ["end", "startMin", "startMax", "endMin", "endMax", "variantType", "mateName"]):
+        return False
+    return "start" in request and "N" not in request["referenceBases"] + request.get("alternateBases", "N")
+
+
+async def batch_request_handler(params: Tuple) -> List[Dict]:
+    """Handle the parameters of the batch query endpoint, many allele requests for the same datasets.
+
+    params = db_pool, method, batch, token, host
+
+    Access to the datasets is resolved once for the batch. Exact variants, see :func:`exact_variant`, are looked up
+    with one query, the other requests one by one, all over one connection of ``db_pool`` in a read-only snapshot.
+    The response to each request is that of the query endpoint, in the order of the requests.
+    """
+    LOG.info(f'{params[1]} request to beacon endpoint "/query/batch"')
+    batch = params[2]
+    # datasetIds and includeDatasetResponses are given once for all requests
+    shared = {key: batch[key] for key in ["datasetIds", "includeDatasetResponses"] if key in batch}
+    requests = [{**request, **shared} for request in batch["requests"]]
+    parsed = [parse_allele_request(request, params[4]) for request in requests]
+
+    public_datasets, registered_datasets, controlled_datasets = await CATALOG.access(params[0], batch.get("datasetIds"))
+    access_type, accessible_datasets = access_resolution(batch, params[3], params[4], public_datasets, registered_datasets, controlled_datasets)
+
+    exact = [index for index, request in enumerate(requests) if exact_variant(request)]
+    variants = [tuple(requests[index][field] for field in ["assemblyId", "referenceName", "start", "referenceBases", "alternateBases"]) for index in exact]
+    responses: Dict[int, List[Dict]] = {}
+    started = time.monotonic()
+    async with params[0].acquire(timeout=180) as connection:
+        LOG.info(f"Waited {(time.monotonic() - started) * 1000:.1f} ms for a database connection")
+        async with connection.transaction(isolation="serializable", readonly=True, deferrable=True):
+            if exact:
+                found = await find_exact_variants(connection, variants, accessible_datasets, access_type, batch.get("includeDatasetResponses", "NONE"))
+                for index, datasets in zip(exact, found):
+                    responses[index] = datasets
+            for index, request in enumerate(requests):
+                if index not in responses:
+                    _, requested_position, alternate = parsed[index]
+                    responses[index] = await find_request_datasets(connection, request, requested_position, alternate, accessible_datasets, access_type)
+    LOG.info(f"Looked up {len(exact)} exact variant(s) together, {len(requests) - len(exact)} request(s) one by one.")
+
+    return [allele_response(request, params[4], parsed[index][0], responses[index]) for index, request in enumerate(requests)]
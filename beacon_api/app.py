@@ -9,11 +9,14 @@ import sys
 import aiohttp_cors
 
 from .api.info import beacon_info, ga4gh_info
-from .api.query import query_request_handler
+from .api.query import batch_request_handler, query_request_handler
 from .conf.config import init_db_pool
-from .schemas import load_schema
+from .utils.catalog import CATALOG
+from .schemas import BATCH_QUERY_LIMIT, load_batch_schema, load_schema
 from .utils.logging import LOG
-from .utils.validate_json import validate, parse_request_object
+from .utils.results import RESULTS
+from .utils.statements import PREPARE_COUNTS, REUSE_COUNTS
+from .utils.validate_json import BatchValidator, validate, parse_request_object
 from .utils.validate_jwt import token_auth
 import uvloop
 import asyncio
@@ -72,18 +75,40 @@ async def beacon_post_query(request: web.Request) -> web.Response:
     return web.json_response(response, content_type="application/json", dumps=ujson.dumps)
 
 
+@routes.post("/query/batch")
+@validate(load_batch_schema(), BatchValidator)
+async def beacon_post_batch_query(request: web.Request) -> web.Response:
+    """Find datasets for many allele requests using POST endpoint."""
+    method, processed_request = await parse_request_object(request)
+    params = request.app["pool"], method, processed_request, request["token"], request.host
+    response = await batch_request_handler(params)
+    return web.json_response(response, content_type="application/json", dumps=ujson.dumps)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+#                                         METRICS END POINT OPERATIONS
+# ----------------------------------------------------------------------------------------------------------------------
+@routes.get("/metrics")
+async def beacon_metrics(request: web.Request) -> web.Response:
+    """Return the hit ratio and size of the query result cache, and how often each statement was prepared and reused."""
+    statements = {"prepared": dict(PREPARE_COUNTS), "reused": dict(REUSE_COUNTS)}
+    return web.json_response({"resultCache": RESULTS.metrics(), "statements": statements})
+
+
 async def initialize(app: web.Application) -> None:
     """Spin up DB a connection pool with the HTTP server."""
     # TO DO check if table and Database exist
     # and maybe exit gracefully or at least wait for a bit
     LOG.debug("Create PostgreSQL connection pool.")
     app["pool"] = await init_db_pool()
+    await CATALOG.listen(app["pool"])
     set_cors(app)
 
 
 async def destroy(app: web.Application) -> None:
     """Upon server close, close the DB connection pool."""
     # will defer this to asyncpg
+    await CATALOG.close(app["pool"])  # pragma: no cover
     await app["pool"].close()  # pragma: no cover
 
 
@@ -109,7 +134,8 @@ def set_cors(server):
 
 async def init() -> web.Application:
     """Initialise server."""
-    beacon = web.Application(middlewares=[token_auth()])
+    # Batch requests are allowed up to 1 KiB per allele request, beyond the 1 MiB default
+    beacon = web.Application(middlewares=[token_auth()], client_max_size=max(1024**2, BATCH_QUERY_LIMIT * 1024))
     beacon.router.add_routes(routes)
     beacon.on_startup.append(initialize)
     beacon.on_cleanup.append(destroy)
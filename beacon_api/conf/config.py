@@ -18,6 +18,8 @@ import os
 import asyncpg
 from typing import Awaitable
 
+from ..utils.statements import STATEMENT_CACHE_SIZE, prepare_statements
+
 DB_SCHEMA = os.environ.get("DATABASE_SCHEMA", None)
 
 
@@ -25,6 +27,7 @@ async def init_db_pool() -> Awaitable:
     """Create a connection pool.
 
     As we will have frequent requests to the database it is recommended to create a connection pool.
+    The registered statements are prepared on every new connection of the pool, see :mod:`beacon_api.utils.statements`.
     """
     return await asyncpg.create_pool(
         host=os.environ.get("DATABASE_URL", "localhost"),
@@ -42,6 +45,8 @@ async def init_db_pool() -> Awaitable:
         max_queries=50000,
         timeout=120,
         command_timeout=180,
+        statement_cache_size=STATEMENT_CACHE_SIZE,
         max_cached_statement_lifetime=0,
         max_inactive_connection_lifetime=180,
+        init=prepare_statements,
     )
@@ -7,8 +7,11 @@ Schemas available:
 * ``info.json`` - for the ``/info`` endpoint response;
 * ``query.json`` - for the ``/query`` endpoint request;
 * ``response.json`` - beacon API JSON response.
+
+The schema of the ``/query/batch`` endpoint request is built from ``query.json`` by :func:`load_batch_schema`.
 """
 
+import os
 import ujson
 from typing import Dict
 from pathlib import Path
@@ -23,3 +26,25 @@ def load_schema(name: str) -> Dict:
         data = fp.read()
 
     return ujson.loads(data)
+
+
+# Most allele requests of one batch request
+BATCH_QUERY_LIMIT = int(os.environ.get("BATCH_QUERY_LIMIT", 10000))
+
+
+def load_batch_schema() -> Dict:
+    """Load the JSON schema of batch requests, a list of allele requests sharing their datasets and responses."""
+    query = load_schema("query")
+    shared = ["datasetIds", "includeDatasetResponses"]
+    allele_request = {key: value for key, value in query.items() if key != "definitions"}
+    allele_request["properties"] = {key: value for key, value in query["properties"].items() if key not in shared}
+    return {
+        "type": "object",
+        "additionalProperties": False,
+        "definitions": query["definitions"],
+        "required": ["requests"],
+        "properties": {
+            "requests": {"type": "array", "minItems": 1, "maxItems": BATCH_QUERY_LIMIT, "items": allele_request},
+            **{key: query["properties"][key] for key in shared},
+        },
+    }
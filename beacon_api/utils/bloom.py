@@ -0,0 +1,119 @@
+"""Bloom Filters of Datasets.
+
+``beacon_init`` builds a Bloom filter of the variants of each dataset on each chromosome, over their
+``start`` and ``alleleHash``, and stores them in ``beacon_bloom_table``. Queries for an exact variant
+(a ``start`` with exact reference and alternate bases) skip the datasets whose filter rules the variant out,
+and do not touch the database at all when every dataset is ruled out.
+
+A filter of ``n`` variants has ``m = -n ln(p) / ln(2)^2`` bits and ``k = m / n ln(2)`` hash functions for a
+false positive rate ``p``, set with ``beacon_init --bloom_fpr``. Chromosomes without variants have an empty filter,
+which rules out every variant. The ``k`` bit positions of a variant are derived by double hashing
+from a 64 bit mix of its start and allele hash.
+
+Filters are loaded by the server when they are first needed, and loaded again after ``BLOOM_FILTER_TTL`` seconds
+(300 by default) or once ``beacon_init`` notifies a change of their dataset, see :mod:`beacon_api.utils.catalog`.
+The filters of a dataset are dropped when it is being loaded, and built again once it has been loaded,
+so that a reloaded dataset is queried in the database until its new filters are loaded.
+"""
+
+import math
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import asyncpg
+import numpy as np
+
+from .logging import LOG
+from .statements import fetch_statement, register
+
+# Default false positive rate of the filters
+FPR = 0.01
+# Seconds a loaded filter is used before it is loaded again
+FILTER_TTL = int(os.environ.get("BLOOM_FILTER_TTL", 300))
+# Filters by dataset and chromosome code, with the time they were loaded, None for datasets without filters
+FILTERS: Dict[Tuple[str, int], Tuple[float, Optional["BloomFilter"]]] = {}
+
+
+def key_hashes(starts: np.ndarray, allele_hashes: np.ndarray) -> np.ndarray:
+    """Mix the starts and allele hashes of variants into 64 bit keys, with the splitmix64 finaliser."""
+    keys = allele_hashes.astype(np.int64).view(np.uint64) ^ (starts.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15))
+    keys ^= keys >> np.uint64(30)
+    keys *= np.uint64(0xBF58476D1CE4E5B9)
+    keys ^= keys >> np.uint64(27)
+    keys *= np.uint64(0x94D049BB133111EB)
+    keys ^= keys >> np.uint64(31)
+    return keys
+
+
+class BloomFilter:
+    """Bloom filter of ``size`` bits with ``hashes`` hash functions, stored little-endian in ``bits``."""
+
+    def __init__(self, size: int, hashes: int, bits: Optional[bytes] = None) -> None:
+        """Create an empty filter, or one of stored ``bits``."""
+        self.size = size
+        self.hashes = hashes
+        self.bits = np.zeros((size + 7) // 8, dtype=np.uint8) if bits is None else np.frombuffer(bits, dtype=np.uint8)
+
+    @classmethod
+    def for_capacity(cls, variants: int, fpr: float = FPR) -> "BloomFilter":
+        """Create an empty filter sized for a number of variants and a false positive rate."""
+        if variants == 0:
+            return cls(0, 0)
+        size = max(8, math.ceil(-variants * math.log(fpr) / math.log(2) ** 2))
+        return cls(size, max(1, round(size / variants * math.log(2))))
+
+    def _positions(self, starts: np.ndarray, allele_hashes: np.ndarray) -> np.ndarray:
+        """Return the bit positions of variants, one row of ``hashes`` positions per variant."""
+        keys = key_hashes(starts, allele_hashes)
+        first, second = keys & np.uint64(0xFFFFFFFF), (keys >> np.uint64(32)) | np.uint64(1)
+        return (first[:, None] + np.arange(self.hashes, dtype=np.uint64) * second[:, None]) % np.uint64(self.size)
+
+    def add(self, starts: np.ndarray, allele_hashes: np.ndarray) -> None:
+        """Add variants to the filter."""
+        positions = self._positions(starts, allele_hashes).ravel()
+        np.bitwise_or.at(self.bits, (positions >> np.uint64(3)).astype(np.int64), np.left_shift(np.uint8(1), (positions & np.uint64(7)).astype(np.uint8)))
+
+    def __contains__(self, variant: Tuple[int, int]) -> bool:
+        """Return False if the filter rules out a variant, given as its start and allele hash."""
+        if self.size == 0:
+            return False
+        positions = self._positions(np.array([variant[0]]), np.array([variant[1]]))[0]
+        return bool(np.all(self.bits[(positions >> np.uint64(3)).astype(np.int64)] & np.left_shift(np.uint8(1), (positions & np.uint64(7)).astype(np.uint8))))
+
+
+register(
+    "bloom_filters",
+    """SELECT datasetId, size, hashes, bits FROM beacon_bloom_table
+       WHERE datasetId = any($1::varchar[]) AND chromosome=$2""",
+)
+
+
+async def fetch_filters(connection, datasets: List[str], chromosome: int) -> Dict[str, Optional[BloomFilter]]:
+    """Return the filters of datasets on a chromosome, loading those not loaded in the last ``FILTER_TTL`` seconds."""
+    now = time.monotonic()
+    missing = [dataset for dataset in datasets if FILTERS.get((dataset, chromosome), (-math.inf, None))[0] < now - FILTER_TTL]
+    if missing:
+        try:
+            # A savepoint keeps the transaction of the request usable on databases without filters
+            async with connection.transaction():
+                records = await fetch_statement(connection, "bloom_filters", missing, chromosome)
+        except asyncpg.UndefinedTableError:
+            LOG.warning("beacon_bloom_table has not been created, variants are queried without Bloom filters.")
+            records = []
+        loaded = {record["datasetid"]: BloomFilter(record["size"], record["hashes"], record["bits"]) for record in records}
+        for dataset in missing:
+            FILTERS[(dataset, chromosome)] = (now, loaded.get(dataset))
+    return {dataset: FILTERS[(dataset, chromosome)][1] for dataset in datasets}
+
+
+async def possible_datasets(connection, datasets: List[str], chromosome: int, start: int, allele_hash: int) -> List[str]:
+    """Return the datasets whose filters do not rule out a variant, datasets without filters are kept."""
+    filters = await fetch_filters(connection, datasets, chromosome)
+    candidates = []
+    for dataset in datasets:
+        bloom = filters[dataset]
+        if bloom is None or (start, allele_hash) in bloom:
+            candidates.append(dataset)
+    LOG.debug(f"Bloom filters ruled out {len(datasets) - len(candidates)} of {len(datasets)} dataset(s).")
+    return candidates
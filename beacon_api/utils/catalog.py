@@ -0,0 +1,146 @@
+"""Dataset Access Catalog.
+
+The access types of the datasets of ``beacon_dataset_table`` are kept in memory by the server, so that queries
+resolve the accessible datasets without a database round trip. ``beacon_dataset_table`` only changes when
+``beacon_init`` loads a dataset, which then notifies the ``CATALOG_CHANNEL`` channel with the id of the dataset.
+
+The server listens to the channel on a connection of its pool: a notification invalidates the catalog, which is
+loaded again by the next query, and drops the Bloom filters, summaries and cached query results of the dataset.
+Should the notifications be missed, e.g. while the listening connection is lost, the catalog is loaded again
+after ``CATALOG_TTL`` seconds (300 by default). A lost listening connection is replaced by another connection
+of the pool, acquired again after ``CATALOG_RETRY`` seconds, doubled after each failure up to ``CATALOG_TTL``.
+"""
+
+import asyncio
+import math
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .bloom import FILTERS
+from .data_query import fetch_datasets_access
+from .logging import LOG
+from .results import RESULTS
+from .summary import SUMMARIES
+
+# Channel notified by beacon_init with the ids of the datasets it loads
+CATALOG_CHANNEL = "beacon_datasets"
+# Seconds the catalog is used without notifications before it is loaded again
+CATALOG_TTL = int(os.environ.get("CATALOG_TTL", 300))
+# Seconds before listening again on another connection when the listening connection is lost
+CATALOG_RETRY = 1
+# Access types of the catalog, in the order of the lists of fetch_datasets_access
+ACCESS_TYPES = ["PUBLIC", "REGISTERED", "CONTROLLED"]
+
+
+class DatasetCatalog:
+    """Access types of the datasets of the beacon, by dataset id."""
+
+    def __init__(self) -> None:
+        """Create an empty catalog, loaded by its first query."""
+        self.access_types: Dict[str, str] = {}
+        self.loaded_at = -math.inf
+        # Incremented by every invalidation, so that a load overtaken by a notification is not kept
+        self.version = 0
+        self._connection = None
+        self._pool = None
+        self._reconnect: Optional[asyncio.Future] = None
+
+    def invalidate(self) -> None:
+        """Load the catalog again on its next query."""
+        self.version += 1
+        self.loaded_at = -math.inf
+
+    async def load(self, connection) -> None:
+        """Load the access types of all datasets."""
+        version = self.version
+        access = await fetch_datasets_access(connection, None)
+        self.access_types = {dataset: access_type for access_type, datasets in zip(ACCESS_TYPES, access) for dataset in datasets}
+        if version == self.version:
+            self.loaded_at = time.monotonic()
+        LOG.info(f"Dataset catalog loaded with {len(self.access_types)} dataset(s).")
+
+    async def access(self, pool, datasets: Optional[List[str]]) -> Tuple[List[str], List[str], List[str]]:
+        """Split datasets into PUBLIC, REGISTERED and CONTROLLED datasets, as :func:`fetch_datasets_access` does.
+
+        All datasets are split if none are given, the catalog is loaded over a connection of ``pool`` if it is out of date.
+        """
+        if self.loaded_at < time.monotonic() - CATALOG_TTL:
+            async with pool.acquire(timeout=180) as connection:
+                await self.load(connection)
+        requested = None if not datasets else set(datasets)
+        split: Dict[str, List[str]] = {access_type: [] for access_type in ACCESS_TYPES}
+        for dataset, access_type in self.access_types.items():
+            if requested is None or dataset in requested:
+                split[access_type].append(dataset)
+        return split["PUBLIC"], split["REGISTERED"], split["CONTROLLED"]
+
+    def notified(self, connection, pid: int, channel: str, payload: str) -> None:
+        """Invalidate the catalog, and the Bloom filters, summaries and cached results of the dataset of a notification."""
+        LOG.info(f"Dataset {payload} has changed, the dataset catalog will be loaded again.")
+        self.invalidate()
+        caches: List[Dict[Tuple[str, int], Any]] = [FILTERS, SUMMARIES]
+        for cache in caches:
+            for key in [key for key in cache if key[0] == payload]:
+                del cache[key]
+        RESULTS.invalidate(payload)
+
+    def disconnected(self, connection) -> None:
+        """Listen again on another connection when the listening connection is lost, notifications may have been missed meanwhile."""
+        if self._connection is not connection or self._pool is None:
+            return
+        LOG.warning(f"Lost the connection listening to {CATALOG_CHANNEL}, listening again on another connection.")
+        self.invalidate()
+        self._connection = None
+        self._reconnect = asyncio.ensure_future(self.reconnect(self._pool, connection))
+
+    async def reconnect(self, pool, lost) -> None:
+        """Give the lost connection back to ``pool``, and listen on another one, with an exponential backoff."""
+        try:
+            await pool.release(lost)
+        except Exception as e:
+            LOG.debug(f"Could not release the lost connection -> {e}")
+        delay = CATALOG_RETRY
+        while self._connection is None:
+            await asyncio.sleep(delay)
+            await self.listen(pool)
+            delay = min(2 * delay, CATALOG_TTL)
+        LOG.info(f"Listening to {CATALOG_CHANNEL} again.")
+
+    async def listen(self, pool) -> None:
+        """Listen to the changes of the datasets on a connection of ``pool``, and load the catalog.
+
+        The server starts without a database as well, the catalog is then loaded by the first query.
+        """
+        self._pool = pool
+        try:
+            connection = await pool.acquire()
+        except Exception as e:
+            LOG.warning(f"Could not listen to {CATALOG_CHANNEL}, the dataset catalog is loaded every {CATALOG_TTL}s -> {e}")
+            return
+        try:
+            await connection.add_listener(CATALOG_CHANNEL, self.notified)
+            connection.add_termination_listener(self.disconnected)
+            self._connection = connection
+            await self.load(connection)
+        except Exception as e:
+            LOG.warning(f"Could not load the dataset catalog on startup -> {e}")
+            if self._connection is None:
+                await pool.release(connection)
+
+    async def close(self, pool) -> None:
+        """Stop listening, and give the listening connection back to ``pool``."""
+        self._pool = None
+        if self._reconnect is not None:
+            self._reconnect.cancel()
+            self._reconnect = None
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            connection.remove_termination_listener(self.disconnected)
+            if not connection.is_closed():
+                await connection.remove_listener(CATALOG_CHANNEL, self.notified)
+            await pool.release(connection)
+
+
+# Catalog of the server
+CATALOG = DatasetCatalog()
@@ -0,0 +1,50 @@
+"""Chromosome and Variant Type Codes.
+
+``beacon_data_table`` stores chromosomes and variant types as ``smallint`` codes: the position of their
+name in ``CHROMOSOMES`` and ``VARIANT_TYPES``, counting from 1 as ``array_position()`` does in PostgreSQL.
+Names are encoded by the loader and in the variant queries, and decoded in the responses.
+New names are only ever appended, so that the codes of stored variants keep their meaning.
+Variant types without a code, such as the ``DEL:ME:ALU`` and ``LINE1`` types of 1000 Genomes, are stored
+with the code of their longest prefix of ``:`` separated parts that has one, otherwise with that of ``UNKNOWN``.
+"""
+
+from typing import Dict, List, Optional
+
+# Chromosomes of the Beacon API, variants on other contigs are not loaded
+CHROMOSOMES = [str(number) for number in range(1, 23)] + ["X", "Y", "MT"]
+# Variant types of the Beacon API, followed by the other types the loader reads from VCF records
+VARIANT_TYPES = ["DEL", "INS", "DUP", "INV", "CNV", "SNP", "MNP", "DUP:TANDEM", "DEL:ME", "INS:ME", "BND", "INDEL", "SV", "UNKNOWN"]
+
+CHROMOSOME_CODES: Dict[str, int] = {name: code for code, name in enumerate(CHROMOSOMES, 1)}
+VARIANT_TYPE_CODES: Dict[str, int] = {name: code for code, name in enumerate(VARIANT_TYPES, 1)}
+
+
+def decode(names: List[str], code: Optional[int]) -> Optional[str]:
+    """Return the name of a code, or None for a missing code."""
+    return None if code is None else names[code - 1]
+
+
+def encode_sql(names: List[str], column: str) -> str:
+    """Construct the SQL expression encoding the names in a text column, NULL for names without a code."""
+    array = ", ".join(f"'{name}'" for name in names)
+    return f"array_position(ARRAY[{array}], {column}::text)::smallint"
+
+
+def variant_type_code(name: Optional[str]) -> Optional[int]:
+    """Return the code of a variant type, of its longest prefix with a code or of ``UNKNOWN``, None for a missing type."""
+    if name is None:
+        return None
+    parts = name.split(":")
+    for end in range(len(parts), 0, -1):
+        code = VARIANT_TYPE_CODES.get(":".join(parts[:end]))
+        if code is not None:
+            return code
+    return VARIANT_TYPE_CODES["UNKNOWN"]
+
+
+def encode_variant_type_sql(column: str) -> str:
+    """Construct the SQL expression encoding the variant types in a text column as :func:`variant_type_code` does."""
+    cases = " ".join(
+        f"WHEN {column} = '{name}' OR {column} LIKE '{name}:%' THEN {VARIANT_TYPE_CODES[name]}" for name in sorted(VARIANT_TYPES, key=len, reverse=True)
+    )
+    return f"(CASE WHEN {column} IS NULL THEN NULL {cases} ELSE {VARIANT_TYPE_CODES['UNKNOWN']} END)::smallint"
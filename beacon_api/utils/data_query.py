@@ -1,19 +1,35 @@
 """Query DB and prepare data for response."""
 
+import hashlib
 from datetime import datetime
-from functools import partial
 from typing import Dict, List, Optional
 
 from typing import Tuple
+from .bloom import possible_datasets
+from .codes import CHROMOSOMES, CHROMOSOME_CODES, VARIANT_TYPES, VARIANT_TYPE_CODES, decode
 from .logging import LOG
+from .statements import STATEMENTS, fetch_statement, register
+from .summary import prune_datasets
 from ..api.exceptions import BeaconServerError
 from ..extensions.handover import add_handover
 from .. import __handover_drs__
 
 
+def decode_names(response: Dict) -> Dict:
+    """Decode the chromosome and variant type codes of a variant of ``beacon_data_table``.
+
+    Variants of ``beacon_mate_table`` keep their names, and are returned as they are.
+    """
+    if isinstance(response.get("referenceName"), int):
+        response["referenceName"] = decode(CHROMOSOMES, response["referenceName"])
+    if isinstance(response.get("variantType"), int):
+        response["variantType"] = decode(VARIANT_TYPES, response["variantType"])
+    return response
+
+
 def transform_record(record) -> Dict:
     """Format the record we got from the database to adhere to the response schema."""
-    response = dict(record)
+    response = decode_names(dict(record))
     response["referenceBases"] = response.pop("referenceBases")  # NOT part of beacon specification
     response["alternateBases"] = response.pop("alternateBases")  # NOT part of beacon specification
     response["variantType"] = response.pop("variantType")  # NOT part of beacon specification
@@ -32,7 +48,7 @@ def transform_record(record) -> Dict:
 
 def transform_misses(record) -> Dict:
     """Format the missed datasets record we got from the database to adhere to the response schema."""
-    response = dict(record)
+    response = decode_names(dict(record))
     response["referenceBases"] = ""  # NOT part of beacon specification
     response["alternateBases"] = ""  # NOT part of beacon specification
     response["variantType"] = ""  # NOT part of beacon specification
@@ -63,30 +79,47 @@ def transform_metadata(record) -> Dict:
     return response
 
 
-async def fetch_datasets_access(db_pool, datasets: Optional[List]):
+register(
+    "datasets_access",
+    """SELECT accessType, datasetId FROM beacon_dataset_table
+       WHERE coalesce(datasetId = any($1::varchar[]), true);
+       """,
+)
+
+
+async def fetch_datasets_access(connection, datasets: Optional[List]):
     """Retrieve CONTROLLED datasets."""
     public = []
     registered = []
     controlled = []
-    async with db_pool.acquire(timeout=180) as connection:
-        async with connection.transaction():
-            datasets_query = None if not datasets else datasets
-            try:
-                query = """SELECT accessType, datasetId FROM beacon_dataset_table
-                           WHERE coalesce(datasetId = any($1::varchar[]), true);
-                           """
-                statement = await connection.prepare(query)
-                db_response = await statement.fetch(datasets_query)
-                for record in list(db_response):
-                    if record["accesstype"] == "PUBLIC":
-                        public.append(record["datasetid"])
-                    if record["accesstype"] == "REGISTERED":
-                        registered.append(record["datasetid"])
-                    if record["accesstype"] == "CONTROLLED":
-                        controlled.append(record["datasetid"])
-                return public, registered, controlled
-            except Exception as e:
-                raise BeaconServerError(f"Query available datasets DB error: {e}")
+    datasets_query = None if not datasets else datasets
+    try:
+        db_response = await fetch_statement(connection, "datasets_access", datasets_query)
+        for record in list(db_response):
+            if record["accesstype"] == "PUBLIC":
+                public.append(record["datasetid"])
+            if record["accesstype"] == "REGISTERED":
+                registered.append(record["datasetid"])
+            if record["accesstype"] == "CONTROLLED":
+                controlled.append(record["datasetid"])
+        return public, registered, controlled
+    except Exception as e:
+        raise BeaconServerError(f"Query available datasets DB error: {e}")
+
+
+register(
+    "dataset_metadata",
+    """SELECT datasetId as "id", name as "name", accessType as "accessType",
+       externalUrl as "externalUrl", description as "description",
+       assemblyId as "assemblyId", variantCount as "variantCount",
+       callCount as "callCount", sampleCount as "sampleCount",
+       version as "version", createDateTime as "createDateTime",
+       updateDateTime as "updateDateTime"
+       FROM dataset_metadata WHERE
+       coalesce(datasetId = any($1::varchar[]), true)
+       AND coalesce(accessType = any($2::access_levels[]), true);
+       """,
+)
 
 
 async def fetch_dataset_metadata(db_pool, datasets=None, access_type=None):
@@ -102,18 +135,7 @@ async def fetch_dataset_metadata(db_pool, datasets=None, access_type=None):
             datasets_query = None if not datasets else datasets
             access_query = None if not access_type else access_type
             try:
-                query = """SELECT datasetId as "id", name as "name", accessType as "accessType",
-                           externalUrl as "externalUrl", description as "description",
-                           assemblyId as "assemblyId", variantCount as "variantCount",
-                           callCount as "callCount", sampleCount as "sampleCount",
-                           version as "version", createDateTime as "createDateTime",
-                           updateDateTime as "updateDateTime"
-                           FROM dataset_metadata WHERE
-                           coalesce(datasetId = any($1::varchar[]), true)
-                           AND coalesce(accessType = any($2::access_levels[]), true);
-                           """
-                statement = await connection.prepare(query)
-                db_response = await statement.fetch(datasets_query, access_query)
+                db_response = await fetch_statement(connection, "dataset_metadata", datasets_query, access_query)
                 metadata = []
                 LOG.info(f"Query for dataset(s): {datasets} metadata that are {access_type}.")
                 for record in list(db_response):
@@ -124,105 +146,229 @@ async def fetch_dataset_metadata(db_pool, datasets=None, access_type=None):
 
 
 def handle_wildcard(sequence) -> List:
-    """Construct PostgreSQL friendly wildcard string."""
+    """Construct PostgreSQL friendly wildcard string.
+
+    Every ``N`` stands for one base, the pattern is anchored to the whole allele.
+    """
     if "N" in sequence:
         # Wildcard(s) found, use wildcard notation
-        return [f"%{sequence.replace('N', '_')}%"]
+        return [sequence.replace("N", "_")]
     else:
         # No wildcard(s) found, use standard notation
         return [sequence]
 
 
-async def fetch_filtered_dataset(db_pool, assembly_id, position, chromosome, reference, alternate, datasets=None, access_type=None, misses=False):
-    """Execute filter datasets.
+def allele_hash(reference: str, alternate: str) -> int:
+    """Compute the ``alleleHash`` of a variant, the first 64 bits of the md5 digest of its alleles as a signed integer."""
+    return int.from_bytes(hashlib.md5(f"{reference}>{alternate}".encode(), usedforsecurity=False).digest()[:8], "big", signed=True)
 
-    There is an Uber query that aims to be all inclusive.
+
+# Fields of the records of datasets without matching variants
+MISS_FIELDS = ["datasetId", "accessType", "referenceName", "exists"]
+
+
+def misses_query(columns: int, reference_name: str, include: str) -> str:
+    """Construct the part of a query returning one row per accessible dataset without hits.
+
+    The hit query is expected as a ``hits`` CTE of ``columns`` columns, ending with ``exists``.
+    Misses are only returned if the boolean parameter ``include`` is true.
+    Parameters $1, $2 and $3 are the dataset ids, access levels and assembly id as in the hit queries.
     """
-    # Take one connection from the database pool
-    async with db_pool.acquire(timeout=180) as connection:
-        # Start a new session with the connection
-        async with connection.transaction():
-            # Fetch dataset metadata according to user request
-            datasets_query = None if not datasets else datasets
-            access_query = None if not access_type else access_type
+    nulls = ", ".join(["NULL"] * (columns - len(MISS_FIELDS)))
+    # Only NULLs and the parameter references of the caller are interpolated
+    return f"""
+            UNION ALL
+            SELECT DISTINCT ON (datasetId)
+            datasetId as "datasetId", accessType as "accessType", {reference_name} as "referenceName",
+            {nulls}, False as "exists"
+            FROM beacon_dataset_table b
+            WHERE {include}::boolean
+            AND coalesce(accessType = any($2::access_levels[]), true)
+            AND assemblyId=$3
+            AND coalesce(datasetId = any($1::varchar[]), false)
+            AND NOT EXISTS (SELECT 1 FROM hits h WHERE h."datasetId"=b.datasetId)
+            """  # nosec B608
+
+
+def transform_rows(db_response) -> List[Dict]:
+    """Format hit and miss records, labelled by ``exists``, to adhere to the response schema."""
+    datasets = []
+    for record in list(db_response):
+        if record["exists"]:
+            processed = transform_record(record)
+        else:
+            processed = transform_misses({key: record[key] for key in MISS_FIELDS})
+        if __handover_drs__:
+            # If handover feature is enabled, add handover object to response
+            processed = add_handover(processed)
+        datasets.append(processed)
+    return datasets
+
+
+# Optional parameters of a variant query, by the predicate on the variant they stand for
+CONDITIONS = {
+    "start": "a.start={}",
+    "end": "a.end={}",
+    "startMax": "a.start<={}",
+    "startMin": "a.start>={}",
+    "endMin": "a.end>={}",
+    "endMax": "a.end<={}",
+    "variantType": "a.variantType={}",
+    "alleleHash": "a.alleleHash={}",
+    "alternate": "a.alternate LIKE any({}::varchar[])",
+    "reference": "a.reference LIKE any({}::varchar[])",
+}
+
+
+def shape_conditions(shape: Tuple[str, ...]) -> str:
+    """Construct the conditions on the variants of a shape, compared to parameters $5 onwards in its order."""
+    return "".join(f"\n           AND {CONDITIONS[name].format(f'${index}')}" for index, name in enumerate(shape, 5))
+
+
+def variants_query(shape: Tuple[str, ...]) -> str:
+    """Construct the variant query for a shape, the names of the optional parameters given in a request.
+
+    Only the conditions of the shape are compared, so that PostgreSQL can plan the position and allele indexes
+    for them, in the generic plan of the prepared statement as well. Exact alleles are looked up by ``alleleHash``,
+    the alleles are then only compared on the variants with their hash.
+    Parameters $1 to $4 are the dataset ids, access levels, assembly id and chromosome,
+    followed by the parameters of the shape in its order and the misses flag.
+    """
+    # referenceBases, alternateBases and variantType fields are NOT part of beacon's specification response
+    # Conditions are taken from CONDITIONS by name and compare parameters, values are never interpolated
+    conditions = shape_conditions(shape)
+    return f"""WITH hits AS (
+           SELECT a.datasetId as "datasetId", b.accessType as "accessType", a.chromosome as "referenceName",
+           a.reference as "referenceBases", a.alternate as "alternateBases", a.start as "start", a.end as "end",
+           b.externalUrl as "externalUrl", b.description as "note",
+           a.alleleCount as "variantCount", a.variantType as "variantType",
+           a.callCount as "callCount", b.sampleCount as "sampleCount",
+           a.frequency, True as "exists"
+           FROM beacon_data_table a, beacon_dataset_table b
+           WHERE a.datasetId=b.datasetId
+           AND b.assemblyId=$3{conditions}
+           AND a.chromosome=$4
+           AND coalesce(b.accessType = any($2::access_levels[]), true)
+           AND a.datasetId = any($1::varchar[]))
+           SELECT * FROM hits
+           {misses_query(15, "$4", f"${5 + len(shape)}")}"""  # nosec B608
+
+
+def exists_query(shape: Tuple[str, ...]) -> str:
+    """Construct the query of the datasets with a variant of a shape, without fetching their variants.
+
+    Each dataset is probed by an ``EXISTS`` subquery, which stops at its first matching variant.
+    Parameters are those of :func:`variants_query`, with the most datasets to return, NULL for all, instead of the misses flag.
+    """
+    # As in variants_query only the conditions of the shape and parameter numbers are interpolated
+    return f"""SELECT d.datasetId as "datasetId"
+           FROM unnest($1::varchar[]) d(datasetId)
+           WHERE EXISTS (
+           SELECT 1 FROM beacon_data_table a, beacon_dataset_table b
+           WHERE a.datasetId=d.datasetId
+           AND b.datasetId=d.datasetId
+           AND b.assemblyId=$3{shape_conditions(shape)}
+           AND a.chromosome=$4
+           AND coalesce(b.accessType = any($2::access_levels[]), true))
+           LIMIT ${5 + len(shape)}"""  # nosec B608
+
+
+def variants_statement(shape: Tuple[str, ...], exists_only: bool = False) -> str:
+    """Return the name of the registered variant statement of a shape, registering it on first use.
+
+    With ``exists_only``, the statement of :func:`exists_query` is returned instead.
+    """
+    name = f"{'exists' if exists_only else 'variants'}:{','.join(shape)}"
+    if name not in STATEMENTS:
+        register(name, exists_query(shape) if exists_only else variants_query(shape))
+    return name
 
-            start_pos = None if position[0] is None or (position[2] and position[3]) else position[0]
-            end_pos = None if position[1] is None or (position[4] and position[5]) else position[1]
-            startMax_pos = position[3]
-            startMin_pos = position[2]
-            endMin_pos = position[4]
-            endMax_pos = position[5]
 
-            variant = None if not alternate[0] else alternate[0]
-            altbase = None if not alternate[1] else handle_wildcard(alternate[1])
-            refbase = None if not reference else handle_wildcard(reference)
-            try:
-                if misses:
-                    # For MISS and ALL. We have already found all datasets with matching variants,
-                    # so now just get one post per accessible, remaining datasets.
-                    query = """SELECT DISTINCT ON (datasetId)
-                               datasetId as "datasetId", accessType as "accessType",
-                               $4 as "referenceName", False as "exists"
-                               FROM beacon_dataset_table
-                               WHERE coalesce(accessType = any($2::access_levels[]), true)
-                               AND assemblyId=$3
-                               AND coalesce(datasetId = any($1::varchar[]), false);
-                               """
-                    statement = await connection.prepare(query)
-                    db_response = await statement.fetch(datasets_query, access_query, assembly_id, chromosome)
-
-                else:
-                    # UBER QUERY - TBD if it is what we need
-                    # referenceBases, alternateBases and variantType fields are NOT part of beacon's specification response
-                    query = """SELECT a.datasetId as "datasetId", b.accessType as "accessType", a.chromosome as "referenceName",
-                               a.reference as "referenceBases", a.alternate as "alternateBases", a.start as "start", a.end as "end",
-                               b.externalUrl as "externalUrl", b.description as "note",
-                               a.alleleCount as "variantCount", a.variantType as "variantType",
-                               a.callCount as "callCount", b.sampleCount as "sampleCount",
-                               a.frequency, True as "exists"
-                               FROM beacon_data_table a, beacon_dataset_table b
-                               WHERE a.datasetId=b.datasetId
-                               AND b.assemblyId=$3
-                               AND ($8::integer IS NULL OR a.start=$8)
-                               AND ($9::integer IS NULL OR a.end=$9)
-                               AND ($10::integer IS NULL OR a.start<=$10) AND ($11::integer IS NULL OR a.start>=$11)
-                               AND ($12::integer IS NULL OR a.end>=$12) AND ($13::integer IS NULL OR a.end<=$13)
-                               AND coalesce(a.reference LIKE any($7::varchar[]), true)
-                               AND coalesce(a.variantType=$5, true)
-                               AND coalesce(a.alternate LIKE any($6::varchar[]), true)
-                               AND a.chromosome=$4
-                               AND coalesce(b.accessType = any($2::access_levels[]), true)
-                               AND coalesce(a.datasetId = any($1::varchar[]), false);
-                               """
-
-                    statement = await connection.prepare(query)
-                    db_response = await statement.fetch(
-                        datasets_query,
-                        access_query,
-                        assembly_id,
-                        chromosome,
-                        variant,
-                        altbase,
-                        refbase,
-                        start_pos,
-                        end_pos,
-                        startMax_pos,
-                        startMin_pos,
-                        endMin_pos,
-                        endMax_pos,
-                    )
-
-                LOG.info(f"Query for dataset(s): {datasets} that are {access_type} matching conditions.")
-                datasets = []
-                for record in list(db_response):
-                    processed = transform_misses(record) if misses else transform_record(record)
-                    if __handover_drs__:
-                        # If handover feature is enabled, add handover object to response
-                        processed = add_handover(processed)
-                    datasets.append(processed)
-                return datasets
-            except Exception as e:
-                raise BeaconServerError(f"Query dataset DB error: {e}")
+# Shapes of the queries of the Beacon API, prepared on every connection: no position, exact start, start and end,
+# start range and bracketed start and end ranges, with reference bases and either exact alternate bases,
+# alternate bases with wildcards or a variant type
+for positions in [(), ("start",), ("start", "end"), ("startMax", "startMin"), ("startMax", "startMin", "endMin", "endMax")]:
+    for alleles in [("alleleHash", "alternate", "reference"), ("alternate", "reference"), ("variantType", "reference")]:
+        variants_statement(positions + alleles)
+        variants_statement(positions + alleles, exists_only=True)
+
+
+async def fetch_filtered_dataset(
+    connection, assembly_id, position, chromosome, reference, alternate, datasets=None, access_type=None, misses=False, exists_only=False
+):
+    """Execute filter datasets.
+
+    The query is specialised to the positions and alleles given, see :func:`variants_query`,
+    the chromosome and variant type are compared by their codes.
+    With ``misses``, accessible datasets without matching variants are returned by the same query.
+    With ``exists_only``, only the ids of datasets with matching variants are returned, as hits without their variants,
+    see :func:`exists_query`: the first of them, or all of them when the handover of the beacon lists them.
+    Datasets whose summary rules out the query are not queried, and returned as misses, see :mod:`beacon_api.utils.summary`.
+    Otherwise datasets whose Bloom filters rule out an exact variant are not queried, see :mod:`beacon_api.utils.bloom`.
+    """
+    # Fetch dataset metadata according to user request
+    datasets_query = None if not datasets else datasets
+    access_query = None if not access_type else access_type
+    exact = reference and alternate[1] and "N" not in reference + alternate[1]
+
+    parameters = {
+        "start": None if position[0] is None or (position[2] and position[3]) else position[0],
+        "end": None if position[1] is None or (position[4] and position[5]) else position[1],
+        "startMax": position[3],
+        "startMin": position[2],
+        "endMin": position[4],
+        "endMax": position[5],
+        "variantType": None if not alternate[0] else VARIANT_TYPE_CODES[alternate[0]],
+        "alleleHash": allele_hash(reference, alternate[1]) if exact else None,
+        "alternate": None if not alternate[1] else handle_wildcard(alternate[1]),
+        "reference": None if not reference else handle_wildcard(reference),
+    }
+    shape = tuple(name for name, value in parameters.items() if value is not None)
+    chromosome_code = CHROMOSOME_CODES.get(chromosome)
+
+    try:
+        pruned = {}
+        if datasets_query and chromosome_code:
+            datasets_query, pruned = await prune_datasets(connection, datasets_query, chromosome_code, assembly_id, parameters)
+        # Misses of the pruned datasets, the other misses are found by the query
+        pruned_misses = [
+            {"datasetId": dataset, "accessType": summary.access_type, "referenceName": chromosome_code, "exists": False}
+            for dataset, summary in pruned.items()
+            if misses and summary.assembly_id == assembly_id and (access_query is None or summary.access_type in access_query)
+        ]
+        if datasets_query and not misses and chromosome_code and "start" in shape and "alleleHash" in shape:
+            datasets_query = await possible_datasets(connection, datasets_query, chromosome_code, parameters["start"], parameters["alleleHash"])
+        if datasets and not datasets_query:
+            LOG.info(f"Query for dataset(s): {datasets} ruled out by their summaries and Bloom filters.")
+            return transform_rows(pruned_misses)
+        if exists_only:
+            db_response = await fetch_statement(
+                connection,
+                variants_statement(shape, exists_only=True),
+                datasets_query,
+                access_query,
+                assembly_id,
+                chromosome_code,
+                *[parameters[name] for name in shape],
+                None if __handover_drs__ else 1,
+            )
+            LOG.info(f"Query for dataset(s): {datasets} that are {access_type} with matching variants.")
+            return [{"datasetId": record["datasetId"], "exists": True} for record in db_response]
+        db_response = await fetch_statement(
+            connection,
+            variants_statement(shape),
+            datasets_query,
+            access_query,
+            assembly_id,
+            chromosome_code,
+            *[parameters[name] for name in shape],
+            misses,
+        )
+
+        LOG.info(f"Query for dataset(s): {datasets} that are {access_type} matching conditions.")
+        return transform_rows(list(db_response) + pruned_misses)
+    except Exception as e:
+        raise BeaconServerError(f"Query dataset DB error: {e}")
 
 
 def filter_exists(include_dataset: str, datasets: List) -> List[str]:
@@ -244,7 +390,7 @@ def filter_exists(include_dataset: str, datasets: List) -> List[str]:
 
 
 async def find_datasets(
-    db_pool,
+    connection,
     assembly_id: str,
     position: Tuple[Optional[int], ...],
     chromosome: str,
@@ -257,15 +403,94 @@ async def find_datasets(
     """Find datasets based on filter parameters.
 
     This also takes into consideration the token value as to establish permissions.
+    Datasets without hits are only queried, in the same statement, for ALL and MISS.
+    Only whether datasets have hits is queried for NONE, whose response has no datasets.
     """
-    hit_datasets = []
-    miss_datasets = []
-    response = []
-    fetch_call = partial(fetch_filtered_dataset, db_pool, assembly_id, position, chromosome, reference, alternate)
-    hit_datasets = await fetch_call(dataset_ids, access_type)
-    if include_dataset in ["ALL", "MISS"]:
-        accessible_missing = set(dataset_ids).difference([item["datasetId"] for item in hit_datasets])
-        miss_datasets = await fetch_call(accessible_missing, access_type, misses=True)
-
-    response = hit_datasets + miss_datasets
-    return response
+    return await fetch_filtered_dataset(
+        connection,
+        assembly_id,
+        position,
+        chromosome,
+        reference,
+        alternate,
+        dataset_ids,
+        access_type,
+        misses=include_dataset in ["ALL", "MISS"],
+        exists_only=include_dataset == "NONE",
+    )
+
+
+register(
+    "exact_variants",
+    """WITH variants AS (
+           SELECT * FROM unnest($3::integer[], $4::varchar[], $5::smallint[], $6::integer[], $7::bigint[], $8::varchar[], $9::varchar[])
+           AS v(request, assemblyId, chromosome, start, alleleHash, reference, alternate)),
+       hits AS (
+           SELECT v.request, a.datasetId as "datasetId", b.accessType as "accessType", a.chromosome as "referenceName",
+           a.reference as "referenceBases", a.alternate as "alternateBases", a.start as "start", a.end as "end",
+           b.externalUrl as "externalUrl", b.description as "note",
+           a.alleleCount as "variantCount", a.variantType as "variantType",
+           a.callCount as "callCount", b.sampleCount as "sampleCount",
+           a.frequency, True as "exists"
+           FROM variants v, beacon_data_table a, beacon_dataset_table b
+           WHERE a.datasetId=b.datasetId
+           AND b.assemblyId=v.assemblyId
+           AND a.chromosome=v.chromosome
+           AND a.start=v.start
+           AND a.alleleHash=v.alleleHash
+           AND a.reference=v.reference
+           AND a.alternate=v.alternate
+           AND coalesce(b.accessType = any($2::access_levels[]), true)
+           AND a.datasetId = any($1::varchar[]))
+       SELECT * FROM hits
+       UNION ALL
+       SELECT DISTINCT ON (v.request, b.datasetId)
+       v.request, b.datasetId as "datasetId", b.accessType as "accessType", v.chromosome as "referenceName",
+       NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL, False as "exists"
+       FROM variants v, beacon_dataset_table b
+       WHERE $10::boolean
+       AND coalesce(b.accessType = any($2::access_levels[]), true)
+       AND b.assemblyId=v.assemblyId
+       AND coalesce(b.datasetId = any($1::varchar[]), false)
+       AND NOT EXISTS (SELECT 1 FROM hits h WHERE h.request=v.request AND h."datasetId"=b.datasetId)
+       """,
+)
+
+
+async def find_exact_variants(
+    connection,
+    variants: List[Tuple[str, str, int, str, str]],
+    dataset_ids: List[str],
+    access_type: List,
+    include_dataset: str,
+) -> List[List[Dict]]:
+    """Find datasets for many exact variants with one query, each given by assembly, chromosome, start and alleles.
+
+    The variants are unnested into rows joined with ``beacon_data_table`` by chromosome, start and ``alleleHash``,
+    their alleles must not have wildcards. The responses of the datasets are returned by variant, in order.
+    Datasets without hits are only queried, in the same statement, for ALL and MISS.
+    """
+    datasets_query = None if not dataset_ids else dataset_ids
+    access_query = None if not access_type else access_type
+    responses: List[List] = [[] for _ in variants]
+    try:
+        db_response = await fetch_statement(
+            connection,
+            "exact_variants",
+            datasets_query,
+            access_query,
+            list(range(len(variants))),
+            [variant[0] for variant in variants],
+            [CHROMOSOME_CODES.get(variant[1]) for variant in variants],
+            [variant[2] for variant in variants],
+            [allele_hash(variant[3], variant[4]) for variant in variants],
+            [variant[3] for variant in variants],
+            [variant[4] for variant in variants],
+            include_dataset in ["ALL", "MISS"],
+        )
+    except Exception as e:
+        raise BeaconServerError(f"Query dataset DB error: {e}")
+    for record in db_response:
+        responses[record["request"]].append({key: value for key, value in record.items() if key != "request"})
+    LOG.info(f"Query for {len(variants)} variant(s) in dataset(s): {dataset_ids} that are {access_type}.")
+    return [transform_rows(records) for records in responses]
@@ -1,461 +1,1464 @@
-"""Beacon Database Loader.
-
-This utility script is used to parse VCF files into a PostgreSQL database.
-See :ref:`database` table ``beacon_data_table`` for what information is extracted from the VCF file.
-
-Datafiles ``*.vcf`` are denoted as ``datafile`` in the script parameters.
-Metadata for a datafile is given in a ``*.json`` file, denoted as ``metafile`` in the script parameters.
-
-.. note:: Future releases are expected to drop the additional ``metafile``
-        parameter in favour of simplifying the database loading process,
-        reading metadata from the datafile(s) directly.
-
-
-Environment Setup
------------------
-
-Location of the table creation script can be changed with the ``TABLES_SCHEMA`` environment variable.
-
-+---------------------+------------------------+---------------------------------------------------+
-| ENV                 | Default                | Description                                       |
-+---------------------+------------------------+---------------------------------------------------+
-| `TABLES_SCHEMA`     | `data/init.sql`        | Database tables schema for metadata and variants. |
-+---------------------+------------------------+---------------------------------------------------+
-
-Run Module
-----------
-
-Below are the two ways of running this module (pip installed and uninstalled).
-
-.. code-block:: console
-
-    $ beacon_init [datafile] [metafile]
-    $ python -m beacon_api.utils.db_load [datafile] [metafile]
-
-
-.. note:: This script has been tested with VCF specification v4.2.
-"""
-
-import os
-import sys
-import argparse
-import ujson
-import itertools
-import re
-
-import asyncio
-import asyncpg
-from cyvcf2 import VCF
-
-from pathlib import Path
-from datetime import datetime
-
-from .logging import LOG
-
-
-class BeaconDB:
-    """Database connection and operations."""
-
-    def __init__(self) -> None:
-        """Start database routines."""
-        LOG.info("Start database routines")
-        self._conn = None
-
-    def _alt_length_check(self, variant, i, default):
-        """Figure out if the Alternate base is longer than the Reference base."""
-        if len(variant.ALT[i]) > len(variant.REF):
-            return "INS"
-        elif len(variant.ALT[i]) == len(variant.REF):
-            return default
-        else:
-            return "DEL"
-
-    def _transform_vt(self, vt, variant, i):
-        """Transform variant types."""
-        if vt in ["s", "snp"]:
-            return self._alt_length_check(variant, i, "SNP")
-        elif vt in ["m", "mnp"]:
-            return self._alt_length_check(variant, i, "MNP")
-        elif vt in ["i", "indel"]:
-            return self._alt_length_check(variant, i, "SNP")
-        else:
-            return variant.var_type.upper()
-
-    def _handle_type(self, value, type):
-        """Determine if values are in a tuple and also convert them to specific type."""
-        ar = []
-        if isinstance(value, tuple):
-            ar = [type(i) for i in value]
-        elif isinstance(value, type):
-            ar = [type(value)]
-
-        return ar
-
-    def _bnd_parts(self, alt, mate):
-        """Retrieve BND SV type parts.
-
-        We retrieve more than needed
-        """
-        # REF ALT  Meaning
-        # s   t[p[ piece extending to the right of p is joined after t
-        # s   t]p] reverse comp piece extending left of p is joined after t
-        # s   ]p]t piece extending to the left of p is joined before t
-        # s   [p[t reverse comp piece extending right of p is joined before t
-        # where p is chr:pos
-        patt = re.compile("[\\[\\]]")
-        mate_items = patt.split(alt)
-        remoteCoords = mate_items[1].split(":")
-        chr = remoteCoords[0].lower()
-        if chr[0] == "<":
-            chr = chr[1:-1]
-            withinMainAssembly = False
-        else:
-            withinMainAssembly = True
-        pos = int(remoteCoords[1])
-        orientation = alt[0] == "[" or alt[0] == "]"
-        remoteOrientation = re.search("\\[", alt) is not None
-        if orientation:
-            connectingSequence = mate_items[2]
-        else:
-            connectingSequence = mate_items[0]
-
-        return (chr, pos, orientation, remoteOrientation, connectingSequence, withinMainAssembly, mate)
-
-    def _rchop(self, thestring, ending):
-        """Chop SV type if any SV is in the ``me_type`` list.
-
-        The ``SV=LINE1`` is not supported, thus we meed to used the ALT base
-        ``INS:ME:LINE1`` but removing the ``:LINE1`` from the end.
-
-        .. warning:: This data transformation might only be valid for 1000genome.
-        """
-        if thestring.endswith(ending):
-            return thestring[: -len(ending)]
-        return thestring
-
-    def _unpack(self, variant):
-        """Unpack variant type, allele frequency and count.
-
-        This is quite a complicated parser, but it is custom made to address some of
-        expectations regarding the data to be delivered by the beacon API.
-
-        .. warning:: By no means this is exahustive in processing of VCF Records.
-        """
-        aaf = []
-        ac = []
-        vt = []
-        bnd = []
-        alt = variant.ALT
-        me_type = ["dup:tandem", "del:me", "ins:me"]
-
-        ac = self._handle_type(variant.INFO.get("AC"), int) if variant.INFO.get("AC") else []
-        an = variant.INFO.get("AN") if variant.INFO.get("AN") else variant.num_called * 2
-        if variant.INFO.get("AF"):
-            aaf = self._handle_type(variant.INFO.get("AF"), float)
-        else:
-            aaf = [float(ac_value) / float(an) for ac_value in ac]
-
-        if variant.is_sv:
-            alt = [elem.strip("<>") for elem in variant.ALT]
-            if variant.INFO.get("SVTYPE"):
-                v = variant.INFO.get("SVTYPE")
-                if v == "BND":
-                    bnd = [self._bnd_parts(e, variant.INFO.get("MATEID")) for e in alt]
-                    vt = ["BND" for e in alt]
-                else:
-                    vt = [self._rchop(e, ":" + v) if e.lower().startswith(tuple(me_type)) else v for e in alt]
-        else:
-            if variant.INFO.get("VT"):
-                v = variant.INFO.get("VT").split(",")
-                if len(alt) > len(v):
-                    vt_temp = [[self._transform_vt(var_type.lower(), variant, i) for i, k in enumerate(alt)] for var_type in v]
-                    vt = vt_temp[0]
-                else:
-                    vt = [self._transform_vt(var_type.lower(), variant, i) for i, var_type in enumerate(v)]
-
-        return (aaf, ac, vt, alt, an, bnd)
-
-    async def connection(self):
-        """Connect to the database."""
-        LOG.info("Establish a connection to database")
-        try:
-            self._conn = await asyncpg.connect(
-                host=os.environ.get("DATABASE_URL", "localhost"),
-                port=os.environ.get("DATABASE_PORT", "5432"),
-                user=os.environ.get("DATABASE_USER", "beacon"),
-                password=os.environ.get("DATABASE_PASSWORD", "beacon"),
-                database=os.environ.get("DATABASE_NAME", "beacondb"),
-            )
-            LOG.info("Database connection has been established")
-        except Exception as e:
-            LOG.error(f"AN ERROR OCCURRED WHILE ATTEMPTING TO CONNECT TO DATABASE -> {e}")
-
-    async def check_tables(self, desired_tables):
-        """Check that correct tables exist in the database."""
-        LOG.info("Request tables from database")
-        found_tables = []
-        tables = await self._conn.fetch(
-            """SELECT table_name
-                                        FROM information_schema.tables
-                                        WHERE table_schema='public'
-                                        AND table_type='BASE TABLE';"""
-        )
-        LOG.info("Tables received -> check that correct tables exist")
-        for table in list(tables):
-            found_tables.append(dict(table)["table_name"])
-        missing_tables = list(set(desired_tables) - set(found_tables))
-        for table in found_tables:
-            LOG.info(f"{table} exists")
-        for table in missing_tables:
-            LOG.error(f"{table} is missing!")
-        return missing_tables
-
-    async def create_tables(self, sql_file):
-        """Create tables to database according to given schema."""
-        LOG.info(f"Create tables to database according to given schema in file {sql_file}")
-        try:
-            with open(sql_file, "r") as file:
-                schema = file.read()
-            await self._conn.execute(schema)
-            LOG.info("Tables have been created")
-        except Exception as e:
-            LOG.error(f"AN ERROR OCCURRED WHILE ATTEMPTING TO CREATE TABLES -> {e}")
-
-    async def load_metadata(self, vcf, metafile, datafile):
-        """Parse metadata from a JSON file and insert it into the database."""
-        metadata = {}
-        try:
-            LOG.info(f"Calculate number of samples from {datafile}")
-            len_samples = len(vcf.samples)
-            LOG.info(f"Parse metadata from {metafile}")
-            with open(metafile, "r") as meta_file:
-                # read metadata from given JSON file
-                # TO DO: parse metadata directly from datafile if possible
-                LOG.info(meta_file)
-                metadata = ujson.load(meta_file)
-            LOG.info(metadata)
-            LOG.info("Metadata has been parsed")
-            try:
-                LOG.info("Attempting to insert metadata to database")
-                await self._conn.execute(
-                    """INSERT INTO beacon_dataset_table
-                                         (name, datasetId, description, assemblyId,
-                                         createDateTime, updateDateTime, version,
-                                         sampleCount, externalUrl, accessType)
-                                         VALUES
-                                         ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
-                                         ON CONFLICT (name, datasetId)
-                                         DO NOTHING""",
-                    metadata["name"],
-                    metadata["datasetId"],
-                    metadata["description"],
-                    metadata["assemblyId"],
-                    datetime.strptime(metadata["createDateTime"], "%Y-%m-%d %H:%M:%S"),
-                    datetime.strptime(metadata["updateDateTime"], "%Y-%m-%d %H:%M:%S"),
-                    metadata["version"],
-                    len_samples,
-                    metadata["externalUrl"],
-                    metadata["accessType"],
-                )
-                await self._conn.execute(
-                    """INSERT INTO beacon_dataset_counts_table
-                                         (datasetId, callCount, variantCount)
-                                         VALUES
-                                         ($1, $2, $3)""",
-                    metadata["datasetId"],
-                    metadata["callCount"],
-                    metadata["variantCount"],
-                )
-            except Exception as e:
-                LOG.error(f"AN ERROR OCCURRED WHILE ATTEMPTING TO INSERT METADATA -> {e}")
-        except Exception as e:
-            LOG.error(f"AN ERROR OCCURRED WHILE ATTEMPTING TO PARSE METADATA -> {e}")
-        else:
-            return metadata["datasetId"]
-
-    def _chunks(self, iterable, size):
-        """Chunk records.
-
-        Encountered at: https://stackoverflow.com/a/24527424/10143238
-        """
-        iterator = iter(iterable)
-        for first in iterator:
-            yield itertools.chain([first], itertools.islice(iterator, size - 1))
-
-    async def load_datafile(self, vcf, datafile, dataset_id, n=1000, min_ac=1):
-        """Parse data from datafile and send it to be inserted."""
-        LOG.info(f"Read data from {datafile}")
-        try:
-            LOG.info("Generate database queue(s)")
-            data = self._chunks(vcf, n)
-            for record in data:
-                await self.insert_variants(dataset_id, list(record), min_ac)
-            LOG.info(f"{datafile} has been processed")
-        except Exception as e:
-            LOG.error(f"AN ERROR OCCURRED WHILE GENERATING DB QUEUE -> {e}")
-
-    async def insert_variants(self, dataset_id, variants, min_ac):
-        """Insert variant data to the database."""
-        LOG.info(f"Received {len(variants)} variants for insertion to {dataset_id}")
-        try:
-            # Insertions are committed when transaction is closed
-            async with self._conn.transaction():
-                LOG.info("Insert variants into the database")
-                for variant in variants:
-                    # Nothing interesting on the variant with no aaf
-                    # because none of the samples have it
-                    if variant.aaf > 0:
-                        # params = (frequency, count, actual variant Type)
-                        params = self._unpack(variant)
-                        # Coordinates that are read from VCF are 1-based,
-                        # cyvcf2 reads them as 0-based, and they are inserted into the DB as such
-
-                        # params may carry single variants [1] or packed variants [20, 15, 10, 1]
-                        # The first check prunes for single variants, packed variants must be removed afterwards
-                        if params[1][0] >= min_ac:
-                            # Remove packed variants that don't meet the minimum allele count requirements
-                            # Packed variants are always ordered from largest to smallest, this process starts
-                            # popping values from the right (small) side until there are no more small values to pop
-                            while params[1][-1] < min_ac:
-                                params[0].pop()  # aaf
-                                params[1].pop()  # ac
-                                params[2].pop()  # vt
-                                params[3].pop()  # alt
-                                if len(params[5]) > 0:
-                                    params[5].pop()  # bnd
-
-                        # We Process Breakend Records into a different table for now
-                        if params[5] != []:
-                            # await self.insert_mates(dataset_id, variant, params)
-                            # Most likely there will be only one BND per Record
-                            for bnd in params[5]:
-                                await self._conn.execute(
-                                    """INSERT INTO beacon_mate_table
-                                                        (datasetId, chromosome, chromosomeStart, chromosomePos,
-                                                        mate, mateStart, matePos, reference, alternate, alleleCount,
-                                                        callCount, frequency, "end")
-                                                        SELECT ($1), ($2), ($3), ($4),
-                                                        ($5), ($6), ($7), ($8), t.alt, t.ac, ($11), t.freq, ($13)
-                                                        FROM (SELECT unnest($9::varchar[]) alt, unnest($10::integer[]) ac,
-                                                        unnest($12::float[]) freq) t
-                                                        ON CONFLICT (datasetId, chromosome, mate, chromosomePos, matePos)
-                                                        DO NOTHING""",
-                                    dataset_id,
-                                    variant.CHROM.replace("chr", ""),
-                                    variant.start,
-                                    variant.ID,
-                                    bnd[0].replace("chr", ""),
-                                    bnd[1],
-                                    bnd[6],
-                                    variant.REF,
-                                    params[3],
-                                    params[1],
-                                    params[4],
-                                    params[0],
-                                    variant.end,
-                                )
-                        else:
-                            await self._conn.execute(
-                                """INSERT INTO beacon_data_table
-                                                    (datasetId, chromosome, start, reference, alternate,
-                                                    "end", aggregatedVariantType, alleleCount, callCount, frequency, variantType)
-                                                    SELECT ($1), ($2), ($3), ($4), t.alt, ($6), ($7), t.ac, ($9), t.freq, t.vt
-                                                    FROM (SELECT unnest($5::varchar[]) alt, unnest($8::integer[]) ac,
-                                                    unnest($10::float[]) freq, unnest($11::varchar[]) as vt) t
-                                                    ON CONFLICT (datasetId, chromosome, start, reference, alternate)
-                                                    DO NOTHING""",
-                                dataset_id,
-                                variant.CHROM.replace("chr", ""),
-                                variant.start,
-                                variant.REF,
-                                params[3],
-                                variant.end,
-                                variant.var_type.upper(),
-                                params[1],
-                                params[4],
-                                params[0],
-                                params[2],
-                            )
-
-                LOG.debug("Variants have been inserted")
-        except Exception as e:
-            LOG.error(f"AN ERROR OCCURRED WHILE ATTEMPTING TO INSERT VARIANTS -> {e}")
-
-    async def close(self):
-        """Close the database connection."""
-        try:
-            LOG.info("Mark the database connection to be closed")
-            await self._conn.close()
-            LOG.info("The database connection has been closed")
-        except Exception as e:
-            LOG.error(f"AN ERROR OCCURRED WHILE ATTEMPTING TO CLOSE DATABASE CONNECTION -> {e}")
-
-
-async def init_beacon_db(arguments=None):
-    """Run database operations here."""
-    # Fetch command line arguments
-    args = parse_arguments(arguments)
-    validate_arguments(args)
-
-    # Initialise the database connection
-    db = BeaconDB()
-
-    # Connect to the database
-    await db.connection()
-
-    # Get sample list if it's set
-    vcf = VCF(args.datafile, samples=args.samples.split(",") if args.samples else None)
-
-    # Check that desired tables exist (missing tables are returned)
-    tables = await db.check_tables(["beacon_dataset_table", "beacon_data_table", "beacon_dataset_counts_table"])
-
-    # If some tables are missing, run init.sql to recover them
-    if len(tables) > 0:
-        await db.create_tables(os.environ.get("TABLES_SCHEMA", "data/init.sql"))
-
-    # Insert dataset metadata into the database, prior to inserting actual variant data
-    dataset_id = await db.load_metadata(vcf, args.metadata, args.datafile)
-
-    # Insert data into the database
-    await db.load_datafile(vcf, args.datafile, dataset_id, min_ac=int(args.min_allele_count))
-
-    # Close the database connection
-    await db.close()
-
-
-def validate_arguments(arguments):
-    """Check that given arguments are valid."""
-    if not Path(arguments.datafile).is_file():
-        sys.exit(f"Could not find datafile: {arguments.datafile}")
-    if not Path(arguments.metadata).is_file():
-        sys.exit(f"Could not find metadata file: {arguments.metadata}")
-    if not arguments.min_allele_count.isdigit():
-        sys.exit(f"Minimum allele count --min_allele_count must be a positive integer, received: {arguments.min_allele_count}")
-
-
-def parse_arguments(arguments):
-    """Parse command line arguments."""
-    parser = argparse.ArgumentParser(
-        description="""Load datafiles with associated metadata
-                                     into the beacon database. See example data and metadata files
-                                     in the /data directory."""
-    )
-    parser.add_argument("datafile", help=".vcf file containing variant information")
-    parser.add_argument("metadata", help=".json file containing metadata associated to datafile")
-    parser.add_argument("--samples", default=None, help="comma separated string of samples to process. EXPERIMENTAL")
-    parser.add_argument("--min_allele_count", default="1", help="minimum allele count can be raised to ignore rare variants. Default value is 1")
-    return parser.parse_args(arguments)
-
-
-def main():
-    """Run the beacon_init script."""
-    # TO DO add this to setup to run from command line
-    # allow arguments to be passed from command line
-    if sys.version_info >= (3, 7):
-        asyncio.run(init_beacon_db())
-    else:
-        asyncio.get_event_loop().run_until_complete(init_beacon_db())
-
-
-if __name__ == "__main__":
-    main()
+"""Beacon Database Loader.
+
+This utility script is used to parse VCF files into a PostgreSQL database.
+See :ref:`database` table ``beacon_data_table`` for what information is extracted from the VCF file.
+
+Datafiles ``*.vcf`` are denoted as ``datafile`` in the script parameters.
+Metadata for a datafile is given in a ``*.json`` file, denoted as ``metafile`` in the script parameters.
+
+.. note:: Future releases are expected to drop the additional ``metafile``
+        parameter in favour of simplifying the database loading process,
+        reading metadata from the datafile(s) directly.
+
+
+Environment Setup
+-----------------
+
+Location of the table creation script can be changed with the ``TABLES_SCHEMA`` environment variable.
+
++----------------------+--------------------------+-----------------------------------------------------+
+| ENV                  | Default                  | Description                                         |
++----------------------+--------------------------+-----------------------------------------------------+
+| `TABLES_SCHEMA`      | `data/init.sql`          | Database tables schema for metadata and variants.   |
++----------------------+--------------------------+-----------------------------------------------------+
+| `PARTITIONED_SCHEMA` | `data/partitioned.sql`   | Partitioned variants table, with ``--partitioned``. |
++----------------------+--------------------------+-----------------------------------------------------+
+
+Run Module
+----------
+
+Below are the two ways of running this module (pip installed and uninstalled).
+
+.. code-block:: console
+
+    $ beacon_init [datafile] [metafile]
+    $ python -m beacon_api.utils.db_load [datafile] [metafile]
+
+If the datafile has a tabix (``.tbi``) or CSI (``.csi``) index, it can be loaded in parallel
+by a pool of worker processes, each parsing a contig (or a region of ``--region_size`` bases)
+and writing through its own database connection:
+
+.. code-block:: console
+
+    $ beacon_init [datafile] [metafile] --workers 8
+
+Many datasets listed in a manifest can be loaded concurrently over a shared connection pool:
+
+.. code-block:: console
+
+    $ beacon_init --manifest [manifest] --concurrency 4
+
+When the tables are created, ``--partitioned`` partitions ``beacon_data_table`` by dataset and chromosome.
+The partitions of a dataset are created when it is loaded, and replaced as a whole with ``--swap``:
+
+.. code-block:: console
+
+    $ beacon_init [datafile] [metafile] --partitioned
+
+
+.. note:: This script has been tested with VCF specification v4.2.
+"""
+
+import os
+import sys
+import argparse
+import hashlib
+import ujson
+import itertools
+import multiprocessing
+import re
+import resource
+import threading
+import time
+
+import asyncio
+import asyncpg
+import numpy as np
+from cyvcf2 import VCF
+
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from datetime import datetime
+
+from .bloom import FPR, BloomFilter
+from .catalog import CATALOG_CHANNEL
+from .codes import CHROMOSOMES, CHROMOSOME_CODES, VARIANT_TYPES, VARIANT_TYPE_CODES, encode_sql, encode_variant_type_sql, variant_type_code
+from .logging import LOG
+
+# Column order of the rows produced by ``BeaconDB._variant_rows``
+DATA_COLUMNS = [
+    "datasetid",
+    "chromosome",
+    "start",
+    "reference",
+    "alternate",
+    "end",
+    "aggregatedvarianttype",
+    "allelecount",
+    "callcount",
+    "frequency",
+    "varianttype",
+]
+MATE_COLUMNS = [
+    "datasetid",
+    "chromosome",
+    "chromosomestart",
+    "chromosomepos",
+    "mate",
+    "matestart",
+    "matepos",
+    "reference",
+    "alternate",
+    "allelecount",
+    "callcount",
+    "frequency",
+    "end",
+]
+# Conflict targets of the ``data_allele_conflict`` and ``mate_conflict`` unique indexes
+DATA_CONFLICT = "datasetId, chromosome, start, alleleHash"
+MATE_CONFLICT = "datasetId, chromosome, mate, chromosomePos, matePos"
+# Hash of the alleles of a variant, the first 64 bits of their md5 digest
+ALLELE_HASH = "('x' || left(md5(reference || '>' || alternate), 16))::bit(64)::bigint"
+# Conversion of the chromosome and variant type names of beacon_data_table into codes, see beacon_api.utils.codes
+# The code expressions only contain the constant names of codes
+ENCODE_COLUMNS = f"""DO $$ BEGIN
+    IF (SELECT atttypid = 'varchar'::regtype FROM pg_attribute
+        WHERE attrelid = 'beacon_data_table'::regclass AND attname = 'chromosome') THEN
+        IF (SELECT relkind = 'p' FROM pg_class WHERE oid = 'beacon_data_table'::regclass) THEN
+            RAISE EXCEPTION 'The partitioned beacon_data_table stores chromosome names, it has to be created again';
+        END IF;
+        ALTER TABLE beacon_data_table
+            ALTER COLUMN chromosome TYPE SMALLINT USING {encode_sql(CHROMOSOMES, "chromosome")},
+            ALTER COLUMN variantType TYPE SMALLINT USING {encode_variant_type_sql("variantType")},
+            ALTER COLUMN aggregatedVariantType TYPE SMALLINT USING {encode_variant_type_sql("aggregatedVariantType")};
+    END IF;
+END $$"""  # nosec B608
+# Allele hash column and indexes of the variant queries, also created by init.sql, the allele index only if pg_trgm is available
+SCHEMA_UPDATES = [
+    ENCODE_COLUMNS,
+    f"ALTER TABLE beacon_data_table ADD COLUMN IF NOT EXISTS alleleHash BIGINT\n    GENERATED ALWAYS AS ({ALLELE_HASH}) STORED",
+    "DROP INDEX IF EXISTS data_conflict",
+    "CREATE UNIQUE INDEX IF NOT EXISTS data_allele_conflict ON beacon_data_table (datasetId, chromosome, start, alleleHash)",
+    'CREATE INDEX IF NOT EXISTS data_position ON beacon_data_table (chromosome, start, "end")',
+    """DO $$ BEGIN
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    CREATE INDEX IF NOT EXISTS data_alleles ON beacon_data_table USING gin (reference gin_trgm_ops, alternate gin_trgm_ops);
+EXCEPTION
+    WHEN undefined_file OR feature_not_supported OR insufficient_privilege THEN
+        RAISE NOTICE 'pg_trgm is not available, alleles with wildcards are compared on the variants found by position';
+END $$""",
+]
+# INFO fields read from VCF records
+INFO_FIELDS = ["AC", "AN", "AF", "VT", "SVTYPE", "MATEID"]
+# Estimated memory of a parsed row, its record and its share of the COPY buffer, in bytes
+ROW_BYTES = 512
+# Variants read at a time when building Bloom filters
+FILTER_ROWS = 100000
+
+
+class LoadError(Exception):
+    """Loading a datafile into the database failed."""
+
+
+class Record:
+    """Fields of a VCF record used by the loader.
+
+    A cyvcf2 ``Variant`` keeps the genotypes of all samples in memory, records are extracted
+    when the datafile is read so that the ``Variant`` can be released right away.
+    Attributes have the names of the ``Variant`` attributes, ``INFO`` is a dict of ``INFO_FIELDS``.
+    """
+
+    __slots__ = ("CHROM", "start", "end", "ID", "REF", "ALT", "var_type", "is_sv", "aaf", "num_called", "INFO", "rows", "nbytes")
+
+    def __init__(self, variant):
+        """Extract the fields of a ``Variant``."""
+        self.CHROM = variant.CHROM
+        self.start = variant.start
+        self.end = variant.end
+        self.ID = variant.ID
+        self.REF = variant.REF
+        self.ALT = list(variant.ALT)
+        self.var_type = variant.var_type
+        self.is_sv = variant.is_sv
+        self.aaf = variant.aaf
+        self.INFO = {key: variant.INFO.get(key) for key in INFO_FIELDS}
+        # The number of called samples is only needed when AN is missing, and counting it decodes all genotypes
+        self.num_called = None if self.INFO["AN"] else variant.num_called
+        self.rows = max(len(self.ALT), 1)
+        self.nbytes = ROW_BYTES * self.rows + len(self.REF) * self.rows + sum(map(len, self.ALT))
+
+
+def peak_rss():
+    """Return the peak resident set size of the process in megabytes."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _column_list(columns):
+    """Quote column names for use in SQL statements."""
+    return ", ".join(f'"{column}"' for column in columns)
+
+
+class BeaconDB:
+    """Database connection and operations."""
+
+    def __init__(self, pool=None) -> None:
+        """Start database routines.
+
+        With a ``pool``, the connection is acquired from the pool and released back to it on :meth:`close`.
+        """
+        LOG.info("Start database routines")
+        self._pool = pool
+        self._conn = None
+        self._staging = False
+
+    def _alt_length_check(self, variant, i, default):
+        """Figure out if the Alternate base is longer than the Reference base."""
+        if len(variant.ALT[i]) > len(variant.REF):
+            return "INS"
+        elif len(variant.ALT[i]) == len(variant.REF):
+            return default
+        else:
+            return "DEL"
+
+    def _transform_vt(self, vt, variant, i):
+        """Transform variant types."""
+        if vt in ["s", "snp"]:
+            return self._alt_length_check(variant, i, "SNP")
+        elif vt in ["m", "mnp"]:
+            return self._alt_length_check(variant, i, "MNP")
+        elif vt in ["i", "indel"]:
+            return self._alt_length_check(variant, i, "SNP")
+        else:
+            return variant.var_type.upper()
+
+    def _handle_type(self, value, type):
+        """Determine if values are in a tuple and also convert them to specific type."""
+        ar = []
+        if isinstance(value, tuple):
+            ar = [type(i) for i in value]
+        elif isinstance(value, type):
+            ar = [type(value)]
+
+        return ar
+
+    def _bnd_parts(self, alt, mate):
+        """Retrieve BND SV type parts.
+
+        We retrieve more than needed
+        """
+        # REF ALT  Meaning
+        # s   t[p[ piece extending to the right of p is joined after t
+        # s   t]p] reverse comp piece extending left of p is joined after t
+        # s   ]p]t piece extending to the left of p is joined before t
+        # s   [p[t reverse comp piece extending right of p is joined before t
+        # where p is chr:pos
+        patt = re.compile("[\\[\\]]")
+        mate_items = patt.split(alt)
+        remoteCoords = mate_items[1].split(":")
+        chr = remoteCoords[0].lower()
+        if chr[0] == "<":
+            chr = chr[1:-1]
+            withinMainAssembly = False
+        else:
+            withinMainAssembly = True
+        pos = int(remoteCoords[1])
+        orientation = alt[0] == "[" or alt[0] == "]"
+        remoteOrientation = re.search("\\[", alt) is not None
+        if orientation:
+            connectingSequence = mate_items[2]
+        else:
+            connectingSequence = mate_items[0]
+
+        return (chr, pos, orientation, remoteOrientation, connectingSequence, withinMainAssembly, mate)
+
+    def _rchop(self, thestring, ending):
+        """Chop SV type if any SV is in the ``me_type`` list.
+
+        The ``SV=LINE1`` is not supported, thus we meed to used the ALT base
+        ``INS:ME:LINE1`` but removing the ``:LINE1`` from the end.
+
+        .. warning:: This data transformation might only be valid for 1000genome.
+        """
+        if thestring.endswith(ending):
+            return thestring[: -len(ending)]
+        return thestring
+
+    def _unpack(self, variant):
+        """Unpack variant type, allele frequency and count.
+
+        This is quite a complicated parser, but it is custom made to address some of
+        expectations regarding the data to be delivered by the beacon API.
+
+        .. warning:: By no means this is exahustive in processing of VCF Records.
+        """
+        aaf = []
+        ac = []
+
+        ac = self._handle_type(variant.INFO.get("AC"), int) if variant.INFO.get("AC") else []
+        an = variant.INFO.get("AN") if variant.INFO.get("AN") else variant.num_called * 2
+        if variant.INFO.get("AF"):
+            aaf = self._handle_type(variant.INFO.get("AF"), float)
+        else:
+            aaf = [float(ac_value) / float(an) for ac_value in ac]
+
+        vt, alt, bnd = self._alleles(variant)
+        return (aaf, ac, vt, alt, an, bnd)
+
+    def _alleles(self, variant):
+        """Unpack variant types, alternate alleles and breakend parts of a record."""
+        vt = []
+        bnd = []
+        alt = variant.ALT
+        me_type = ["dup:tandem", "del:me", "ins:me"]
+
+        if variant.is_sv:
+            alt = [elem.strip("<>") for elem in variant.ALT]
+            if variant.INFO.get("SVTYPE"):
+                v = variant.INFO.get("SVTYPE")
+                if v == "BND":
+                    bnd = [self._bnd_parts(e, variant.INFO.get("MATEID")) for e in alt]
+                    vt = ["BND" for e in alt]
+                else:
+                    vt = [self._rchop(e, ":" + v) if e.lower().startswith(tuple(me_type)) else v for e in alt]
+        else:
+            if variant.INFO.get("VT"):
+                v = variant.INFO.get("VT").split(",")
+                if len(alt) > len(v):
+                    vt_temp = [[self._transform_vt(var_type.lower(), variant, i) for i, k in enumerate(alt)] for var_type in v]
+                    vt = vt_temp[0]
+                else:
+                    vt = [self._transform_vt(var_type.lower(), variant, i) for i, var_type in enumerate(v)]
+
+        return (vt, alt, bnd)
+
+    def _unpack_batch(self, variants, min_ac):
+        """Unpack a chunk of records, computing allele counts and frequencies as columnar arrays.
+
+        Allele counts of all records are flattened into one NumPy array, frequencies missing
+        from ``AF`` are derived from ``AC`` and ``AN`` in one operation and the minimum allele
+        count is applied as a mask. Returns ``(variant, params)`` for the records that have
+        alternate alleles, ``params`` being the tuple returned by :meth:`_unpack`.
+
+        Packed alleles are always ordered from largest to smallest count, alleles below ``min_ac``
+        are removed from the right (small) side, as long as the first allele passes the minimum.
+        """
+        # Nothing interesting on the variant with no aaf
+        # because none of the samples have it
+        variants = [variant for variant in variants if variant.aaf > 0]
+        info = [(variant.INFO.get("AC"), variant.INFO.get("AN"), variant.INFO.get("AF")) for variant in variants]
+        ac_lists = [self._handle_type(ac, int) if ac else [] for ac, _, _ in info]
+        an_list = [an if an else variant.num_called * 2 for variant, (_, an, _) in zip(variants, info)]
+
+        lengths = np.fromiter(map(len, ac_lists), dtype=np.int64, count=len(ac_lists))
+        offsets = np.cumsum(lengths) - lengths
+        ac = np.fromiter(itertools.chain.from_iterable(ac_lists), dtype=np.int64, count=int(lengths.sum()))
+        record = np.repeat(np.arange(len(ac_lists)), lengths)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            frequency = ac / np.asarray(an_list, dtype=np.float64)[record]
+
+        # Count the alleles below the minimum on the right side of each record
+        passing = ac >= min_ac
+        position = np.arange(ac.size) - offsets[record]
+        last_passing = np.full(len(ac_lists), -1, dtype=np.int64)
+        np.maximum.at(last_passing, record[passing], position[passing])
+        first_passing = np.zeros(len(ac_lists), dtype=bool)
+        first_passing[lengths > 0] = passing[offsets[lengths > 0]]
+        removed = np.where(first_passing, lengths - 1 - last_passing, 0).tolist()
+
+        unpacked = []
+        for i, variant in enumerate(variants):
+            start, end = int(offsets[i]), int(offsets[i] + lengths[i])
+            aaf = self._handle_type(info[i][2], float) if info[i][2] else frequency[start:end].tolist()
+            vt, alt, bnd = self._alleles(variant)
+            if removed[i]:
+                aaf, ac_list, vt, alt = (values[: len(values) - removed[i]] for values in (aaf, ac_lists[i], vt, alt))
+                bnd = bnd[: len(bnd) - removed[i]] if bnd else bnd
+            else:
+                ac_list = ac_lists[i]
+            unpacked.append((variant, (aaf, ac_list, vt, alt, an_list[i], bnd)))
+        return unpacked
+
+    async def connection(self):
+        """Connect to the database."""
+        LOG.info("Establish a connection to database")
+        try:
+            if self._pool is None:
+                self._conn = await asyncpg.connect(**connection_settings())
+            else:
+                if self._conn is not None:
+                    await self._pool.release(self._conn)
+                self._conn = await self._pool.acquire()
+            LOG.info("Database connection has been established")
+        except Exception as e:
+            LOG.error(f"AN ERROR OCCURRED WHILE ATTEMPTING TO CONNECT TO DATABASE -> {e}")
+
+    async def check_tables(self, desired_tables):
+        """Check that correct tables exist in the database, partitions are not listed."""
+        LOG.info("Request tables from database")
+        found_tables = []
+        tables = await self._conn.fetch(
+            """SELECT c.relname AS table_name
+                                        FROM pg_class c JOIN pg_namespace n ON n.oid=c.relnamespace
+                                        WHERE n.nspname='public'
+                                        AND c.relkind IN ('r', 'p')
+                                        AND NOT c.relispartition;"""
+        )
+        LOG.info("Tables received -> check that correct tables exist")
+        for table in list(tables):
+            found_tables.append(dict(table)["table_name"])
+        missing_tables = list(set(desired_tables) - set(found_tables))
+        for table in found_tables:
+            LOG.info(f"{table} exists")
+        for table in missing_tables:
+            LOG.error(f"{table} is missing!")
+        return missing_tables
+
+    async def create_tables(self, sql_file):
+        """Create tables to database according to given schema."""
+        LOG.info(f"Create tables to database according to given schema in file {sql_file}")
+        try:
+            with open(sql_file, "r") as file:
+                schema = file.read()
+            await self._conn.execute(schema)
+            LOG.info("Tables have been created")
+        except Exception as e:
+            LOG.error(f"AN ERROR OCCURRED WHILE ATTEMPTING TO CREATE TABLES -> {e}")
+
+    async def update_schema(self):
+        """Update databases initialised before the codes, the allele hash and the indexes of the variant queries.
+
+        Chromosome and variant type names of an existing ``beacon_data_table`` are converted into codes,
+        and adding ``alleleHash`` computes it for all of its rows.
+        Variant types without a code are converted as by the loader, and counted in a warning.
+        """
+        LOG.info("Update chromosome codes, allele hash and query indexes")
+        if await self._conn.fetchval(
+            """SELECT atttypid = 'varchar'::regtype FROM pg_attribute
+               WHERE attrelid = to_regclass('beacon_data_table') AND attname = 'varianttype'"""
+        ):
+            unknown = await self._conn.fetch(
+                """SELECT variantType, count(*) FROM beacon_data_table
+                   WHERE NOT variantType = any($1::varchar[]) GROUP BY variantType""",
+                VARIANT_TYPES,
+            )
+            if unknown:
+                LOG.warning(f"Variant types without a code are stored as their nearest type with a code -> {dict(map(tuple, unknown))}")
+        for statement in SCHEMA_UPDATES:
+            await self._conn.execute(statement)
+
+    async def partitioned(self):
+        """Return True if ``beacon_data_table`` is partitioned by dataset, as created from ``data/partitioned.sql``."""
+        return bool(await self._conn.fetchval("SELECT relkind='p' FROM pg_class WHERE oid=to_regclass('beacon_data_table')"))
+
+    async def create_partitions(self, dataset_id, table=None):
+        """Create the partition of a dataset in a partitioned ``beacon_data_table``, partitioned by chromosome.
+
+        Every chromosome of ``CHROMOSOMES`` has a partition, named after it. With ``table`` the partitions
+        are created as a detached table of that name, with the columns and indexes of ``beacon_data_table``.
+        """
+        partition = table or partition_name(dataset_id)
+        if table is None:
+            value = await self._conn.fetchval("SELECT quote_literal($1)", dataset_id)
+            await self._conn.execute(
+                f"""CREATE TABLE IF NOT EXISTS {partition} PARTITION OF beacon_data_table
+                    FOR VALUES IN ({value}) PARTITION BY LIST (chromosome)"""
+            )
+        else:
+            await self._conn.execute(
+                f"""CREATE TABLE {partition} (LIKE beacon_data_table INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING INDEXES)
+                    PARTITION BY LIST (chromosome)"""
+            )
+        for chromosome in CHROMOSOMES:
+            await self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {partition}_{chromosome.lower()} PARTITION OF {partition} FOR VALUES IN ({CHROMOSOME_CODES[chromosome]})"
+            )
+
+    async def replace_partition(self, dataset_id, table):
+        """Replace the partition of a dataset with a table created by :meth:`create_partitions`.
+
+        The previous partition is detached and dropped, the table renamed and attached in its place.
+        A check constraint on the dataset lets PostgreSQL attach it without scanning its rows.
+        """
+        partition = partition_name(dataset_id)
+        value = await self._conn.fetchval("SELECT quote_literal($1)", dataset_id)
+        await self._conn.execute(f"ALTER TABLE {table} ADD CONSTRAINT {partition}_dataset CHECK (datasetId IS NOT NULL AND datasetId={value})")
+        if await self._conn.fetchval("SELECT to_regclass($1) IS NOT NULL", partition):
+            await self._conn.execute(f"ALTER TABLE beacon_data_table DETACH PARTITION {partition}")
+            await self._conn.execute(f"DROP TABLE {partition}")
+        await self._conn.execute(f"ALTER TABLE {table} RENAME TO {partition}")
+        for chromosome in CHROMOSOMES:
+            await self._conn.execute(f"ALTER TABLE {table}_{chromosome.lower()} RENAME TO {partition}_{chromosome.lower()}")
+        await self._conn.execute(f"ALTER TABLE beacon_data_table ATTACH PARTITION {partition} FOR VALUES IN ({value})")
+        await self._conn.execute(f"ALTER TABLE {partition} DROP CONSTRAINT {partition}_dataset")
+
+    async def load_metadata(self, vcf, metafile, datafile):
+        """Parse metadata from a JSON file and insert it into the database."""
+        metadata = {}
+        try:
+            LOG.info(f"Calculate number of samples from {datafile}")
+            len_samples = len(vcf.samples)
+            LOG.info(f"Parse metadata from {metafile}")
+            with open(metafile, "r") as meta_file:
+                # read metadata from given JSON file
+                # TO DO: parse metadata directly from datafile if possible
+                LOG.info(meta_file)
+                metadata = ujson.load(meta_file)
+            LOG.info(metadata)
+            LOG.info("Metadata has been parsed")
+            try:
+                LOG.info("Attempting to insert metadata to database")
+                await self._conn.execute(
+                    """INSERT INTO beacon_dataset_table
+                                         (name, datasetId, description, assemblyId,
+                                         createDateTime, updateDateTime, version,
+                                         sampleCount, externalUrl, accessType)
+                                         VALUES
+                                         ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
+                                         ON CONFLICT (name, datasetId)
+                                         DO NOTHING""",
+                    metadata["name"],
+                    metadata["datasetId"],
+                    metadata["description"],
+                    metadata["assemblyId"],
+                    datetime.strptime(metadata["createDateTime"], "%Y-%m-%d %H:%M:%S"),
+                    datetime.strptime(metadata["updateDateTime"], "%Y-%m-%d %H:%M:%S"),
+                    metadata["version"],
+                    len_samples,
+                    metadata["externalUrl"],
+                    metadata["accessType"],
+                )
+                # Counts are computed by the loader, see add_counts and recount
+                await self._conn.execute(
+                    """INSERT INTO beacon_dataset_counts_table
+                                         (datasetId, callCount, variantCount)
+                                         SELECT $1::VARCHAR, 0, 0
+                                         WHERE NOT EXISTS (SELECT 1 FROM beacon_dataset_counts_table
+                                                           WHERE datasetId=$1)""",
+                    metadata["datasetId"],
+                )
+            except Exception as e:
+                LOG.error(f"AN ERROR OCCURRED WHILE ATTEMPTING TO INSERT METADATA -> {e}")
+        except Exception as e:
+            LOG.error(f"AN ERROR OCCURRED WHILE ATTEMPTING TO PARSE METADATA -> {e}")
+        else:
+            return metadata["datasetId"]
+
+    def _chunks(self, records, size, max_bytes=0):
+        """Chunk records into lists of at most ``size`` rows and, with ``max_bytes``, about as many bytes.
+
+        Records are sized by :class:`Record`, a chunk holds at least one record.
+        """
+        chunk, rows, nbytes = [], 0, 0
+        for record in records:
+            if chunk and (rows + record.rows > size or (max_bytes and nbytes + record.nbytes > max_bytes)):
+                yield chunk
+                chunk, rows, nbytes = [], 0, 0
+            chunk.append(record)
+            rows += record.rows
+            nbytes += record.nbytes
+        if chunk:
+            yield chunk
+
+    def _parse_chunks(self, loop, queue, stop, records, dataset_id, n, min_ac, skip=0, max_bytes=0):
+        """Parse chunks of records into rows and hand them over to the event loop.
+
+        Runs in a worker thread. Putting to the bounded ``queue`` blocks while the queue
+        is full, so parsing never runs more than the queue depth ahead of the database writes.
+        Records are read as :class:`Record` and chunked by :meth:`_chunks`.
+        Chunks are numbered from 1, the first ``skip`` chunks are read but not parsed.
+        The end of the records is signalled with ``None``.
+        """
+        count = 0
+        try:
+            for number, variants in enumerate(self._chunks(map(Record, records), n, max_bytes), start=1):
+                if stop.is_set():
+                    break
+                if number <= skip:
+                    continue
+                count += len(variants)
+                last = variants[-1]
+                rows = self._variant_rows(dataset_id, variants, min_ac)
+                asyncio.run_coroutine_threadsafe(queue.put((number, *rows, (last.CHROM, last.start))), loop).result()
+        finally:
+            if not stop.is_set():
+                asyncio.run_coroutine_threadsafe(queue.put(None), loop).result()
+        return count
+
+    async def committed_chunks(self, dataset_id, datafile, region=None):
+        """Return the last committed chunk of a datafile and the call and variant counts committed up to it.
+
+        Returns ``(0, 0, 0)`` if nothing has been committed.
+        """
+        record = await self._conn.fetchrow(
+            """SELECT chunk, callCount, variantCount FROM beacon_loader_state_table
+               WHERE datasetId=$1 AND datafile=$2 AND region=$3""",
+            dataset_id,
+            str(Path(datafile).resolve()),
+            region_name(region),
+        )
+        return tuple(record) if record else (0, 0, 0)
+
+    async def clear_checkpoint(self, dataset_id, datafile, region=None):
+        """Forget the committed chunks of a datafile, so that a load starts from the beginning."""
+        await self._conn.execute(
+            """DELETE FROM beacon_loader_state_table
+               WHERE datasetId=$1 AND datafile=$2 AND region=$3""",
+            dataset_id,
+            str(Path(datafile).resolve()),
+            region_name(region),
+        )
+
+    async def _save_checkpoint(self, dataset_id, checkpoint):
+        """Record the last committed chunk of a datafile, within the transaction of the chunk.
+
+        The call and variant counts of the checkpoint include those of the chunk itself.
+        """
+        datafile, region, chunk, chromosome, position, calls, variants = checkpoint
+        await self._conn.execute(
+            """INSERT INTO beacon_loader_state_table
+               (datasetId, datafile, region, chunk, chromosome, position, callCount, variantCount, updateDateTime)
+               VALUES ($1, $2, $3, $4, $5, $6, $7, $8, now())
+               ON CONFLICT (datasetId, datafile, region)
+               DO UPDATE SET chunk=EXCLUDED.chunk, chromosome=EXCLUDED.chromosome,
+               position=EXCLUDED.position, callCount=EXCLUDED.callCount,
+               variantCount=EXCLUDED.variantCount, updateDateTime=EXCLUDED.updateDateTime""",
+            dataset_id,
+            str(Path(datafile).resolve()),
+            region_name(region),
+            chunk,
+            chromosome,
+            position,
+            calls,
+            variants,
+        )
+
+    async def load_datafile(
+        self,
+        vcf,
+        datafile,
+        dataset_id,
+        n=1000,
+        min_ac=1,
+        region=None,
+        queue_depth=4,
+        resume=False,
+        retries=3,
+        backoff=1.0,
+        swap=False,
+        max_bytes=16 * 1024**2,
+    ):
+        """Parse data from datafile and send it to be inserted.
+
+        Parsing runs in a worker thread while the event loop writes the parsed chunks
+        to the database, at most ``queue_depth`` parsed chunks are held waiting for the database.
+        Chunks hold at most ``n`` rows and about ``max_bytes`` bytes, bounding the memory
+        of the parsed chunks to about ``queue_depth + 2`` times ``max_bytes``.
+        If a ``region`` as returned by :func:`datafile_regions` is given, only records
+        starting inside that region are read, using the index of the datafile.
+
+        Every chunk is committed together with a checkpoint, with ``resume`` the chunks
+        committed by a previous load of the datafile, with the same ``n`` and ``max_bytes``, are skipped. A chunk that cannot be
+        inserted after ``retries`` attempts fails the load with :class:`LoadError`.
+        With ``swap`` the rows are loaded into the swap tables of the dataset.
+
+        Returns the number of new call sites and inserted variants of the dataset, counted
+        while inserting the chunks, including those committed by a resumed load,
+        and the number of rows written by this run.
+        """
+        LOG.info(f"Read data from {datafile}")
+        source = f"{datafile} {region_name(region)}".rstrip()
+        try:
+            LOG.info("Generate database queue(s)")
+            skip, calls, variants = 0, 0, 0
+            if resume:
+                skip, calls, variants = await self.committed_chunks(dataset_id, datafile, region)
+                LOG.info(f"Resume loading {source} after {skip} committed chunk(s)")
+            else:
+                await self.clear_checkpoint(dataset_id, datafile, region)
+            loop = asyncio.get_running_loop()
+            queue: asyncio.Queue = asyncio.Queue(maxsize=queue_depth)
+            stop = threading.Event()
+            records = vcf if region is None else region_records(vcf, region)
+            started = time.monotonic()
+            parser = loop.run_in_executor(None, self._parse_chunks, loop, queue, stop, records, dataset_id, n, min_ac, skip, max_bytes)
+            rows = 0
+            committed = skip
+            try:
+                while (chunk := await queue.get()) is not None:
+                    number, data_rows, mate_rows, (chromosome, position) = chunk
+                    checkpoint = (datafile, region, number, chromosome, position, calls, variants)
+                    try:
+                        calls, variants = await self.insert_rows(dataset_id, data_rows, mate_rows, checkpoint, retries, backoff, swap)
+                    except Exception as e:
+                        raise LoadError(
+                            f"Loading {source} into {dataset_id} failed at chunk {number} "
+                            f"ending at {chromosome}:{position + 1} after {retries} attempt(s) -> {e}. "
+                            f"{committed} chunk(s) have been committed, {rows} rows by this run, "
+                            "rerun beacon_init with --resume to continue from the last committed chunk."
+                        )
+                    committed = number
+                    rows += len(data_rows) + len(mate_rows)
+            finally:
+                # Unblock the parser if writing stopped before all chunks were consumed
+                stop.set()
+                while not parser.done():
+                    while not queue.empty():
+                        queue.get_nowait()
+                    await asyncio.wait([parser], timeout=0.1)
+            count = await parser
+            elapsed = time.monotonic() - started
+            LOG.info(
+                f"{datafile} has been processed: {count} records, {rows} rows in {elapsed:.2f}s "
+                f"({rows / elapsed if elapsed else 0:.0f} rows/s), peak RSS {peak_rss():.1f} MB"
+            )
+            return calls, variants, rows
+        except Exception as e:
+            LOG.error(f"AN ERROR OCCURRED WHILE GENERATING DB QUEUE -> {e}")
+            raise
+
+    def _variant_rows(self, dataset_id, variants, min_ac):
+        """Unpack VCF records into rows for ``beacon_data_table`` and ``beacon_mate_table``.
+
+        Rows follow the column order of ``DATA_COLUMNS`` and ``MATE_COLUMNS``, with chromosomes and variant types
+        of ``beacon_data_table`` encoded, see :mod:`beacon_api.utils.codes`. Variants on other contigs are skipped.
+        """
+        data_rows = []
+        mate_rows = []
+        skipped = 0
+        unknown: Counter = Counter()
+        for variant, params in self._unpack_batch(variants, min_ac):
+            # Coordinates that are read from VCF are 1-based,
+            # cyvcf2 reads them as 0-based, and they are inserted into the DB as such
+            # Packed values are zipped the way PostgreSQL unnests arrays of unequal length, padding with NULL
+            # We Process Breakend Records into a different table for now
+            if params[5] != []:
+                # Most likely there will be only one BND per Record
+                for bnd in params[5]:
+                    for alt, ac, freq in itertools.zip_longest(params[3], params[1], params[0]):
+                        mate_rows.append(
+                            (
+                                dataset_id,
+                                variant.CHROM.replace("chr", ""),
+                                variant.start,
+                                variant.ID,
+                                bnd[0].replace("chr", ""),
+                                bnd[1],
+                                bnd[6],
+                                variant.REF,
+                                alt,
+                                ac,
+                                params[4],
+                                freq,
+                                variant.end,
+                            )
+                        )
+            elif variant.CHROM.replace("chr", "") not in CHROMOSOME_CODES:
+                skipped += 1
+            else:
+                chromosome = CHROMOSOME_CODES[variant.CHROM.replace("chr", "")]
+                aggregated = variant_type_code(variant.var_type.upper())
+                for alt, ac, freq, vt in itertools.zip_longest(params[3], params[1], params[0], params[2]):
+                    if vt is not None and vt not in VARIANT_TYPE_CODES:
+                        unknown[vt] += 1
+                    data_rows.append(
+                        (
+                            dataset_id,
+                            chromosome,
+                            variant.start,
+                            variant.REF,
+                            alt,
+                            variant.end,
+                            aggregated,
+                            ac,
+                            params[4],
+                            freq,
+                            variant_type_code(vt),
+                        )
+                    )
+        if skipped:
+            LOG.warning(f"Skipped {skipped} record(s) of {dataset_id} on contigs that are not chromosomes of the Beacon API")
+        if unknown:
+            LOG.warning(f"Variant types of {dataset_id} without a code are stored as their nearest type with a code -> {dict(unknown)}")
+
+        return data_rows, mate_rows
+
+    async def _create_staging(self):
+        """Create session scoped staging tables used as targets of binary COPY.
+
+        Staging tables mirror the column types of the target tables, carry no indexes or
+        constraints and are emptied when the enclosing transaction commits.
+        """
+        for staging, table, columns in [
+            ("beacon_data_staging", "beacon_data_table", DATA_COLUMNS),
+            ("beacon_mate_staging", "beacon_mate_table", MATE_COLUMNS),
+        ]:
+            # Table and column names are the constants above
+            await self._conn.execute(
+                f"""CREATE TEMPORARY TABLE IF NOT EXISTS {staging}
+                    ON COMMIT DELETE ROWS
+                    AS SELECT {_column_list(columns)} FROM {table} WITH NO DATA"""  # nosec B608
+            )
+        self._staging = True
+
+    async def _copy_data_rows(self, rows):
+        """Stream rows to the data staging table and merge them into ``beacon_data_table``.
+
+        Returns the number of new call sites (distinct chromosome, start and reference of the dataset)
+        and of inserted variants. The data-modifying CTE does not change the snapshot of the outer query,
+        so ``NOT EXISTS`` only sees the call sites that were in the table before the chunk.
+        """
+        await self._conn.copy_records_to_table("beacon_data_staging", records=rows, columns=DATA_COLUMNS)
+        # Only the column and conflict constants of this module are interpolated
+        counts = await self._conn.fetchrow(
+            f"""WITH inserted AS (
+                    INSERT INTO beacon_data_table ({_column_list(DATA_COLUMNS)})
+                    SELECT {_column_list(DATA_COLUMNS)} FROM beacon_data_staging
+                    ON CONFLICT ({DATA_CONFLICT}) DO NOTHING
+                    RETURNING datasetId, chromosome, start, reference)
+                SELECT (SELECT count(*) FROM (SELECT DISTINCT datasetId, chromosome, start, reference FROM inserted) i
+                        WHERE NOT EXISTS (SELECT 1 FROM beacon_data_table d
+                                          WHERE d.datasetId=i.datasetId AND d.chromosome=i.chromosome
+                                          AND d.start=i.start AND d.reference=i.reference)) AS calls,
+                       (SELECT count(*) FROM inserted) AS variants"""  # nosec B608
+        )
+        return counts["calls"], counts["variants"]
+
+    async def _copy_rows(self, staging, table, columns, conflict, rows):
+        """Stream rows to a staging table with binary COPY and merge them into the target table."""
+        await self._conn.copy_records_to_table(staging, records=rows, columns=columns)
+        # Table, column and conflict names are constants of this module, rows are only passed to COPY
+        await self._conn.execute(
+            f"""INSERT INTO {table} ({_column_list(columns)})
+                SELECT {_column_list(columns)} FROM {staging}
+                ON CONFLICT ({conflict}) DO NOTHING"""  # nosec B608
+        )
+
+    async def insert_variants(self, dataset_id, variants, min_ac):
+        """Insert variant data to the database."""
+        LOG.info(f"Received {len(variants)} variants for insertion to {dataset_id}")
+        await self.insert_rows(dataset_id, *self._variant_rows(dataset_id, variants, min_ac))
+
+    async def insert_rows(self, dataset_id, data_rows, mate_rows, checkpoint=None, retries=1, backoff=1.0, swap=False):
+        """Insert unpacked variant rows to the database.
+
+        Rows of a chunk are loaded with binary COPY into staging tables and merged
+        into ``beacon_data_table`` and ``beacon_mate_table`` with one statement each.
+        With ``swap`` rows are only copied to the swap tables of the dataset, see :meth:`swap_dataset`.
+        A ``checkpoint`` is committed in the same transaction as the rows, with the call and variant
+        counts of the chunk added to it, the resulting counts are returned.
+        Failed attempts are retried with exponential backoff, the last error is raised.
+        """
+        calls, variants = checkpoint[-2:] if checkpoint else (0, 0)
+        for attempt in range(1, retries + 1):
+            try:
+                if self._conn.is_closed():
+                    await self.connection()
+                    self._staging = False
+                if not self._staging:
+                    await self._create_staging()
+                # Insertions are committed when transaction is closed
+                async with self._conn.transaction():
+                    LOG.info(f"Insert {len(data_rows) + len(mate_rows)} variants into the database for {dataset_id}")
+                    new_calls, new_variants = 0, 0
+                    if swap:
+                        data_swap, mate_swap = swap_tables(dataset_id)
+                        await self._conn.copy_records_to_table(data_swap, records=data_rows, columns=DATA_COLUMNS)
+                        await self._conn.copy_records_to_table(mate_swap, records=mate_rows, columns=MATE_COLUMNS)
+                    else:
+                        if data_rows:
+                            new_calls, new_variants = await self._copy_data_rows(data_rows)
+                        # We Process Breakend Records into a different table for now
+                        if mate_rows:
+                            await self._copy_rows("beacon_mate_staging", "beacon_mate_table", MATE_COLUMNS, MATE_CONFLICT, mate_rows)
+                    if checkpoint:
+                        await self._save_checkpoint(dataset_id, (*checkpoint[:-2], calls + new_calls, variants + new_variants))
+
+                    LOG.debug("Variants have been inserted")
+                    return calls + new_calls, variants + new_variants
+            except Exception as e:
+                if attempt == retries:
+                    LOG.error(f"AN ERROR OCCURRED WHILE ATTEMPTING TO INSERT VARIANTS -> {e}")
+                    raise
+                delay = backoff * 2 ** (attempt - 1)
+                LOG.warning(f"Attempt {attempt} to insert variants failed, retrying in {delay}s -> {e}")
+                await asyncio.sleep(delay)
+
+    async def add_counts(self, dataset_id, calls, variants):
+        """Add loaded call and variant counts to ``beacon_dataset_counts_table``."""
+        LOG.info(f"Add {calls} calls and {variants} variants to the counts of {dataset_id}")
+        await self._conn.execute(
+            """UPDATE beacon_dataset_counts_table
+               SET callCount=coalesce(callCount, 0) + $2, variantCount=coalesce(variantCount, 0) + $3
+               WHERE datasetId=$1""",
+            dataset_id,
+            calls,
+            variants,
+        )
+
+    async def recount(self, dataset_id):
+        """Recompute the call and variant counts of a dataset and store them in ``beacon_dataset_counts_table``.
+
+        Grouping the variants of the dataset by call site is a single scan, which can be served
+        in chromosome and start order by the ``data_allele_conflict`` index.
+        """
+        LOG.info(f"Recount calls and variants of {dataset_id}")
+        counts = await self._conn.fetchrow(
+            """SELECT count(*) AS calls, coalesce(sum(n), 0) AS variants
+               FROM (SELECT count(*) AS n FROM beacon_data_table WHERE datasetId=$1
+                     GROUP BY chromosome, start, reference) t""",
+            dataset_id,
+        )
+        await self._conn.execute(
+            """UPDATE beacon_dataset_counts_table SET callCount=$2, variantCount=$3 WHERE datasetId=$1""",
+            dataset_id,
+            counts["calls"],
+            counts["variants"],
+        )
+        LOG.info(f"{dataset_id} has {counts['calls']} calls and {counts['variants']} variants")
+        return counts["calls"], counts["variants"]
+
+    async def create_swap_tables(self, dataset_id, resume=False):
+        """Create the swap tables a dataset is loaded into with ``beacon_init --swap``.
+
+        Swap tables are unlogged copies of the variant tables without indexes or constraints,
+        ``seq`` keeps the load order of the rows. Unless resuming, previous swap tables are dropped.
+        PostgreSQL empties unlogged tables after a crash, while the checkpoints of the committed chunks are kept,
+        so a load is only resumed into swap tables that hold rows, otherwise it starts from the beginning.
+        Returns whether the load is resumed.
+        """
+        LOG.info(f"Create swap tables for {dataset_id}")
+        if resume and not await self.swap_rows(dataset_id):
+            LOG.warning(f"Swap tables of {dataset_id} are missing or empty, as after a crash of the database, it is loaded from the beginning")
+            resume = False
+        for swap, table, columns in zip(swap_tables(dataset_id), ["beacon_data_table", "beacon_mate_table"], [DATA_COLUMNS, MATE_COLUMNS]):
+            if not resume:
+                await self._conn.execute(f"DROP TABLE IF EXISTS {swap}")
+            # Swap table names are built from a hex digest of the dataset id, never from the id itself
+            await self._conn.execute(
+                f"""CREATE UNLOGGED TABLE IF NOT EXISTS {swap}
+                    AS SELECT {_column_list(columns)} FROM {table} WITH NO DATA;
+                    ALTER TABLE {swap} ADD COLUMN IF NOT EXISTS seq BIGSERIAL"""  # nosec B608
+            )
+        return resume
+
+    async def swap_rows(self, dataset_id):
+        """Return whether the swap tables of a dataset exist and hold any rows."""
+        data_swap, mate_swap = swap_tables(dataset_id)
+        if not await self._conn.fetchval("SELECT to_regclass($1) IS NOT NULL AND to_regclass($2) IS NOT NULL", data_swap, mate_swap):
+            return False
+        # Swap table names are built from a hex digest of the dataset id
+        return await self._conn.fetchval(f"SELECT EXISTS (SELECT 1 FROM {data_swap}) OR EXISTS (SELECT 1 FROM {mate_swap})")  # nosec B608
+
+    async def swap_dataset(self, dataset_id):
+        """Replace the variants of a dataset with the contents of its swap tables.
+
+        Indexes on the swap tables are built once, after the whole dataset has been loaded.
+        The rows of the dataset are then deleted and the swap tables inserted, keeping the first
+        loaded row of each position and alleles, and of each ``mate_conflict`` key, within one transaction,
+        so queries see either the previous or the new dataset.
+        In a partitioned ``beacon_data_table`` the variants are inserted into a new partition of the dataset
+        beforehand, which replaces the previous partition in that transaction, see :meth:`replace_partition`.
+        """
+        data_swap, mate_swap = swap_tables(dataset_id)
+        LOG.info(f"Build indexes on swap tables of {dataset_id}")
+        await self._conn.execute(f"CREATE INDEX IF NOT EXISTS {data_swap}_key ON {data_swap} (chromosome, start, ({ALLELE_HASH}), seq)")
+        await self._conn.execute(f"CREATE INDEX IF NOT EXISTS {mate_swap}_key ON {mate_swap} (chromosome, mate, chromosomePos, matePos, seq)")
+        partitioned = await self.partitioned()
+        target = "beacon_data_table"
+        if partitioned:
+            target = f"{partition_name(dataset_id)}_swap"
+            LOG.info(f"Build the new partition of {dataset_id}")
+            await self._conn.execute(f"DROP TABLE IF EXISTS {target}")
+            await self.create_partitions(dataset_id, target)
+        # Swap and partition names are built from a hex digest of the dataset id, the rest are constants
+        insert = f"""INSERT INTO {target} ({_column_list(DATA_COLUMNS)})
+                     SELECT DISTINCT ON (chromosome, start, {ALLELE_HASH}) {_column_list(DATA_COLUMNS)}
+                     FROM {data_swap} ORDER BY chromosome, start, {ALLELE_HASH}, seq"""  # nosec B608
+        if partitioned:
+            inserted = await self._conn.execute(insert)
+        LOG.info(f"Swap variants of {dataset_id}")
+        async with self._conn.transaction():
+            if partitioned:
+                await self.replace_partition(dataset_id, target)
+            else:
+                await self._conn.execute("DELETE FROM beacon_data_table WHERE datasetId=$1", dataset_id)
+                inserted = await self._conn.execute(insert)
+            await self._conn.execute("DELETE FROM beacon_mate_table WHERE datasetId=$1", dataset_id)
+            await self._conn.execute(
+                f"""INSERT INTO beacon_mate_table ({_column_list(MATE_COLUMNS)})
+                    SELECT DISTINCT ON (chromosome, mate, chromosomePos, matePos) {_column_list(MATE_COLUMNS)}
+                    FROM {mate_swap} ORDER BY chromosome, mate, chromosomePos, matePos, seq"""  # nosec B608
+            )
+            await self._conn.execute(f"DROP TABLE {data_swap}, {mate_swap}")
+            await self.recount(dataset_id)
+        LOG.info(f"Variants of {dataset_id} have been swapped -> {inserted}")
+
+    async def drop_filters(self, dataset_id):
+        """Drop the Bloom filters of a dataset, so that it is queried in the database while it is being loaded."""
+        await self._conn.execute("DELETE FROM beacon_bloom_table WHERE datasetId=$1", dataset_id)
+
+    async def build_filters(self, dataset_id, fpr=FPR):
+        """Build the Bloom filters of a dataset from its variants, one per chromosome, see :mod:`beacon_api.utils.bloom`.
+
+        The variants are read in ``FILTER_ROWS`` at a time from the ``data_allele_conflict`` index, and the filters
+        of the dataset are replaced in one transaction. Returns the number of filters built.
+        Variants without an alternate allele have no ``alleleHash``, exact queries never match them and they are left out.
+        """
+        LOG.info(f"Build Bloom filters of {dataset_id} with a false positive rate of {fpr}")
+        counts = dict(
+            await self._conn.fetch(
+                "SELECT chromosome, count(*) FROM beacon_data_table WHERE datasetId=$1 AND alleleHash IS NOT NULL GROUP BY chromosome", dataset_id
+            )
+        )
+        filters = []
+        for chromosome in CHROMOSOME_CODES.values():
+            bloom = BloomFilter.for_capacity(counts.get(chromosome, 0), fpr)
+            if bloom.size:
+                async with self._conn.transaction():
+                    cursor = await self._conn.cursor(
+                        "SELECT start, alleleHash FROM beacon_data_table WHERE datasetId=$1 AND chromosome=$2 AND alleleHash IS NOT NULL",
+                        dataset_id,
+                        chromosome,
+                    )
+                    rows = await cursor.fetch(FILTER_ROWS)
+                    while rows:
+                        bloom.add(np.array([row[0] for row in rows]), np.array([row[1] for row in rows]))
+                        rows = await cursor.fetch(FILTER_ROWS)
+            filters.append((dataset_id, chromosome, bloom.size, bloom.hashes, counts.get(chromosome, 0), bloom.bits.tobytes()))
+        async with self._conn.transaction():
+            await self.drop_filters(dataset_id)
+            await self._conn.executemany(
+                """INSERT INTO beacon_bloom_table (datasetId, chromosome, size, hashes, variants, bits, updateDateTime)
+                   VALUES ($1, $2, $3, $4, $5, $6, now())""",
+                filters,
+            )
+        LOG.info(f"{len(filters)} Bloom filter(s) of {dataset_id} have been built ({sum(len(bloom[-1]) for bloom in filters) / 1024**2:.1f} MB)")
+        return len(filters)
+
+    async def drop_summary(self, dataset_id):
+        """Drop the summary of a dataset, so that it is queried in the database while it is being loaded."""
+        await self._conn.execute("DELETE FROM beacon_summary_table WHERE datasetId=$1", dataset_id)
+
+    async def build_summary(self, dataset_id):
+        """Summarise the variants of a dataset on each chromosome, see :mod:`beacon_api.utils.summary`.
+
+        Chromosomes without variants of the dataset are summarised too, with no variants, so that they are
+        told apart from datasets without a summary. Returns the number of variants summarised.
+        """
+        LOG.info(f"Build the summary of {dataset_id}")
+        async with self._conn.transaction():
+            await self.drop_summary(dataset_id)
+            summary = await self._conn.fetch(
+                """INSERT INTO beacon_summary_table (datasetId, chromosome, variants, minStart, maxStart, minEnd, maxEnd, variantTypes, updateDateTime)
+                   SELECT $1, c.chromosome, count(a.start), min(a.start), max(a.start), min(a.end), max(a.end),
+                   coalesce(array_agg(DISTINCT a.variantType) FILTER (WHERE a.variantType IS NOT NULL), '{}'), now()
+                   FROM unnest($2::smallint[]) c(chromosome)
+                   LEFT JOIN beacon_data_table a ON a.datasetId=$1 AND a.chromosome=c.chromosome
+                   GROUP BY c.chromosome
+                   RETURNING variants""",
+                dataset_id,
+                list(CHROMOSOME_CODES.values()),
+            )
+        variants = sum(row["variants"] for row in summary)
+        LOG.info(f"The summary of {dataset_id} has been built, {variants} variant(s)")
+        return variants
+
+    async def notify(self, dataset_id):
+        """Notify the beacon servers that a dataset has changed, see :mod:`beacon_api.utils.catalog`."""
+        await self._conn.execute("SELECT pg_notify($1, $2)", CATALOG_CHANNEL, dataset_id)
+
+    async def close(self):
+        """Close the database connection."""
+        try:
+            LOG.info("Mark the database connection to be closed")
+            if self._pool is None:
+                await self._conn.close()
+            else:
+                await self._pool.release(self._conn)
+            LOG.info("The database connection has been closed")
+        except Exception as e:
+            LOG.error(f"AN ERROR OCCURRED WHILE ATTEMPTING TO CLOSE DATABASE CONNECTION -> {e}")
+
+
+def connection_settings():
+    """Return the database connection settings from the environment."""
+    return {
+        "host": os.environ.get("DATABASE_URL", "localhost"),
+        "port": os.environ.get("DATABASE_PORT", "5432"),
+        "user": os.environ.get("DATABASE_USER", "beacon"),
+        "password": os.environ.get("DATABASE_PASSWORD", "beacon"),
+        "database": os.environ.get("DATABASE_NAME", "beacondb"),
+    }
+
+
+def datafile_index(datafile):
+    """Return the path of a tabix or CSI index of the datafile, if one exists."""
+    for extension in [".tbi", ".csi"]:
+        index = Path(f"{datafile}{extension}")
+        if index.is_file():
+            return index
+    return None
+
+
+def datafile_regions(vcf, region_size=0):
+    """Split the contigs of a datafile into regions that can be loaded independently.
+
+    Regions are ``(contig, start, end)`` tuples with 0-based, half-open coordinates.
+    By default a region covers a whole contig, if ``region_size`` is given contigs
+    are split into fixed-size regions of that many bases.
+    """
+    if not region_size:
+        return [(contig, 0, None) for contig in vcf.seqnames]
+    try:
+        lengths = vcf.seqlens
+    except AttributeError:
+        LOG.warning("No contig lengths found in datafile header, splitting datafile by contig")
+        return [(contig, 0, None) for contig in vcf.seqnames]
+    regions = []
+    for contig, length in zip(vcf.seqnames, lengths):
+        regions.extend((contig, start, min(start + region_size, length)) for start in range(0, length, region_size))
+    return regions
+
+
+def _table_suffix(dataset_id):
+    """Return a suffix for the names of the tables of a dataset."""
+    return hashlib.md5(dataset_id.encode("utf-8"), usedforsecurity=False).hexdigest()[:16]
+
+
+def swap_tables(dataset_id):
+    """Return the names of the data and mate swap tables of a dataset."""
+    suffix = _table_suffix(dataset_id)
+    return f"beacon_data_swap_{suffix}", f"beacon_mate_swap_{suffix}"
+
+
+def partition_name(dataset_id):
+    """Return the name of the partition of a dataset in a partitioned ``beacon_data_table``."""
+    return f"beacon_data_part_{_table_suffix(dataset_id)}"
+
+
+def region_name(region):
+    """Return the name of a region used in loader checkpoints, empty for a whole datafile."""
+    if region is None:
+        return ""
+    contig, start, end = region
+    return contig if end is None else f"{contig}:{start + 1}-{end}"
+
+
+def region_records(vcf, region):
+    """Read records starting inside a region.
+
+    Records spanning a region boundary are returned by the index for both regions,
+    they are only kept in the region where they start.
+    """
+    contig, start, end = region
+    if end is None:
+        return vcf(contig)
+    return (variant for variant in vcf(f"{contig}:{start + 1}-{end}") if start <= variant.start < end)
+
+
+async def _load_region(datafile, region, dataset_id, samples, options):
+    """Load one region of a datafile over a dedicated database connection."""
+    db = BeaconDB()
+    await db.connection()
+    vcf = VCF(datafile, samples=samples)
+    try:
+        return await db.load_datafile(vcf, datafile, dataset_id, region=region, **options)
+    finally:
+        await db.close()
+
+
+def load_region(datafile, region, dataset_id, samples, options):
+    """Run the loading of one region in a worker process, returning the region and its counts."""
+    return region, asyncio.run(_load_region(datafile, region, dataset_id, samples, options))
+
+
+async def load_regions(datafile, regions, dataset_id, samples, workers, options):
+    """Load regions of an indexed datafile in parallel using a pool of worker processes.
+
+    Each worker parses its region and writes it through its own database connection.
+    As a region always holds all the records of a position, the loaded rows are the same
+    as when loading the datafile serially. ``options`` are passed to :meth:`BeaconDB.load_datafile`.
+    Returns the call and variant counts and the rows written of all regions.
+    """
+    LOG.info(f"Load {len(regions)} region(s) of {datafile} with {workers} worker(s)")
+    loop = asyncio.get_running_loop()
+    failures = []
+    totals = (0, 0, 0)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        tasks = [loop.run_in_executor(executor, load_region, datafile, region, dataset_id, samples, options) for region in regions]
+        for task in asyncio.as_completed(tasks):
+            try:
+                region, counts = await task
+                totals = tuple(map(sum, zip(totals, counts)))
+                LOG.info(f"Region {region_name(region)} of {datafile} has been processed")
+            except Exception as e:
+                LOG.error(f"AN ERROR OCCURRED WHILE LOADING A REGION OF THE DATAFILE -> {e}")
+                failures.append(str(e))
+    if failures:
+        raise LoadError(f"{len(failures)} of {len(regions)} region(s) of {datafile} failed to load:\n" + "\n".join(failures))
+    return totals
+
+
+async def load_dataset(db, datafile, metafile, samples, workers, region_size, options, bloom_fpr=FPR):
+    """Load the metadata and the variants of one datafile.
+
+    Indexed datafiles are split by region into ``workers`` worker processes, see :func:`load_regions`.
+    The summary and the Bloom filters of the dataset are dropped during the load and built again at the end,
+    the filters with a false positive rate of ``bloom_fpr``, or not at all if it is 0.
+    The beacon servers are notified of the dataset when it has been dropped and when it has been loaded.
+    Returns the dataset id, the number of rows written and the time it took in seconds.
+    """
+    started = time.monotonic()
+    vcf = VCF(datafile, samples=samples)
+
+    # Insert dataset metadata into the database, prior to inserting actual variant data
+    dataset_id = await db.load_metadata(vcf, metafile, datafile)
+    if dataset_id is None:
+        raise LoadError(f"Could not load the metadata of {datafile} from {metafile}")
+
+    await db.drop_summary(dataset_id)
+    await db.drop_filters(dataset_id)
+    await db.notify(dataset_id)
+    if options["swap"]:
+        options = {**options, "resume": await db.create_swap_tables(dataset_id, options["resume"])}
+    elif await db.partitioned():
+        await db.create_partitions(dataset_id)
+    if workers > 1 and datafile_index(datafile):
+        regions = datafile_regions(vcf, region_size)
+        calls, variants, rows = await load_regions(datafile, regions, dataset_id, samples, workers, options)
+    else:
+        if workers > 1:
+            LOG.warning(f"No tabix or CSI index found for {datafile}, loading with a single worker")
+        calls, variants, rows = await db.load_datafile(vcf, datafile, dataset_id, **options)
+    # Swapped datasets are recounted by swap_dataset, resumed loads may repeat committed counts
+    if options["swap"]:
+        await db.swap_dataset(dataset_id)
+    elif options["resume"]:
+        await db.recount(dataset_id)
+    else:
+        await db.add_counts(dataset_id, calls, variants)
+    await db.build_summary(dataset_id)
+    if bloom_fpr:
+        await db.build_filters(dataset_id, bloom_fpr)
+    await db.notify(dataset_id)
+    return dataset_id, rows, time.monotonic() - started
+
+
+async def setup_tables(db, partitioned=False):
+    """Create the tables that are missing, the allele hash and the indexes of the variant queries.
+
+    With ``partitioned``, a missing ``beacon_data_table`` is created partitioned, see ``data/partitioned.sql``.
+    """
+    # Check that desired tables exist (missing tables are returned)
+    tables = await db.check_tables(
+        ["beacon_dataset_table", "beacon_data_table", "beacon_dataset_counts_table", "beacon_loader_state_table", "beacon_bloom_table", "beacon_summary_table"]
+    )
+
+    # If some tables are missing, run init.sql to recover them
+    if len(tables) > 0:
+        if partitioned:
+            await db.create_tables(os.environ.get("PARTITIONED_SCHEMA", "data/partitioned.sql"))
+        await db.create_tables(os.environ.get("TABLES_SCHEMA", "data/init.sql"))
+    if partitioned and not await db.partitioned():
+        LOG.warning("beacon_data_table already exists and is not partitioned, variants are loaded into it as is")
+    await db.update_schema()
+
+
+def read_manifest(manifest):
+    """Read the datasets of a manifest file.
+
+    A manifest is a JSON list of objects with a ``datafile``, a ``metadata`` file and optional ``samples``.
+    Relative paths are resolved against the directory of the manifest.
+    """
+    with open(manifest, "r") as manifest_file:
+        entries = ujson.load(manifest_file)
+    if not isinstance(entries, list):
+        raise LoadError(f"Manifest {manifest} must contain a list of datasets")
+    base = Path(manifest).parent
+    datasets = []
+    for i, entry in enumerate(entries):
+        if not isinstance(entry, dict) or "datafile" not in entry or "metadata" not in entry:
+            raise LoadError(f"Entry {i} of manifest {manifest} must have a datafile and a metadata file")
+        datafile, metafile = base / entry["datafile"], base / entry["metadata"]
+        for path in [datafile, metafile]:
+            if not path.is_file():
+                raise LoadError(f"Could not find {path} of entry {i} in manifest {manifest}")
+        datasets.append((str(datafile), str(metafile), entry.get("samples")))
+    return datasets
+
+
+async def load_manifest(manifest, concurrency, workers, region_size, options, partitioned=False, bloom_fpr=FPR):
+    """Load the datasets of a manifest, at most ``concurrency`` at a time over a shared connection pool.
+
+    Every dataset is loaded even if others fail, a :class:`LoadError` listing the failed datasets is raised at the end.
+    """
+    datasets = read_manifest(manifest)
+    LOG.info(f"Load {len(datasets)} dataset(s) from {manifest}, {concurrency} at a time")
+    pool = await asyncpg.create_pool(min_size=1, max_size=concurrency, **connection_settings())
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def load(datafile, metafile, samples):
+        async with semaphore:
+            db = BeaconDB(pool)
+            await db.connection()
+            try:
+                dataset_id, rows, elapsed = await load_dataset(db, datafile, metafile, samples, workers, region_size, options, bloom_fpr)
+                LOG.info(f"Dataset {dataset_id} from {datafile}: {rows} rows in {elapsed:.2f}s ({rows / elapsed if elapsed else 0:.0f} rows/s)")
+            finally:
+                await db.close()
+
+    try:
+        db = BeaconDB(pool)
+        await db.connection()
+        try:
+            await setup_tables(db, partitioned)
+        finally:
+            await db.close()
+        results = await asyncio.gather(
+            *[load(datafile, metafile, samples.split(",") if samples else None) for datafile, metafile, samples in datasets], return_exceptions=True
+        )
+    finally:
+        await pool.close()
+    failures = [f"{datafile} with {metafile}: {result}" for (datafile, metafile, _), result in zip(datasets, results) if isinstance(result, BaseException)]
+    for failure in failures:
+        LOG.error(f"AN ERROR OCCURRED WHILE LOADING A DATASET OF THE MANIFEST -> {failure}")
+    if failures:
+        raise LoadError(f"{len(failures)} of {len(datasets)} dataset(s) of {manifest} failed to load:\n" + "\n".join(failures))
+    LOG.info(f"All {len(datasets)} dataset(s) of {manifest} have been loaded")
+
+
+async def init_beacon_db(arguments=None):
+    """Run database operations here."""
+    # Fetch command line arguments
+    args = parse_arguments(arguments)
+    validate_arguments(args)
+
+    workers = int(args.workers)
+    options = {
+        "min_ac": int(args.min_allele_count),
+        "n": int(args.chunk_rows),
+        "max_bytes": int(args.chunk_memory) * 1024**2,
+        "queue_depth": int(args.queue_depth),
+        "resume": args.resume,
+        "swap": args.swap,
+    }
+
+    # Load many datasets over a shared connection pool
+    if args.manifest:
+        try:
+            await load_manifest(args.manifest, int(args.concurrency), workers, int(args.region_size), options, args.partitioned, float(args.bloom_fpr))
+        except Exception as e:
+            sys.exit(f"{e}")
+        return
+
+    # Initialise the database connection
+    db = BeaconDB()
+
+    # Connect to the database
+    await db.connection()
+
+    # Only recompute the counts of an existing dataset
+    if args.recount:
+        try:
+            await db.recount(args.recount)
+        finally:
+            await db.close()
+        return
+
+    await setup_tables(db, args.partitioned)
+
+    # Insert data into the database, indexed datafiles can be split by region into worker processes
+    samples = args.samples.split(",") if args.samples else None
+    try:
+        await load_dataset(db, args.datafile, args.metadata, samples, workers, int(args.region_size), options, float(args.bloom_fpr))
+    except Exception as e:
+        await db.close()
+        sys.exit(f"{e}")
+
+    # Close the database connection
+    await db.close()
+
+
+def valid_rate(value):
+    """Return True if a string is a number of at least 0 and less than 1."""
+    try:
+        return 0 <= float(value) < 1
+    except ValueError:
+        return False
+
+
+def validate_arguments(arguments):
+    """Check that given arguments are valid."""
+    if arguments.recount:
+        return
+    if arguments.manifest:
+        if not Path(arguments.manifest).is_file():
+            sys.exit(f"Could not find manifest file: {arguments.manifest}")
+        if not arguments.concurrency.isdigit() or int(arguments.concurrency) < 1:
+            sys.exit(f"Concurrency --concurrency must be a positive integer, received: {arguments.concurrency}")
+    else:
+        if arguments.datafile is None or arguments.metadata is None:
+            sys.exit("A datafile and a metadata file are required, unless loading a --manifest or recounting a dataset with --recount")
+        if not Path(arguments.datafile).is_file():
+            sys.exit(f"Could not find datafile: {arguments.datafile}")
+        if not Path(arguments.metadata).is_file():
+            sys.exit(f"Could not find metadata file: {arguments.metadata}")
+    if not arguments.min_allele_count.isdigit():
+        sys.exit(f"Minimum allele count --min_allele_count must be a positive integer, received: {arguments.min_allele_count}")
+    if not arguments.workers.isdigit() or int(arguments.workers) < 1:
+        sys.exit(f"Number of workers --workers must be a positive integer, received: {arguments.workers}")
+    if not arguments.queue_depth.isdigit() or int(arguments.queue_depth) < 1:
+        sys.exit(f"Queue depth --queue_depth must be a positive integer, received: {arguments.queue_depth}")
+    if not arguments.chunk_rows.isdigit() or int(arguments.chunk_rows) < 1:
+        sys.exit(f"Chunk rows --chunk_rows must be a positive integer, received: {arguments.chunk_rows}")
+    if not arguments.chunk_memory.isdigit():
+        sys.exit(f"Chunk memory --chunk_memory must be a positive integer, received: {arguments.chunk_memory}")
+    if not arguments.region_size.isdigit():
+        sys.exit(f"Region size --region_size must be a positive integer, received: {arguments.region_size}")
+    if not valid_rate(arguments.bloom_fpr):
+        sys.exit(f"Bloom filter false positive rate --bloom_fpr must be at least 0 and less than 1, received: {arguments.bloom_fpr}")
+
+
+def parse_arguments(arguments):
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="""Load datafiles with associated metadata
+                                     into the beacon database. See example data and metadata files
+                                     in the /data directory."""
+    )
+    parser.add_argument("datafile", nargs="?", help=".vcf file containing variant information")
+    parser.add_argument("metadata", nargs="?", help=".json file containing metadata associated to datafile")
+    parser.add_argument("--samples", default=None, help="comma separated string of samples to process. EXPERIMENTAL")
+    parser.add_argument("--min_allele_count", default="1", help="minimum allele count can be raised to ignore rare variants. Default value is 1")
+    parser.add_argument("--workers", default="1", help="number of worker processes loading an indexed (.tbi/.csi) datafile by region. Default value is 1")
+    parser.add_argument(
+        "--region_size", default="0", help="split contigs into regions of this many bases when loading with workers. Default is a region per contig"
+    )
+    parser.add_argument("--chunk_rows", default="1000", help="maximum number of rows parsed and inserted in one chunk. Default value is 1000")
+    parser.add_argument("--chunk_memory", default="16", help="maximum estimated memory of a parsed chunk in megabytes, 0 for no limit. Default value is 16")
+    parser.add_argument("--queue_depth", default="4", help="number of parsed chunks waiting to be written to the database. Default value is 4")
+    parser.add_argument("--resume", action="store_true", help="skip the chunks committed by a previous, interrupted load of the datafile")
+    parser.add_argument("--swap", action="store_true", help="load into swap tables and replace all variants of the dataset with them at the end")
+    parser.add_argument(
+        "--bloom_fpr", default=str(FPR), help=f"false positive rate of the Bloom filters of the dataset, 0 for no filters. Default value is {FPR}"
+    )
+    parser.add_argument("--partitioned", action="store_true", help="partition beacon_data_table by dataset and chromosome when creating the tables")
+    parser.add_argument("--manifest", default=None, help=".json file listing datafile and metadata pairs of datasets to load instead of a single datafile")
+    parser.add_argument("--concurrency", default="2", help="number of datasets of a --manifest loaded at a time. Default value is 2")
+    parser.add_argument("--recount", metavar="DATASET_ID", default=None, help="recompute callCount and variantCount of a loaded dataset and exit")
+    return parser.parse_args(arguments)
+
+
+def main():
+    """Run the beacon_init script."""
+    # TO DO add this to setup to run from command line
+    # allow arguments to be passed from command line
+    if sys.version_info >= (3, 7):
+        asyncio.run(init_beacon_db())
+    else:
+        asyncio.get_event_loop().run_until_complete(init_beacon_db())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""Query Result Cache.
+
+The dataset responses of ``/query`` requests are cached by the server, keyed by the allele request, normalised by
+:func:`result_key`, and the accessible datasets and access levels it was resolved to. Repeated requests, such as the
+sample queries of the info endpoint, are answered from memory without a database connection.
+
+The cache keeps the most recently used results up to ``RESULT_CACHE_MB`` megabytes (64 by default, 0 for no cache),
+measured as the size of their JSON, each for at most ``RESULT_CACHE_TTL`` seconds (60 by default).
+The results of the datasets ``beacon_init`` notifies a change of are dropped, see :mod:`beacon_api.utils.catalog`.
+
+Concurrent requests for results that are not cached share one lookup, so that a query fanned out by many clients at
+once takes one database connection. Requests only share a lookup if they share its key, and with it the datasets and
+access levels they were resolved to.
+The hit ratio and size of the cache are returned by the ``/metrics`` endpoint.
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+import ujson
+
+from .logging import LOG
+
+# Fields of a request that select its dataset responses, besides the accessible datasets
+REQUEST_FIELDS = ["assemblyId", "referenceName", "start", "end", "startMin", "startMax", "endMin", "endMax"]
+REQUEST_FIELDS += ["referenceBases", "alternateBases", "variantType", "mateName"]
+
+
+def result_key(request: Dict, datasets: List[str], access_type: List[str]) -> Tuple[Hashable, ...]:
+    """Construct the key of the results of a request for accessible datasets of access levels.
+
+    Hits and misses are queried together for ``MISS`` and ``ALL``, which share their results,
+    ``NONE`` only queries which datasets have hits, without their variants.
+    """
+    include = request.get("includeDatasetResponses", "NONE")
+    responses = "ALL" if include == "MISS" else include
+    return tuple(request.get(field) for field in REQUEST_FIELDS) + (responses, tuple(sorted(datasets)), tuple(sorted(access_type)))
+
+
+class ResultCache:
+    """Least recently used query results of at most ``max_bytes``, for ``ttl`` seconds."""
+
+    def __init__(self, max_bytes: int, ttl: float) -> None:
+        """Create an empty cache."""
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # Results by key with the time they expire, their size and datasets, least recently used first
+        self.entries: "OrderedDict[Hashable, Tuple[float, int, List[Dict], Tuple[str, ...]]]" = OrderedDict()
+        # Keys of the results of each dataset
+        self.keys: Dict[str, Set[Hashable]] = {}
+        self.bytes = 0
+        # Incremented by every invalidation, so that results found before an invalidation are not cached
+        self.version = 0
+        # Lookups in flight by key, shared by the requests of the key
+        self.flights: Dict[Hashable, "asyncio.Future[List[Dict]]"] = {}
+        self.counts = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def get(self, key: Hashable) -> Optional[List[Dict]]:
+        """Return the results of a key, None if they are not cached.
+
+        The results are shared by all the requests they answer, and must not be modified.
+        """
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] < time.monotonic():
+            self._drop(key)
+            self.counts["expirations"] += 1
+            entry = None
+        if entry is None:
+            self.counts["misses"] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.counts["hits"] += 1
+        return entry[2]
+
+    def put(self, key: Hashable, results: List[Dict], datasets: List[str], version: int) -> None:
+        """Cache the results of a key for the datasets they were found in, evicting the least recently used results.
+
+        Results are only cached if the cache has not been invalidated since ``version``, read before they were found.
+        """
+        size = len(ujson.dumps(results))
+        if size > self.max_bytes or version != self.version:
+            return
+        if key in self.entries:
+            self._drop(key)
+        self.entries[key] = (time.monotonic() + self.ttl, size, results, tuple(datasets))
+        self.bytes += size
+        for dataset in datasets:
+            self.keys.setdefault(dataset, set()).add(key)
+        while self.bytes > self.max_bytes:
+            self._drop(next(iter(self.entries)))
+            self.counts["evictions"] += 1
+
+    async def find(self, key: Hashable, datasets: List[str], lookup: Callable[[], Awaitable[List[Dict]]]) -> List[Dict]:
+        """Return the results of a key, looking them up in the datasets if they are not cached.
+
+        A lookup is awaited by every request of its key until it completes, and runs as a task of its own,
+        so that it completes for the other requests when the request that started it is cancelled.
+        """
+        results = self.get(key)
+        if results is not None:
+            return results
+        flight = self.flights.get(key)
+        if flight is None:
+            flight = asyncio.ensure_future(self._lookup(key, datasets, lookup))
+            flight.add_done_callback(lambda done: self._landed(key, done))
+            self.flights[key] = flight
+        else:
+            self.counts["coalesced"] += 1
+        return await asyncio.shield(flight)
+
+    async def _lookup(self, key: Hashable, datasets: List[str], lookup: Callable[[], Awaitable[List[Dict]]]) -> List[Dict]:
+        """Look up the results of a key and cache them."""
+        version = self.version
+        results = await lookup()
+        self.put(key, results, datasets, version)
+        return results
+
+    def _landed(self, key: Hashable, flight: "asyncio.Future[List[Dict]]") -> None:
+        """Forget a completed lookup."""
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+        # The requests awaiting a failed lookup may all have been cancelled
+        if not flight.cancelled() and flight.exception() is not None:
+            LOG.debug(f"Lookup of {key} failed -> {flight.exception()}")
+
+    def _drop(self, key: Hashable) -> None:
+        """Drop the results of a key."""
+        _, size, _, datasets = self.entries.pop(key)
+        self.bytes -= size
+        for dataset in datasets:
+            keys = self.keys[dataset]
+            keys.discard(key)
+            if not keys:
+                del self.keys[dataset]
+
+    def invalidate(self, dataset: str) -> None:
+        """Drop the results of a dataset, later requests do not share the lookups in flight."""
+        self.version += 1
+        self.flights.clear()
+        keys = list(self.keys.get(dataset, ()))
+        for key in keys:
+            self._drop(key)
+        self.counts["invalidations"] += len(keys)
+        LOG.debug(f"Dropped {len(keys)} cached result(s) of {dataset}.")
+
+    def metrics(self) -> Dict:
+        """Return the hit ratio, size and counts of the cache."""
+        requests = self.counts["hits"] + self.counts["misses"]
+        return {
+            **self.counts,
+            "hitRatio": self.counts["hits"] / requests if requests else 0.0,
+            "entries": len(self.entries),
+            "inFlight": len(self.flights),
+            "bytes": self.bytes,
+            "maxBytes": self.max_bytes,
+        }
+
+
+# Result cache of the server
+RESULTS = ResultCache(int(float(os.environ.get("RESULT_CACHE_MB", 64)) * 1024**2), float(os.environ.get("RESULT_CACHE_TTL", 60)))
@@ -0,0 +1,84 @@
+"""Prepared Statements.
+
+Queries that are run on every request are registered by name with :func:`register`.
+The registered statements are prepared once on every new connection of the database pool,
+in the ``init`` hook set by :func:`beacon_api.conf.config.init_db_pool`, and are reused by
+:func:`fetch_statement` for as long as the connection lives, so PostgreSQL does not have to parse
+and plan them on each request. Statements registered after a connection has been opened are
+prepared on that connection the first time they are used.
+
+The statements are kept in the statement cache of the connection rather than as
+:class:`asyncpg.prepared_stmt.PreparedStatement` objects, which can not be used any more once
+their connection has been released back to the pool. The cache holds ``STATEMENT_CACHE_SIZE``
+statements and evicts the least recently used one beyond that, which is followed here by name for
+each connection, so that the number of times each statement has been prepared and reused,
+counted in ``PREPARE_COUNTS`` and ``REUSE_COUNTS``, includes the statements asyncpg prepares again.
+All queries with arguments on the connections of the pool are registered, so the cache holds only registered statements.
+"""
+
+from collections import Counter, OrderedDict
+from typing import Dict
+
+import asyncpg
+
+from .logging import LOG
+
+# Size of the statement cache of the connections of the pool
+STATEMENT_CACHE_SIZE = 100
+# Registered queries by name
+STATEMENTS: Dict[str, str] = {}
+# Names of the prepared statements by server process id of their connection, least recently used first
+PREPARED: Dict[int, OrderedDict] = {}
+PREPARE_COUNTS: Counter = Counter()
+REUSE_COUNTS: Counter = Counter()
+
+
+def register(name: str, query: str) -> str:
+    """Register a query to be prepared on the connections of the pool, returning its name."""
+    STATEMENTS[name] = query
+    return name
+
+
+async def prepare(connection, name: str) -> None:
+    """Prepare a registered statement in the statement cache of a connection."""
+    # A statement run for no arguments is parsed and cached as by Connection.fetch(), but not executed
+    await connection.executemany(STATEMENTS[name], [])
+    prepared = PREPARED.setdefault(connection.get_server_pid(), OrderedDict())
+    prepared[name] = None
+    if len(prepared) > STATEMENT_CACHE_SIZE:
+        prepared.popitem(last=False)
+    PREPARE_COUNTS[name] += 1
+
+
+async def prepare_statements(connection) -> None:
+    """Prepare all registered statements on a new connection of the pool.
+
+    Prepared statements of a previous connection with the same server process id are discarded,
+    and the statements of the connection are forgotten once it is closed.
+    Statements that can not be prepared, on tables or columns that have not been created, are skipped
+    and prepared when they are first used.
+    """
+    pid = connection.get_server_pid()
+    PREPARED[pid] = OrderedDict()
+    connection.add_termination_listener(lambda connection: PREPARED.pop(pid, None))
+    for name in STATEMENTS:
+        try:
+            await prepare(connection, name)
+        except asyncpg.PostgresError as e:
+            # A database without some of the tables or columns of the statement still serves the others
+            LOG.warning(f"Statement {name} could not be prepared on connection {pid}, it is prepared when used -> {e}")
+    # Statements are parsed and described without a Sync when their types are introspected, which leaves the
+    # implicit transaction open until the next query, a serializable transaction can not begin in it
+    await connection.execute("SELECT 1")
+    LOG.debug(f"Prepared {len(PREPARED[pid])} statement(s) on connection {pid}.")
+
+
+async def fetch_statement(connection, name: str, *args):
+    """Run a registered statement on a connection, preparing it only if it is not in its statement cache."""
+    prepared = PREPARED.get(connection.get_server_pid(), OrderedDict())
+    if name in prepared:
+        prepared.move_to_end(name)
+        REUSE_COUNTS[name] += 1
+    else:
+        await prepare(connection, name)
+    return await connection.fetch(STATEMENTS[name], *args)
@@ -0,0 +1,117 @@
+"""Position Summaries of Datasets.
+
+``beacon_init`` summarises the variants of each dataset on each chromosome in ``beacon_summary_table``:
+their number, the range of their starts and of their ends, and the variant types present.
+Variant queries prune the datasets whose summary rules out every variant of the query before querying
+the database, datasets pruned from ``MISS`` and ``ALL`` queries are returned as misses without querying them.
+
+Summaries are loaded by the server, with the access type and assembly of their dataset, when they are first needed,
+and loaded again after ``SUMMARY_TTL`` seconds (300 by default) or once ``beacon_init`` notifies a change of their dataset.
+The summaries of a dataset are dropped when it is being loaded, and built again once it has been loaded.
+Datasets without a summary are always queried.
+"""
+
+import math
+import os
+import time
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+import asyncpg
+
+from .logging import LOG
+from .statements import fetch_statement, register
+
+# Seconds a loaded summary is used before it is loaded again
+SUMMARY_TTL = int(os.environ.get("SUMMARY_TTL", 300))
+# Summaries by dataset and chromosome code, with the time they were loaded, None for datasets without summaries
+SUMMARIES: Dict[Tuple[str, int], Tuple[float, Optional["DatasetSummary"]]] = {}
+
+
+class DatasetSummary(NamedTuple):
+    """Variants of a dataset on a chromosome, with the access type and assembly of the dataset."""
+
+    access_type: str
+    assembly_id: str
+    variants: int
+    min_start: Optional[int]
+    max_start: Optional[int]
+    min_end: Optional[int]
+    max_end: Optional[int]
+    variant_types: FrozenSet[int]
+
+    def rules_out(self, assembly_id: str, parameters: Dict) -> bool:
+        """Return True if no variant can match a variant query, given by its assembly and parameters.
+
+        The parameters are named as in :data:`beacon_api.utils.data_query.CONDITIONS`, None for those not given.
+        """
+        if self.assembly_id != assembly_id or self.variants == 0:
+            return True
+        start, end = parameters.get("start"), parameters.get("end")
+        if start is not None and not self.min_start <= start <= self.max_start:
+            return True
+        if parameters.get("startMin") is not None and self.max_start < parameters["startMin"]:
+            return True
+        if parameters.get("startMax") is not None and self.min_start > parameters["startMax"]:
+            return True
+        ends = [name for name in ["end", "endMin", "endMax"] if parameters.get(name) is not None]
+        if ends and self.min_end is None:
+            return True
+        if end is not None and not self.min_end <= end <= self.max_end:
+            return True
+        if parameters.get("endMin") is not None and self.max_end < parameters["endMin"]:
+            return True
+        if parameters.get("endMax") is not None and self.min_end > parameters["endMax"]:
+            return True
+        return parameters.get("variantType") is not None and parameters["variantType"] not in self.variant_types
+
+
+def summary_of(record) -> DatasetSummary:
+    """Construct the summary of a record of ``beacon_summary_table`` joined with ``beacon_dataset_table``."""
+    return DatasetSummary(
+        access_type=record["accesstype"],
+        assembly_id=record["assemblyid"],
+        variants=record["variants"],
+        min_start=record["minstart"],
+        max_start=record["maxstart"],
+        min_end=record["minend"],
+        max_end=record["maxend"],
+        variant_types=frozenset(record["varianttypes"] or []),
+    )
+
+
+register(
+    "dataset_summaries",
+    """SELECT s.datasetId, d.accessType, d.assemblyId, s.variants, s.minStart, s.maxStart,
+       s.minEnd, s.maxEnd, s.variantTypes
+       FROM beacon_summary_table s, beacon_dataset_table d
+       WHERE s.datasetId=d.datasetId AND s.datasetId = any($1::varchar[]) AND s.chromosome=$2""",
+)
+
+
+async def fetch_summaries(connection, datasets: List[str], chromosome: int) -> Dict[str, Optional[DatasetSummary]]:
+    """Return the summaries of datasets on a chromosome, loading those not loaded in the last ``SUMMARY_TTL`` seconds."""
+    now = time.monotonic()
+    missing = [dataset for dataset in datasets if SUMMARIES.get((dataset, chromosome), (-math.inf, None))[0] < now - SUMMARY_TTL]
+    if missing:
+        try:
+            # A savepoint keeps the transaction of the request usable on databases without summaries
+            async with connection.transaction():
+                records = await fetch_statement(connection, "dataset_summaries", missing, chromosome)
+        except asyncpg.UndefinedTableError:
+            LOG.warning("beacon_summary_table has not been created, variants are queried without dataset summaries.")
+            records = []
+        loaded = {record["datasetid"]: summary_of(record) for record in records}
+        for dataset in missing:
+            SUMMARIES[(dataset, chromosome)] = (now, loaded.get(dataset))
+    return {dataset: SUMMARIES[(dataset, chromosome)][1] for dataset in datasets}
+
+
+async def prune_datasets(connection, datasets: List[str], chromosome: int, assembly_id: str, parameters: Dict) -> Tuple[List[str], Dict[str, DatasetSummary]]:
+    """Split datasets into those to query for a variant query and the summaries of those pruned.
+
+    Datasets without summaries are always queried.
+    """
+    summaries = await fetch_summaries(connection, datasets, chromosome)
+    pruned = {dataset: summary for dataset, summary in summaries.items() if summary is not None and summary.rules_out(assembly_id, parameters)}
+    LOG.debug(f"Dataset summaries pruned {len(pruned)} of {len(datasets)} dataset(s).")
+    return [dataset for dataset in datasets if dataset not in pruned], pruned
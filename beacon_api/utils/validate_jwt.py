@@ -66,7 +66,7 @@ def token_auth() -> Callable:
 
     @web.middleware
     async def token_middleware(request: web.Request, handler):
-        if request.path in ["/query"] and "Authorization" in request.headers:
+        if request.path in ["/query", "/query/batch"] and "Authorization" in request.headers:
             _, obj = await parse_request_object(request)
             try:
                 # The second item is the token.
@@ -1,4 +1,8 @@
-CREATE TYPE access_levels AS enum('CONTROLLED', 'REGISTERED', 'PUBLIC');
+DO $$ BEGIN
+    CREATE TYPE access_levels AS enum('CONTROLLED', 'REGISTERED', 'PUBLIC');
+EXCEPTION
+    WHEN duplicate_object THEN NULL;
+END $$;
 
 CREATE TABLE IF NOT EXISTS beacon_dataset_table (
     index SERIAL,
@@ -16,9 +20,9 @@ CREATE TABLE IF NOT EXISTS beacon_dataset_table (
 );
 
 /*
-The values in this table take a long time to compute on large datasets
-Most likely these values do not change once the dataset is loaded so one
-could compute the values and UPDATE the table once the all dataset is inserted
+The values in this table take a long time to compute on large datasets,
+beacon_init counts them while inserting the variants and adds them at the end of a load.
+beacon_init --recount DATASET_ID recomputes them for a dataset that is already loaded:
 
 callcount: SELECT count(*) FROM (SELECT distinct(datasetId, chromosome, reference, start)
                                  FROM beacon_data_table) t;
@@ -32,22 +36,43 @@ CREATE TABLE IF NOT EXISTS beacon_dataset_counts_table (
     variantCount BIGINT DEFAULT NULL
 );
 
+/*
+chromosome, variantType and aggregatedVariantType are codes, the positions of their names in the lists below,
+see beacon_api.utils.codes. beacon_init converts the names of databases initialised before them into codes.
+Fixed width columns come first, widest first, so that rows are stored without alignment padding.
+
+chromosome: 1-22, X, Y, MT
+variantType, aggregatedVariantType: DEL, INS, DUP, INV, CNV, SNP, MNP, DUP:TANDEM, DEL:ME, INS:ME, BND, INDEL, SV, UNKNOWN
+*/
 CREATE TABLE IF NOT EXISTS beacon_data_table (
+    alleleHash BIGINT GENERATED ALWAYS AS (('x' || left(md5(reference || '>' || alternate), 16))::bit(64)::bigint) STORED,
     index SERIAL,
-    datasetId VARCHAR(128),
     start INTEGER,
-    chromosome VARCHAR(2),
-    reference VARCHAR(8192),
-    alternate VARCHAR(8192),
     "end" INTEGER,
-    aggregatedVariantType VARCHAR(16),
     alleleCount INTEGER,
     callCount INTEGER,
     frequency REAL,
-    variantType VARCHAR(16),
+    chromosome SMALLINT,
+    variantType SMALLINT,
+    aggregatedVariantType SMALLINT,
+    datasetId VARCHAR(128),
+    reference VARCHAR(8192),
+    alternate VARCHAR(8192),
     PRIMARY KEY (index)
 );
 
+/*
+alleleHash is a 64 bit hash of the alleles of a variant, computed by PostgreSQL from reference and alternate.
+Variants are unique by dataset, position and alleleHash, and variant queries with exact alleles find them
+by their hash before comparing the alleles themselves, so long alleles are neither indexed nor compared in full.
+beacon_init adds the column and the data_allele_conflict index on databases initialised before them,
+in place of the data_conflict index on the alleles.
+*/
+ALTER TABLE beacon_data_table ADD COLUMN IF NOT EXISTS alleleHash BIGINT
+    GENERATED ALWAYS AS (('x' || left(md5(reference || '>' || alternate), 16))::bit(64)::bigint) STORED;
+DROP INDEX IF EXISTS data_conflict;
+CREATE UNIQUE INDEX IF NOT EXISTS data_allele_conflict ON beacon_data_table (datasetId, chromosome, start, alleleHash);
+
 CREATE TABLE IF NOT EXISTS beacon_mate_table (
     index SERIAL,
     datasetId VARCHAR(128),
@@ -66,9 +91,80 @@ CREATE TABLE IF NOT EXISTS beacon_mate_table (
     PRIMARY KEY (index)
 );
 
-CREATE UNIQUE INDEX data_conflict ON beacon_data_table (datasetId, chromosome, start, reference, alternate);
-CREATE UNIQUE INDEX metadata_conflict ON beacon_dataset_table (name, datasetId);
-CREATE UNIQUE INDEX mate_conflict ON beacon_mate_table (datasetId, chromosome, mate, chromosomePos, matePos);
+/*
+Progress of beacon_init, one row per dataset, datafile and region of the datafile (empty for whole datafiles).
+chunk is the number of the last committed chunk, chromosome and position locate its last record.
+callCount and variantCount are the counts inserted up to and including the last committed chunk.
+*/
+CREATE TABLE IF NOT EXISTS beacon_loader_state_table (
+    datasetId VARCHAR(128),
+    datafile VARCHAR(1024),
+    region VARCHAR(128),
+    chunk INTEGER,
+    chromosome VARCHAR(128),
+    position INTEGER,
+    callCount INTEGER DEFAULT 0,
+    variantCount BIGINT DEFAULT 0,
+    updateDateTime TIMESTAMP WITH TIME ZONE,
+    PRIMARY KEY (datasetId, datafile, region)
+);
+
+/*
+Bloom filters of the variants of a dataset on a chromosome, over their start and alleleHash, of size bits
+and hashes hash functions, see beacon_api.utils.bloom. beacon_init builds them after loading a dataset,
+queries for an exact variant skip the datasets whose filter rules it out.
+*/
+CREATE TABLE IF NOT EXISTS beacon_bloom_table (
+    datasetId VARCHAR(128),
+    chromosome SMALLINT,
+    size BIGINT,
+    hashes SMALLINT,
+    variants BIGINT,
+    bits BYTEA,
+    updateDateTime TIMESTAMP WITH TIME ZONE,
+    PRIMARY KEY (datasetId, chromosome)
+);
+
+/*
+Summary of the variants of a dataset on a chromosome: their number, the range of their starts and ends and
+the codes of their variant types, see beacon_api.utils.summary. beacon_init builds them after loading a dataset,
+variant queries skip the datasets whose summary rules them out.
+*/
+CREATE TABLE IF NOT EXISTS beacon_summary_table (
+    datasetId VARCHAR(128),
+    chromosome SMALLINT,
+    variants BIGINT,
+    minStart INTEGER,
+    maxStart INTEGER,
+    minEnd INTEGER,
+    maxEnd INTEGER,
+    variantTypes SMALLINT[],
+    updateDateTime TIMESTAMP WITH TIME ZONE,
+    PRIMARY KEY (datasetId, chromosome)
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS metadata_conflict ON beacon_dataset_table (name, datasetId);
+CREATE UNIQUE INDEX IF NOT EXISTS mate_conflict ON beacon_mate_table (datasetId, chromosome, mate, chromosomePos, matePos);
+
+/*
+Variant queries give an exact start or a start range on one chromosome, with an optional end or end range.
+data_position serves them across datasets, and filters the end within the index.
+beacon_init creates it, and data_alleles below, on databases initialised before they were added.
+*/
+CREATE INDEX IF NOT EXISTS data_position ON beacon_data_table (chromosome, start, "end");
+
+/*
+referenceBases and alternateBases are matched as whole alleles, with N standing for any one base.
+data_alleles serves these patterns when the pg_trgm extension is available, otherwise they are compared
+on the variants found by position.
+*/
+DO $$ BEGIN
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    CREATE INDEX IF NOT EXISTS data_alleles ON beacon_data_table USING gin (reference gin_trgm_ops, alternate gin_trgm_ops);
+EXCEPTION
+    WHEN undefined_file OR feature_not_supported OR insufficient_privilege THEN
+        RAISE NOTICE 'pg_trgm is not available, alleles with wildcards are compared on the variants found by position';
+END $$;
 
 
 CREATE OR REPLACE VIEW dataset_metadata(name, datasetId, description, assemblyId,
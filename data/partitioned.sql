@@ -0,0 +1,25 @@
+/*
+Optional partitioned variant table, run before init.sql, which then keeps it.
+beacon_init --partitioned does so when it creates the tables.
+
+beacon_data_table is list-partitioned by datasetId, and the partition of each dataset by chromosome.
+beacon_init creates the partitions of a dataset when loading it (beacon_data_part_ and a hash of the dataset id,
+with a partition per chromosome code), and replaces the partition of the dataset with --swap.
+The data_allele_conflict and data_position indexes of init.sql are created on every partition.
+*/
+CREATE TABLE IF NOT EXISTS beacon_data_table (
+    alleleHash BIGINT GENERATED ALWAYS AS (('x' || left(md5(reference || '>' || alternate), 16))::bit(64)::bigint) STORED,
+    index SERIAL,
+    start INTEGER,
+    "end" INTEGER,
+    alleleCount INTEGER,
+    callCount INTEGER,
+    frequency REAL,
+    chromosome SMALLINT,
+    variantType SMALLINT,
+    aggregatedVariantType SMALLINT,
+    datasetId VARCHAR(128),
+    reference VARCHAR(8192),
+    alternate VARCHAR(8192),
+    PRIMARY KEY (datasetId, chromosome, index)
+) PARTITION BY LIST (datasetId);
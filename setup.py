@@ -44,6 +44,7 @@ setup(
         "gunicorn==21.2.0",
         "uvloop==0.17.0",
         "cyvcf2==0.30.22",
+        "numpy==1.26.1",
         "aiocache==0.11.1",
         "ujson==5.8.0",
     ],
@@ -1,6 +1,7 @@
 import unittest
 from aiohttp.test_utils import AioHTTPTestCase
 from beacon_api.app import init, initialize
+from beacon_api.utils.statements import PREPARE_COUNTS, REUSE_COUNTS
 import asyncpg
 import json
 from authlib.jose import jwt
@@ -93,6 +94,19 @@ class AppTestCase(AioHTTPTestCase):
             resp = await self.client.request("GET", "/service-info")
         self.assertEqual(200, resp.status)
 
+    async def test_metrics(self):
+        """Test the metrics endpoint.
+
+        The status should always be 200.
+        """
+        with unittest.mock.patch.dict(PREPARE_COUNTS, {"datasets_access": 2}), unittest.mock.patch.dict(REUSE_COUNTS, {"datasets_access": 5}):
+            resp = await self.client.request("GET", "/metrics")
+        self.assertEqual(200, resp.status)
+        metrics = await resp.json()
+        self.assertIn("hitRatio", metrics["resultCache"])
+        self.assertEqual(2, metrics["statements"]["prepared"]["datasets_access"])
+        self.assertEqual(5, metrics["statements"]["reused"]["datasets_access"])
+
     async def test_post_info(self):
         """Test the info endpoint with POST.
 
@@ -288,6 +302,37 @@ class AppTestCase(AioHTTPTestCase):
         resp = await self.client.request("POST", "/query", data=json.dumps(PARAMS))
         self.assertEqual(200, resp.status)
 
+    @unittest.mock.patch("beacon_api.app.batch_request_handler")
+    async def test_batch_post_query(self, mock_handler):
+        """Test valid batch POST query endpoint."""
+        mock_handler.return_value = []
+        batch = {"requests": [PARAMS, {**PARAMS, "start": 10001}], "includeDatasetResponses": "HIT"}
+        resp = await self.client.request("POST", "/query/batch", data=json.dumps(batch))
+        self.assertEqual(200, resp.status)
+        self.assertEqual(batch, mock_handler.await_args.args[0][2])
+
+    async def test_bad_batch_post_query(self):
+        """Test batch POST query endpoint with bad requests, of the same shape as good requests or not.
+
+        The status should always be 400.
+        """
+        bad_batches = [
+            {"requests": []},
+            {"requests": [PARAMS, {**PARAMS, "start": -1}]},
+            {"requests": [PARAMS, {**PARAMS, "referenceBases": "X"}]},
+            {"requests": [PARAMS, {**PARAMS, "datasetIds": ["dataset1"]}]},
+            {"requests": [PARAMS], "includeDatasetResponses": "SOME"},
+        ]
+        for batch in bad_batches:
+            resp = await self.client.request("POST", "/query/batch", data=json.dumps(batch))
+            self.assertEqual(400, resp.status, batch)
+
+    async def test_unauthorized_token_batch_post_query(self):
+        """Test unauthorized batch POST query endpoint, bad token."""
+        batch = {"requests": [PARAMS]}
+        resp = await self.client.request("POST", "/query/batch", data=json.dumps(batch), headers={"Authorization": f"Bearer {self.bad_token}"})
+        self.assertEqual(403, resp.status)
+
 
 class AppTestCaseForbidden(AioHTTPTestCase):
     """Test for Web app 403.
@@ -339,9 +384,10 @@ class TestBasicFunctionsApp(unittest.IsolatedAsyncioTestCase):
         We will mock the init_db_pool, thus we assert we just call it.
         """
         app = {}
-        with unittest.mock.patch("beacon_api.app.init_db_pool") as db_mock:
+        with unittest.mock.patch("beacon_api.app.init_db_pool") as db_mock, unittest.mock.patch("beacon_api.app.CATALOG.listen") as listen_mock:
             await initialize(app)
             db_mock.assert_called()
+            listen_mock.assert_awaited_once_with(app["pool"])
 
 
 if __name__ == "__main__":
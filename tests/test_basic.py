@@ -1,7 +1,9 @@
 import unittest
 import aiohttp
+import asyncpg
 from beacon_api.utils.db_load import parse_arguments, init_beacon_db, main
 from beacon_api.conf.config import init_db_pool
+from beacon_api.utils.statements import register, prepare_statements, STATEMENT_CACHE_SIZE, fetch_statement, PREPARED, PREPARE_COUNTS, REUSE_COUNTS
 from beacon_api.api.query import access_resolution
 from beacon_api.utils.validate_jwt import token_scheme_check, verify_aud_claim
 from beacon_api.permissions.ga4gh import get_ga4gh_controlled, get_ga4gh_bona_fide, validate_passport
@@ -58,17 +60,53 @@ class MockBeaconDB:
         """Mimic create_tables."""
         pass
 
+    async def update_schema(self):
+        """Mimic update_schema."""
+        pass
+
+    async def partitioned(self):
+        """Mimic partitioned."""
+        return False
+
     async def insert_variants(self, dataset_id, variants, min_ac):
         """Mimic insert_variants."""
         pass
 
     async def load_metadata(self, vcf, metafile, datafile):
         """Mimic load_metadata."""
-        pass
+        return "DATASET1"
 
-    async def load_datafile(self, vcf, datafile, datasetId, n=1000, min_ac=1):
+    async def load_datafile(self, vcf, datafile, datasetId, n=1000, min_ac=1, region=None, queue_depth=4, resume=False, swap=False, max_bytes=0):
         """Mimic load_datafile."""
-        return ["datasetId", "variants"]
+        return 1, 1, 1
+
+    async def add_counts(self, dataset_id, calls, variants):
+        """Mimic add_counts."""
+        pass
+
+    async def recount(self, dataset_id):
+        """Mimic recount."""
+        return 1, 1
+
+    async def drop_filters(self, dataset_id):
+        """Mimic drop_filters."""
+        pass
+
+    async def build_filters(self, dataset_id, fpr):
+        """Mimic build_filters."""
+        return 25
+
+    async def drop_summary(self, dataset_id):
+        """Mimic drop_summary."""
+        pass
+
+    async def build_summary(self, dataset_id):
+        """Mimic build_summary."""
+        return 1
+
+    async def notify(self, dataset_id):
+        """Mimic notify."""
+        pass
 
 
 async def mock_get_ga4gh_controlled(input):
@@ -92,6 +130,11 @@ class TestBasicFunctions(unittest.IsolatedAsyncioTestCase):
         parsed = parse_arguments(["/path/to/datafile.csv", "/path/to/metadata.json"])
         self.assertEqual(parsed.datafile, "/path/to/datafile.csv")
         self.assertEqual(parsed.metadata, "/path/to/metadata.json")
+        self.assertFalse(parsed.partitioned)
+        self.assertEqual("0.01", parsed.bloom_fpr)
+        parsed = parse_arguments(["--recount", "DATASET1"])
+        self.assertEqual(parsed.recount, "DATASET1")
+        self.assertIsNone(parsed.datafile)
 
     @unittest.mock.patch("beacon_api.conf.config.asyncpg")
     async def test_init_pool(self, db_mock):
@@ -100,6 +143,60 @@ class TestBasicFunctions(unittest.IsolatedAsyncioTestCase):
         db_mock.create_pool = unittest.mock.AsyncMock()
         await init_db_pool()
         db_mock.create_pool.assert_called()
+        self.assertEqual(db_mock.create_pool.call_args.kwargs["init"], prepare_statements)
+        self.assertEqual(db_mock.create_pool.call_args.kwargs["statement_cache_size"], STATEMENT_CACHE_SIZE)
+
+    @unittest.mock.patch.dict("beacon_api.utils.statements.STATEMENTS", clear=True)
+    @unittest.mock.patch.dict("beacon_api.utils.statements.PREPARED", clear=True)
+    async def test_prepare_statements(self):
+        """Test statements are prepared once per connection and reused."""
+        self.assertEqual(register("test", "SELECT $1"), "test")
+        connection = unittest.mock.MagicMock()
+        connection.get_server_pid.return_value = 1
+        connection.executemany = unittest.mock.AsyncMock()
+        connection.execute = unittest.mock.AsyncMock()
+        connection.fetch = unittest.mock.AsyncMock(return_value=["row"])
+        reused = REUSE_COUNTS["test"]
+        await prepare_statements(connection)
+        connection.executemany.assert_awaited_once_with("SELECT $1", [])
+        # The implicit transaction of the prepared statements is ended
+        connection.execute.assert_awaited_once_with("SELECT 1")
+        self.assertEqual(await fetch_statement(connection, "test", 1), ["row"])
+        self.assertEqual(await fetch_statement(connection, "test", 2), ["row"])
+        connection.fetch.assert_called_with("SELECT $1", 2)
+        connection.executemany.assert_awaited_once()
+        self.assertEqual(REUSE_COUNTS["test"], reused + 2)
+        # The statements of a closed connection are forgotten
+        listener = connection.add_termination_listener.call_args.args[0]
+        listener(connection)
+        self.assertNotIn(1, PREPARED)
+        await fetch_statement(connection, "test", 3)
+        self.assertEqual(connection.executemany.await_count, 2)
+
+    @unittest.mock.patch.dict("beacon_api.utils.statements.STATEMENTS", clear=True)
+    @unittest.mock.patch.dict("beacon_api.utils.statements.PREPARED", clear=True)
+    @unittest.mock.patch("beacon_api.utils.statements.STATEMENT_CACHE_SIZE", 2)
+    @unittest.mock.patch("beacon_api.utils.statements.LOG")
+    async def test_prepare_statements_evicted(self, mock_log):
+        """Test statements evicted from the statement cache, or on missing columns, are prepared again when used."""
+        for name in ["first", "second", "missing"]:
+            register(name, f"SELECT '{name}'")
+        connection = unittest.mock.MagicMock()
+        connection.get_server_pid.return_value = 1
+        connection.executemany = unittest.mock.AsyncMock(side_effect=[None, None, asyncpg.UndefinedColumnError("column"), None, None])
+        connection.execute = unittest.mock.AsyncMock()
+        connection.fetch = unittest.mock.AsyncMock()
+        await prepare_statements(connection)
+        self.assertEqual(["first", "second"], list(PREPARED[1]))
+        mock_log.warning.assert_called_once()
+        prepared = PREPARE_COUNTS["first"]
+        await fetch_statement(connection, "first")
+        # The least recently used statement is evicted by the statement that was not prepared
+        await fetch_statement(connection, "missing")
+        self.assertEqual(["first", "missing"], list(PREPARED[1]))
+        await fetch_statement(connection, "second")
+        self.assertEqual(connection.executemany.await_args.args, ("SELECT 'second'", []))
+        self.assertEqual(PREPARE_COUNTS["first"], prepared)
 
     @unittest.mock.patch("beacon_api.utils.db_load.LOG")
     @unittest.mock.patch("beacon_api.utils.db_load.BeaconDB")
@@ -123,6 +220,31 @@ class TestBasicFunctions(unittest.IsolatedAsyncioTestCase):
             "The database connection has been closed",
         ]
 
+    @unittest.mock.patch("beacon_api.utils.db_load.LOG")
+    @unittest.mock.patch("beacon_api.utils.db_load.BeaconDB")
+    async def test_init_beacon_db_recount(self, db_mock, mock_log):
+        """Test beacon_init recounting a dataset without loading."""
+        db = MockBeaconDB()
+        db.recount = unittest.mock.AsyncMock(return_value=(1, 1))
+        db_mock.return_value = db
+        await init_beacon_db(["--recount", "DATASET1"])
+        db.recount.assert_awaited_once_with("DATASET1")
+
+    @unittest.mock.patch("beacon_api.utils.db_load.LOG")
+    @unittest.mock.patch("beacon_api.utils.db_load.load_manifest")
+    async def test_init_beacon_db_manifest(self, mock_load, mock_log):
+        """Test beacon_init exits with an error when datasets of a manifest fail."""
+        manifest = self._dir.write("manifest.json", b"[]")
+        await init_beacon_db(["--manifest", manifest, "--concurrency", "3", "--partitioned", "--bloom_fpr", "0.001"])
+        self.assertEqual((manifest, 3), mock_load.await_args.args[:2])
+        self.assertEqual((True, 0.001), mock_load.await_args.args[-2:])
+        with self.assertRaises(SystemExit):
+            await init_beacon_db(["--manifest", manifest, "--bloom_fpr", "1"])
+        mock_load.side_effect = Exception("1 of 2 dataset(s) failed to load")
+        with self.assertRaises(SystemExit) as context:
+            await init_beacon_db(["--manifest", manifest])
+        self.assertEqual("1 of 2 dataset(s) failed to load", context.exception.code)
+
     @unittest.mock.patch("beacon_api.utils.db_load.init_beacon_db")
     def test_main_db(self, mock_init):
         """Test run asyncio main beacon init."""
@@ -0,0 +1,66 @@
+import unittest
+from unittest import mock
+
+import asyncpg
+import numpy as np
+
+from beacon_api.utils.bloom import BloomFilter, fetch_filters, possible_datasets
+
+
+class TestBloomFilter(unittest.IsolatedAsyncioTestCase):
+    """Test Bloom filters of datasets."""
+
+    def setUp(self):
+        """Create a filter of random variants."""
+        rng = np.random.default_rng(1)
+        self.starts = rng.integers(0, 2**28, 10000)
+        self.hashes = rng.integers(-(2**63), 2**63 - 1, 10000, dtype=np.int64)
+        self.bloom = BloomFilter.for_capacity(10000, 0.01)
+        self.bloom.add(self.starts, self.hashes)
+
+    def test_sizing(self):
+        """Test filters are sized for their false positive rate."""
+        self.assertEqual((95851, 7), (self.bloom.size, self.bloom.hashes))
+        self.assertEqual(len(self.bloom.bits), (self.bloom.size + 7) // 8)
+        self.assertEqual((0, 0), (BloomFilter.for_capacity(0).size, BloomFilter.for_capacity(0).hashes))
+
+    def test_contains(self):
+        """Test added variants are never ruled out, and other variants mostly are."""
+        self.assertTrue(all((int(start), int(hash)) in self.bloom for start, hash in zip(self.starts, self.hashes)))
+        others = sum((int(start) + 1, int(hash)) in self.bloom for start, hash in zip(self.starts, self.hashes))
+        self.assertLess(others, 300)
+        self.assertNotIn((10, 1), BloomFilter.for_capacity(0))
+
+    def test_stored(self):
+        """Test a filter loaded from its stored bits."""
+        stored = BloomFilter(self.bloom.size, self.bloom.hashes, self.bloom.bits.tobytes())
+        self.assertIn((int(self.starts[0]), int(self.hashes[0])), stored)
+
+    @mock.patch.dict("beacon_api.utils.bloom.FILTERS", clear=True)
+    async def test_fetch_filters(self):
+        """Test filters are loaded once per time to live, datasets without filters are kept."""
+        connection = mock.MagicMock()
+        connection.executemany = mock.AsyncMock()
+        connection.fetch = mock.AsyncMock(return_value=[{"datasetid": "DATASET1", "size": self.bloom.size, "hashes": 7, "bits": self.bloom.bits.tobytes()}])
+        variant = (int(self.starts[0]), int(self.hashes[0]))
+        self.assertEqual(["DATASET1", "DATASET2"], await possible_datasets(connection, ["DATASET1", "DATASET2"], 1, *variant))
+        self.assertEqual(["DATASET2"], await possible_datasets(connection, ["DATASET1", "DATASET2"], 1, variant[0] + 1, variant[1]))
+        connection.fetch.assert_awaited_once()
+        self.assertEqual((["DATASET1", "DATASET2"], 1), connection.fetch.await_args.args[1:])
+        with mock.patch("beacon_api.utils.bloom.FILTER_TTL", -1):
+            await fetch_filters(connection, ["DATASET1"], 1)
+        self.assertEqual(2, connection.fetch.await_count)
+
+    @mock.patch.dict("beacon_api.utils.bloom.FILTERS", clear=True)
+    @mock.patch("beacon_api.utils.bloom.LOG")
+    async def test_fetch_filters_no_table(self, mock_log):
+        """Test variants are queried without filters on databases without beacon_bloom_table."""
+        connection = mock.MagicMock()
+        connection.executemany = mock.AsyncMock()
+        connection.fetch = mock.AsyncMock(side_effect=asyncpg.UndefinedTableError("beacon_bloom_table"))
+        self.assertEqual({"DATASET1": None}, await fetch_filters(connection, ["DATASET1"], 1))
+        mock_log.warning.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
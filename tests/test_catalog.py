@@ -0,0 +1,123 @@
+import math
+import unittest
+from unittest import mock
+
+from beacon_api.utils.catalog import CATALOG_CHANNEL, DatasetCatalog
+
+
+def mock_pool():
+    """Mock a database pool handing out one connection."""
+    connection = mock.MagicMock()
+    pool = mock.MagicMock()
+    pool.acquire.return_value.__aenter__.return_value = connection
+    return pool, connection
+
+
+class TestDatasetCatalog(unittest.IsolatedAsyncioTestCase):
+    """Test the dataset access catalog."""
+
+    def setUp(self):
+        """Create an empty catalog."""
+        self.catalog = DatasetCatalog()
+
+    @mock.patch("beacon_api.utils.catalog.fetch_datasets_access")
+    async def test_access(self, mock_access):
+        """Test datasets are split by access type, the catalog is loaded once per time to live."""
+        mock_access.return_value = (["DATASET1"], ["DATASET2"], ["DATASET3", "DATASET4"])
+        pool, connection = mock_pool()
+        self.assertEqual((["DATASET1"], ["DATASET2"], ["DATASET3", "DATASET4"]), await self.catalog.access(pool, None))
+        self.assertEqual((["DATASET1"], [], ["DATASET4"]), await self.catalog.access(pool, ["DATASET4", "DATASET1", "DATASET5"]))
+        mock_access.assert_awaited_once_with(connection, None)
+        with mock.patch("beacon_api.utils.catalog.CATALOG_TTL", -1):
+            await self.catalog.access(pool, None)
+        self.assertEqual(2, mock_access.await_count)
+
+    @mock.patch("beacon_api.utils.catalog.fetch_datasets_access")
+    async def test_load_overtaken(self, mock_access):
+        """Test a load overtaken by a notification is loaded again by the next query."""
+
+        async def changed(connection, datasets):
+            self.catalog.notified(connection, 1, CATALOG_CHANNEL, "DATASET1")
+            return ["DATASET1"], [], []
+
+        mock_access.side_effect = changed
+        pool, _ = mock_pool()
+        await self.catalog.access(pool, None)
+        self.assertEqual(-math.inf, self.catalog.loaded_at)
+        await self.catalog.access(pool, None)
+        self.assertEqual(2, mock_access.await_count)
+
+    @mock.patch.dict("beacon_api.utils.catalog.FILTERS", {("DATASET1", 1): (0, None), ("DATASET2", 1): (0, None)}, clear=True)
+    @mock.patch.dict("beacon_api.utils.catalog.SUMMARIES", {("DATASET1", 25): (0, None)}, clear=True)
+    @mock.patch("beacon_api.utils.catalog.RESULTS")
+    def test_notified(self, mock_results):
+        """Test a notification invalidates the catalog, and the filters, summaries and cached results of its dataset."""
+        from beacon_api.utils.catalog import FILTERS, SUMMARIES
+
+        self.catalog.loaded_at = 0
+        self.catalog.notified(None, 1, CATALOG_CHANNEL, "DATASET1")
+        self.assertEqual(-math.inf, self.catalog.loaded_at)
+        self.assertEqual([("DATASET2", 1)], list(FILTERS))
+        self.assertEqual({}, SUMMARIES)
+        mock_results.invalidate.assert_called_once_with("DATASET1")
+
+    @mock.patch("beacon_api.utils.catalog.fetch_datasets_access")
+    async def test_listen(self, mock_access):
+        """Test listening to notifications on a connection of the pool, given back on close."""
+        mock_access.return_value = (["DATASET1"], [], [])
+        connection = mock.MagicMock()
+        connection.add_listener = mock.AsyncMock()
+        connection.remove_listener = mock.AsyncMock()
+        connection.is_closed.return_value = False
+        pool = mock.MagicMock()
+        pool.acquire = mock.AsyncMock(return_value=connection)
+        pool.release = mock.AsyncMock()
+        await self.catalog.listen(pool)
+        connection.add_listener.assert_awaited_once_with(CATALOG_CHANNEL, self.catalog.notified)
+        self.assertEqual({"DATASET1": "PUBLIC"}, self.catalog.access_types)
+        await self.catalog.close(pool)
+        connection.remove_listener.assert_awaited_once_with(CATALOG_CHANNEL, self.catalog.notified)
+        connection.remove_termination_listener.assert_called_once_with(self.catalog.disconnected)
+        pool.release.assert_awaited_once_with(connection)
+
+    @mock.patch("beacon_api.utils.catalog.CATALOG_RETRY", 0)
+    @mock.patch("beacon_api.utils.catalog.LOG")
+    @mock.patch("beacon_api.utils.catalog.fetch_datasets_access")
+    async def test_reconnect(self, mock_access, mock_log):
+        """Test listening again on another connection of the pool when the listening connection is lost."""
+        mock_access.return_value = (["DATASET1"], [], [])
+        lost, connection = mock.MagicMock(), mock.MagicMock()
+        lost.add_listener = connection.add_listener = mock.AsyncMock()
+        pool = mock.MagicMock()
+        # The database is not back yet on the first attempt
+        pool.acquire = mock.AsyncMock(side_effect=[lost, OSError("Connection refused"), connection])
+        pool.release = mock.AsyncMock()
+        await self.catalog.listen(pool)
+        self.catalog.disconnected(lost)
+        self.assertEqual(-math.inf, self.catalog.loaded_at)
+        await self.catalog._reconnect
+        pool.release.assert_awaited_once_with(lost)
+        self.assertEqual(3, pool.acquire.await_count)
+        connection.add_termination_listener.assert_called_once_with(self.catalog.disconnected)
+        self.assertIs(connection, self.catalog._connection)
+        await self.catalog.close(pool)
+        connection.remove_termination_listener.assert_called_once_with(self.catalog.disconnected)
+        # Connections lost after closing are not replaced
+        self.catalog.disconnected(connection)
+        self.assertIsNone(self.catalog._reconnect)
+        # The lost connection and the failed attempt are logged, not the connection lost after closing
+        self.assertEqual(2, mock_log.warning.call_count)
+
+    @mock.patch("beacon_api.utils.catalog.LOG")
+    async def test_listen_no_database(self, mock_log):
+        """Test the server starts without a database, the catalog is then loaded by the first query."""
+        pool = mock.MagicMock()
+        pool.acquire = mock.AsyncMock(side_effect=OSError("Connection refused"))
+        await self.catalog.listen(pool)
+        mock_log.warning.assert_called_once()
+        self.assertEqual(-math.inf, self.catalog.loaded_at)
+        await self.catalog.close(pool)
+
+
+if __name__ == "__main__":
+    unittest.main()
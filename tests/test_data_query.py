@@ -1,10 +1,24 @@
+import json
+import os
 import unittest
 from unittest import mock
+
+import asyncpg
+from beacon_api.utils.db_load import ALLELE_HASH
 from beacon_api.utils.data_query import filter_exists, transform_record
 from beacon_api.utils.data_query import transform_misses, transform_metadata, find_datasets, add_handover
+from beacon_api.utils.data_query import misses_query, transform_rows, variants_query, variants_statement, fetch_filtered_dataset
+from beacon_api.utils.data_query import find_exact_variants, exists_query
 from beacon_api.extensions.handover import make_handover
 from datetime import datetime
-from beacon_api.utils.data_query import handle_wildcard
+from beacon_api.utils.data_query import handle_wildcard, allele_hash, decode_names
+from beacon_api.utils.statements import STATEMENTS, prepare_statements
+from beacon_api.utils.summary import DatasetSummary
+
+
+async def no_pruning(connection, datasets, *args):
+    """Mimic prune_datasets for datasets without summaries."""
+    return datasets, {}
 
 
 class Record:
@@ -180,6 +194,157 @@ class TestDataQueryFunctions(unittest.IsolatedAsyncioTestCase):
         # setting ALL should cover MISS call as well
         result_all = await find_datasets(None, "GRCh38", None, "Y", "T", "C", [], token, "ALL")
         self.assertEqual(result_all, [])
+        # hits and misses are fetched with one query
+        self.assertEqual(2, mock_filtered.call_count)
+        self.assertFalse(mock_filtered.call_args_list[0].kwargs["misses"])
+        self.assertTrue(mock_filtered.call_args_list[1].kwargs["misses"])
+        # only whether datasets have hits is queried for NONE
+        self.assertTrue(mock_filtered.call_args_list[0].kwargs["exists_only"])
+        self.assertFalse(mock_filtered.call_args_list[1].kwargs["exists_only"])
+
+    def test_transform_rows(self):
+        """Test transforming hit and miss records of one query."""
+        hit = {"datasetId": "DATASET1", "accessType": "PUBLIC", "referenceName": "1", "referenceBases": "T", "alternateBases": "C"}
+        hit.update({"start": 10, "end": 11, "variantType": "SNP", "variantCount": 3, "frequency": 0.5, "externalUrl": "url", "exists": True})
+        miss = {key: None for key in hit}
+        miss.update({"datasetId": "DATASET2", "accessType": "PUBLIC", "referenceName": "1", "exists": False})
+        result = transform_rows([hit, miss])
+        self.assertEqual(["DATASET1", "DATASET2"], [dataset["datasetId"] for dataset in result])
+        self.assertEqual("T", result[0]["referenceBases"])
+        self.assertEqual("", result[1]["referenceBases"])
+        self.assertEqual(0, result[1]["variantCount"])
+        self.assertNotIn("externalUrl", result[1])
+
+    def test_misses_query(self):
+        """Test the misses part of hit queries."""
+        query = misses_query(6, "$4", "$14")
+        self.assertIn('$4 as "referenceName",\n            NULL, NULL, False as "exists"', query)
+        self.assertIn("WHERE $14::boolean", query)
+        self.assertIn("NOT EXISTS (SELECT 1 FROM hits h", query)
+
+    def test_variants_query(self):
+        """Test variant queries are specialised to the positions and alleles given."""
+        query = variants_query(("startMax", "startMin", "alternate", "reference"))
+        self.assertIn("AND a.start<=$5\n           AND a.start>=$6\n", query)
+        self.assertIn("AND a.alternate LIKE any($7::varchar[])\n           AND a.reference LIKE any($8::varchar[])\n", query)
+        self.assertIn("WHERE $9::boolean", query)
+        self.assertNotIn("IS NULL", query)
+        self.assertNotIn("coalesce(a.", query)
+        self.assertNotIn("AND a.start", variants_query(()))
+        self.assertIn("WHERE $5::boolean", variants_query(()))
+        self.assertEqual(variants_statement(("start", "end")), "variants:start,end")
+
+    @unittest.mock.patch("beacon_api.utils.data_query.prune_datasets", new=no_pruning)
+    @unittest.mock.patch("beacon_api.utils.data_query.fetch_statement")
+    async def test_fetch_filtered_dataset_shape(self, mock_fetch):
+        """Test the statement and parameters of the shape of a query."""
+        mock_fetch.return_value = []
+        await fetch_filtered_dataset(None, "GRCh38", (None, None, 1, 100, 50, 200), "MT", "T", ("", "C"), ["DATASET1"], ["PUBLIC"])
+        args = mock_fetch.call_args.args
+        self.assertEqual(args[1], "variants:startMax,startMin,endMin,endMax,alleleHash,alternate,reference")
+        self.assertEqual(args[6:], (100, 1, 50, 200, allele_hash("T", "C"), ["C"], ["T"], False))
+        await fetch_filtered_dataset(None, "GRCh38", (None, None, 1, 100, 50, 200), "MT", "NT", ("", "C"), ["DATASET1"], ["PUBLIC"])
+        args = mock_fetch.call_args.args
+        self.assertEqual(args[1], "variants:startMax,startMin,endMin,endMax,alternate,reference")
+        self.assertEqual(args[6:], (100, 1, 50, 200, ["C"], ["_T"], False))
+        await fetch_filtered_dataset(None, "GRCh38", (10, None, None, None, None, None), "MT", "NT", ("SNP", ""), ["DATASET1"], ["PUBLIC"], misses=True)
+        args = mock_fetch.call_args.args
+        self.assertEqual(args[1], "variants:start,variantType,reference")
+        self.assertEqual(args[5], 25)
+        self.assertEqual(args[6:], (10, 6, ["_T"], True))
+
+    @unittest.mock.patch("beacon_api.utils.data_query.prune_datasets", new=no_pruning)
+    @unittest.mock.patch("beacon_api.utils.data_query.fetch_statement")
+    async def test_fetch_filtered_dataset_exists(self, mock_fetch):
+        """Test only the ids of datasets with hits are queried, the first of them unless the handover lists them all."""
+        mock_fetch.return_value = [{"datasetId": "DATASET1"}]
+        request = (None, "GRCh38", (None, None, 1, 100, None, None), "MT", "T", ("SNP", ""), ["DATASET1", "DATASET2"], ["PUBLIC"])
+        with unittest.mock.patch("beacon_api.utils.data_query.__handover_drs__", ""):
+            self.assertEqual([{"datasetId": "DATASET1", "exists": True}], await fetch_filtered_dataset(*request, exists_only=True))
+        args = mock_fetch.call_args.args
+        self.assertEqual(args[1], "exists:startMax,startMin,variantType,reference")
+        self.assertEqual(args[6:], (100, 1, 6, ["T"], 1))
+        with unittest.mock.patch("beacon_api.utils.data_query.__handover_drs__", "https://handover"):
+            await fetch_filtered_dataset(*request, exists_only=True)
+        self.assertIsNone(mock_fetch.call_args.args[-1])
+
+    def test_exists_query(self):
+        """Test datasets are probed for a variant of a shape, up to a number of datasets."""
+        query = exists_query(("start", "alleleHash", "alternate", "reference"))
+        self.assertIn("WHERE EXISTS (", query)
+        self.assertIn("AND a.start=$5\n           AND a.alleleHash=$6", query)
+        self.assertTrue(query.endswith("LIMIT $9"))
+
+    def test_decode_names(self):
+        """Test chromosome and variant type codes are decoded, and names of mate variants kept."""
+        self.assertEqual({"referenceName": "MT", "variantType": "SNP"}, decode_names({"referenceName": 25, "variantType": 6}))
+        self.assertEqual({"referenceName": "X", "variantType": None}, decode_names({"referenceName": 23, "variantType": None}))
+        self.assertEqual({"referenceName": "10", "variantType": "BND"}, decode_names({"referenceName": "10", "variantType": "BND"}))
+
+    def test_allele_hash(self):
+        """Test the allele hash is the one computed by the database, as a signed 64 bit integer."""
+        self.assertEqual(allele_hash("T", "C"), 8449638471271979643)
+        self.assertEqual(allele_hash("ACGTACGT", "A"), -4666600965715432700)
+        self.assertNotEqual(allele_hash("A", "CG"), allele_hash("AC", "G"))
+
+    @unittest.mock.patch("beacon_api.utils.data_query.prune_datasets", new=no_pruning)
+    @unittest.mock.patch("beacon_api.utils.data_query.possible_datasets")
+    @unittest.mock.patch("beacon_api.utils.data_query.fetch_statement")
+    async def test_fetch_filtered_dataset_bloom(self, mock_fetch, mock_possible):
+        """Test datasets ruled out by their Bloom filters are not queried for an exact variant."""
+        mock_fetch.return_value = []
+        mock_possible.return_value = []
+        request = (None, "GRCh38", (10, None, None, None, None, None), "MT", "T", ("", "C"), ["DATASET1", "DATASET2"], ["PUBLIC"])
+        self.assertEqual([], await fetch_filtered_dataset(*request))
+        self.assertEqual((["DATASET1", "DATASET2"], 25, 10, allele_hash("T", "C")), mock_possible.await_args.args[1:])
+        mock_fetch.assert_not_awaited()
+        mock_possible.return_value = ["DATASET2"]
+        await fetch_filtered_dataset(*request)
+        self.assertEqual(["DATASET2"], mock_fetch.await_args.args[2])
+        # Misses of the ruled out datasets are reported by the database
+        await fetch_filtered_dataset(*request, misses=True)
+        self.assertEqual(["DATASET1", "DATASET2"], mock_fetch.await_args.args[2])
+        self.assertEqual(2, mock_possible.await_count)
+
+    @unittest.mock.patch("beacon_api.utils.data_query.prune_datasets")
+    @unittest.mock.patch("beacon_api.utils.data_query.fetch_statement")
+    async def test_fetch_filtered_dataset_pruned(self, mock_fetch, mock_prune):
+        """Test datasets pruned by their summaries are not queried, and returned as misses without a query."""
+        mock_fetch.return_value = []
+        summary = DatasetSummary("PUBLIC", "GRCh38", 0, None, None, None, None, frozenset())
+        mock_prune.return_value = ([], {"DATASET1": summary, "DATASET2": summary._replace(access_type="CONTROLLED")})
+        request = (None, "GRCh38", (None, None, 1, 100, None, None), "MT", "T", ("SNP", ""), ["DATASET1", "DATASET2"], ["PUBLIC"])
+        self.assertEqual([], await fetch_filtered_dataset(*request))
+        result = await fetch_filtered_dataset(*request, misses=True)
+        self.assertEqual([("DATASET1", "MT", False)], [(dataset["datasetId"], dataset["referenceName"], dataset["exists"]) for dataset in result])
+        mock_fetch.assert_not_awaited()
+        self.assertEqual((25, "GRCh38"), mock_prune.await_args.args[2:4])
+        self.assertEqual((100, 1, 6), tuple(mock_prune.await_args.args[4][name] for name in ["startMax", "startMin", "variantType"]))
+        mock_prune.return_value = (["DATASET2"], {"DATASET1": summary})
+        result = await fetch_filtered_dataset(*request, misses=True)
+        self.assertEqual(["DATASET2"], mock_fetch.await_args.args[2])
+        self.assertEqual(["DATASET1"], [dataset["datasetId"] for dataset in result])
+
+    @unittest.mock.patch("beacon_api.utils.data_query.fetch_statement")
+    async def test_find_exact_variants(self, mock_fetch):
+        """Test many exact variants are found by one statement, and their datasets returned by variant in order."""
+        hit = {"request": 1, "datasetId": "DATASET1", "accessType": "PUBLIC", "referenceName": 25, "referenceBases": "T", "alternateBases": "C"}
+        hit.update({"start": 10, "end": 10, "externalUrl": "url", "note": "info", "variantCount": 3, "variantType": 6})
+        hit.update({"callCount": 6, "sampleCount": 3, "frequency": 0.5, "exists": True})
+        miss = {"request": 0, "datasetId": "DATASET1", "accessType": "PUBLIC", "referenceName": 25, "exists": False}
+        mock_fetch.return_value = [hit, miss]
+        variants = [("GRCh38", "MT", 9, "T", "C"), ("GRCh38", "MT", 10, "T", "C"), ("GRCh37", "1", 10, "A", "G")]
+        result = await find_exact_variants(None, variants, ["DATASET1"], ["PUBLIC"], "ALL")
+        self.assertEqual([[("DATASET1", False)], [("DATASET1", True)], []], [[(d["datasetId"], d["exists"]) for d in datasets] for datasets in result])
+        self.assertEqual(("MT", "SNP", 0.5), (result[1][0]["referenceName"], result[1][0]["variantType"], result[1][0]["frequency"]))
+        self.assertNotIn("request", result[1][0])
+        args = mock_fetch.await_args.args
+        self.assertEqual("exact_variants", args[1])
+        self.assertEqual(([0, 1, 2], ["GRCh38", "GRCh38", "GRCh37"], [25, 25, 1], [9, 10, 10]), args[4:8])
+        self.assertEqual(([allele_hash("T", "C")] * 2 + [allele_hash("A", "G")], ["T", "T", "A"], ["C", "C", "G"], True), args[8:])
+        await find_exact_variants(None, variants, [], [], "HIT")
+        self.assertEqual((None, None), mock_fetch.await_args.args[2:4])
+        self.assertFalse(mock_fetch.await_args.args[-1])
 
     def test_handle_wildcard(self):
         """Test PostgreSQL wildcard handling."""
@@ -187,8 +352,119 @@ class TestDataQueryFunctions(unittest.IsolatedAsyncioTestCase):
         sequence2 = "ATNG"
         sequence3 = "NNCN"
         self.assertEqual(handle_wildcard(sequence1), ["ATCG"])
-        self.assertEqual(handle_wildcard(sequence2), ["%AT_G%"])
-        self.assertEqual(handle_wildcard(sequence3), ["%__C_%"])
+        self.assertEqual(handle_wildcard(sequence2), ["AT_G"])
+        self.assertEqual(handle_wildcard(sequence3), ["__C_"])
+
+
+def plan_nodes(plan):
+    """Walk the nodes of a query plan."""
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+class TestQueryPlans(unittest.IsolatedAsyncioTestCase):
+    """Test the query plans of the variant queries.
+
+    These need a database with the beacon tables, they are skipped if there is none.
+    """
+
+    async def asyncSetUp(self):
+        """Connect to the database."""
+        try:
+            self.connection = await asyncpg.connect(
+                host=os.environ.get("DATABASE_URL", "localhost"),
+                port=os.environ.get("DATABASE_PORT", "5432"),
+                user=os.environ.get("DATABASE_USER", "beacon"),
+                password=os.environ.get("DATABASE_PASSWORD", "beacon"),
+                database=os.environ.get("DATABASE_NAME", "beacondb"),
+            )
+        except (OSError, asyncpg.PostgresError):
+            self.skipTest("No database to plan the queries.")
+        if not await self.connection.fetchval("SELECT to_regclass('beacon_data_table') IS NOT NULL"):
+            await self.connection.close()
+            self.skipTest("No beacon tables to plan the queries.")
+
+    async def asyncTearDown(self):
+        """Close the connection."""
+        await self.connection.close()
+
+    async def plan(self, query, *args):
+        """Return the nodes of the generic plan of a query, failing if it scans variants sequentially."""
+        async with self.connection.transaction():
+            # Plan as the prepared statements are planned after some executions, and prefer any index over none
+            await self.connection.execute("SET LOCAL plan_cache_mode = force_generic_plan; SET LOCAL enable_seqscan = off")
+            await self.connection.execute(f"PREPARE plan_test AS {query}")
+            try:
+                plan = json.loads(await self.connection.fetchval(f"EXPLAIN (FORMAT JSON) EXECUTE plan_test({', '.join(args)})"))
+            finally:
+                await self.connection.execute("DEALLOCATE plan_test")
+        nodes = list(plan_nodes(plan[0]["Plan"]))
+        # Partitions of a partitioned variant table are named beacon_data_part_...
+        scanned = [node["Relation Name"] for node in nodes if node["Node Type"] == "Seq Scan"]
+        self.assertEqual([], [name for name in scanned if name.startswith("beacon_data_")])
+        return nodes
+
+    async def index_conditions(self, query, *args):
+        """Return the index conditions of the generic plan of a query."""
+        return " ".join(node["Index Cond"] for node in await self.plan(query, *args) if "Index Cond" in node)
+
+    async def test_position_shapes(self):
+        """Test every query shape is planned with an index scan on its positions."""
+        request = ["'{DATASET1}'", "NULL", "'GRCh38'", "25"]
+        alleles = ["'{C}'", "'{T}'"]
+        shapes = {
+            (): ([], ["chromosome = $4"]),
+            ("start",): (["10"], ["start = $5"]),
+            ("start", "end"): (["10", "11"], ["start = $5", '"end" = $6']),
+            ("startMax", "startMin"): (["100", "1"], ["start <= $5", "start >= $6"]),
+            ("startMax", "startMin", "endMin", "endMax"): (["100", "1", "50", "200"], ["start <= $5", "start >= $6", '"end" >= $7']),
+        }
+        for shape, (positions, conditions) in shapes.items():
+            with self.subTest(shape=shape):
+                plan = await self.index_conditions(variants_query(shape + ("alternate", "reference")), *request, *positions, *alleles, "true")
+                for condition in conditions:
+                    self.assertIn(condition, plan)
+
+    async def test_allele_hash(self):
+        """Test exact alleles are looked up by the allele hash of the database."""
+        hashes = await self.connection.fetchrow(f"SELECT {ALLELE_HASH} AS db FROM (SELECT 'ACGTACGT' AS reference, 'A' AS alternate) a")
+        self.assertEqual(allele_hash("ACGTACGT", "A"), hashes["db"])
+        request = ["'{DATASET1}'", "NULL", "'GRCh38'", "25"]
+        nodes = await self.plan(variants_query(("start", "alleleHash", "alternate", "reference")), *request, "10", "1", "'{C}'", "'{T}'", "true")
+        # The hash is either an index condition or compared before the alleles
+        conditions = " ".join(node.get("Index Cond", "") + node.get("Filter", "") for node in nodes if "Relation Name" in node)
+        self.assertIn("allelehash = $6", conditions)
+        self.assertLess(conditions.index("allelehash = $6"), conditions.index("alternate"))
+
+    async def test_exists_shapes(self):
+        """Test datasets are probed for the variants of every query shape with an index scan."""
+        request = ["'{DATASET1}'", "NULL", "'GRCh38'", "25"]
+        shapes = {
+            (): [],
+            ("start",): ["10"],
+            ("start", "end"): ["10", "11"],
+            ("startMax", "startMin"): ["100", "1"],
+            ("startMax", "startMin", "endMin", "endMax"): ["100", "1", "50", "200"],
+        }
+        for shape, positions in shapes.items():
+            with self.subTest(shape=shape):
+                await self.plan(exists_query(shape + ("alternate", "reference")), *request, *positions, "'{C}'", "'{T}'", "1")
+
+    async def test_exact_variants(self):
+        """Test exact variants of a batch are joined with the variants by an index of their position."""
+        request = ["'{DATASET1}'", "NULL", "'{0}'", "'{GRCh38}'", "'{25}'", "'{10}'", "'{1}'", "'{T}'", "'{C}'", "true"]
+        nodes = await self.plan(STATEMENTS["exact_variants"], *request)
+        self.assertIn("start = v", " ".join(node["Index Cond"] for node in nodes if "Index Cond" in node))
+        # The hash is either an index condition or a filter of the variants
+        conditions = " ".join(node.get("Index Cond", "") + node.get("Filter", "") for node in nodes if node.get("Relation Name") == "beacon_data_table")
+        self.assertIn("allelehash", conditions)
+
+    async def test_prepared_connection(self):
+        """Test a connection with the prepared statements begins the read-only snapshot of a request."""
+        await prepare_statements(self.connection)
+        async with self.connection.transaction(isolation="serializable", readonly=True, deferrable=True):
+            self.assertEqual(1, await self.connection.fetchval("SELECT 1"))
 
 
 if __name__ == "__main__":
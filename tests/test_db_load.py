@@ -1,6 +1,10 @@
 import unittest
 from testfixtures import TempDirectory
-from beacon_api.utils.db_load import BeaconDB
+from beacon_api.utils.db_load import BeaconDB, LoadError, Record, datafile_index, datafile_regions, region_name, region_records, swap_tables
+from beacon_api.utils.db_load import partition_name, setup_tables
+from beacon_api.utils.codes import CHROMOSOMES
+from beacon_api.utils.bloom import BloomFilter
+from beacon_api.utils.db_load import load_manifest, read_manifest
 
 
 class Variant:
@@ -9,7 +13,7 @@ class Variant:
     Mock this for Variant calculations.
     """
 
-    def __init__(self, ALT, REF, INF, call_rate, var_type, num_called, is_sv=False):
+    def __init__(self, ALT, REF, INF, call_rate, var_type, num_called, is_sv=False, CHROM="chr1", start=10, end=11, ID=None, aaf=0.5):
         """Initialize class."""
         self.INFO = INF
         self.ALT = ALT
@@ -18,6 +22,11 @@ class Variant:
         self.var_type = var_type
         self.num_called = num_called
         self.is_sv = is_sv
+        self.CHROM = CHROM
+        self.start = start
+        self.end = end
+        self.ID = ID
+        self.aaf = aaf
 
 
 class INFO:
@@ -26,13 +35,14 @@ class INFO:
     Mock this for storing VCF info.
     """
 
-    def __init__(self, AC, VT, AN, AF, SVTYPE=None):
+    def __init__(self, AC, VT, AN, AF, SVTYPE=None, MATEID=None):
         """Initialize class."""
         self.AC = AC
         self.VT = VT
         self.AN = AN
         self.AF = AF
         self.SVTYPE = SVTYPE
+        self.MATEID = MATEID
 
     def get(self, key):
         """Inside `__getitem__` method."""
@@ -96,6 +106,22 @@ class Connection:
         """Mimic execute."""
         return []
 
+    async def fetchval(self, query, *args):
+        """Mimic fetchval."""
+        return None
+
+    async def fetchrow(self, query, *args):
+        """Mimic fetchrow."""
+        return {"calls": 1, "variants": 2}
+
+    async def copy_records_to_table(self, table, records, columns):
+        """Mimic copy_records_to_table."""
+        return f"COPY {len(records)}"
+
+    def is_closed(self):
+        """Mimic is_closed."""
+        return False
+
     async def close(self):
         """Mimic close."""
         pass
@@ -112,7 +138,7 @@ class Connection:
         """Mimic prepare."""
         return Statement(query, self.accessData)
 
-    async def transaction(self, *args, **kwargs):
+    def transaction(self, *args, **kwargs):
         """Mimic transaction."""
         return Transaction(*args, **kwargs)
 
@@ -239,6 +265,41 @@ class DatabaseTestCase(unittest.IsolatedAsyncioTestCase):
         # Should assert logs
         mock_log.info.assert_called_with("Tables have been created")
 
+    @unittest.mock.patch("beacon_api.utils.db_load.LOG")
+    @unittest.mock.patch("beacon_api.utils.db_load.asyncpg.connect")
+    async def test_update_schema(self, db_mock, mock_log):
+        """Test encoding chromosomes, adding the allele hash and the indexes of the variant queries."""
+        db_mock.return_value = Connection()
+        await self._db.connection()
+        with unittest.mock.patch.object(self._db._conn, "execute") as mock_execute:
+            await self._db.update_schema()
+        statements = [call.args[0] for call in mock_execute.call_args_list]
+        self.assertIn("ALTER COLUMN chromosome TYPE SMALLINT USING array_position(ARRAY['1', '2'", statements[0])
+        # Variant types without a code are encoded as the nearest type with one, never NULL
+        self.assertIn("WHEN variantType = 'DEL:ME' OR variantType LIKE 'DEL:ME:%' THEN 9", statements[0])
+        self.assertIn("ELSE 14 END", statements[0])
+        self.assertIn("ADD COLUMN IF NOT EXISTS alleleHash", statements[1])
+        self.assertEqual("DROP INDEX IF EXISTS data_conflict", statements[2])
+        self.assertIn("data_allele_conflict", statements[3])
+        self.assertIn("data_position", statements[4])
+        self.assertIn("CREATE EXTENSION IF NOT EXISTS pg_trgm", statements[5])
+        # The other updates of the loader are the ones of the schema, which creates the columns encoded
+        with open("data/init.sql") as schema:
+            sql = schema.read()
+        for statement in statements[1:]:
+            self.assertIn(f"{statement};", sql)
+
+    @unittest.mock.patch("beacon_api.utils.db_load.LOG")
+    @unittest.mock.patch("beacon_api.utils.db_load.asyncpg.connect")
+    async def test_update_schema_unknown_types(self, db_mock, mock_log):
+        """Test variant types without a code are counted before they are converted."""
+        db_mock.return_value = Connection()
+        await self._db.connection()
+        self._db._conn.fetchval = unittest.mock.AsyncMock(return_value=True)
+        self._db._conn.fetch = unittest.mock.AsyncMock(return_value=[("DEL:ME:ALU", 3)])
+        await self._db.update_schema()
+        mock_log.warning.assert_called_with("Variant types without a code are stored as their nearest type with a code -> {'DEL:ME:ALU': 3}")
+
     @unittest.mock.patch("beacon_api.utils.db_load.LOG")
     @unittest.mock.patch("beacon_api.utils.db_load.asyncpg.connect")
     async def test_create_tables_exception(self, db_mock, mock_log):
@@ -299,6 +360,201 @@ class DatabaseTestCase(unittest.IsolatedAsyncioTestCase):
         # Should assert logs
         mock_log.info.mock_calls = [f"Read data from {self.datafile}", f"{self.datafile} has been processed"]
 
+    @unittest.mock.patch("beacon_api.utils.db_load.LOG")
+    @unittest.mock.patch("beacon_api.utils.db_load.asyncpg.connect")
+    async def test_load_datafile_pipeline(self, db_mock, mock_log):
+        """Test parsed chunks are handed over to database writes."""
+        db_mock.return_value = Connection()
+        await self._db.connection()
+        variants = [Variant(["C"], "T", INFO((1), "S", 3, None), 0.7, "snp", 3, start=start) for start in range(3)]
+        with unittest.mock.patch.object(self._db, "insert_rows", new_callable=unittest.mock.AsyncMock, return_value=(1, 1)) as mock_insert:
+            await self._db.load_datafile(variants, self.datafile, "DATASET1", n=2, queue_depth=1)
+        self.assertEqual(2, mock_insert.await_count)
+        data_rows, mate_rows = mock_insert.await_args_list[1].args[1:3]
+        self.assertEqual([("DATASET1", 1, 2, "T", "C", 11, 6, 1, 3, 1 / 3, 6)], data_rows)
+        mock_log.error.assert_not_called()
+
+    @unittest.mock.patch("beacon_api.utils.db_load.LOG")
+    @unittest.mock.patch("beacon_api.utils.db_load.asyncpg.connect")
+    async def test_load_datafile_resume(self, db_mock, mock_log):
+        """Test resuming a load skips committed chunks."""
+        db_mock.return_value = Connection()
+        await self._db.connection()
+        variants = [Variant(["C"], "T", INFO((1), "S", 3, None), 0.7, "snp", 3, start=start) for start in range(5)]
+        with unittest.mock.patch.object(self._db, "committed_chunks", return_value=(2, 4, 4)), unittest.mock.patch.object(
+            self._db, "insert_rows", new_callable=unittest.mock.AsyncMock, return_value=(5, 5)
+        ) as mock_insert:
+            counts = await self._db.load_datafile(variants, self.datafile, "DATASET1", n=2, resume=True)
+        mock_insert.assert_awaited_once()
+        self.assertEqual((self.datafile, None, 3, "chr1", 4, 4, 4), mock_insert.await_args.args[3])
+        self.assertEqual((5, 5, 1), counts)
+
+    @unittest.mock.patch("beacon_api.utils.db_load.LOG")
+    @unittest.mock.patch("beacon_api.utils.db_load.asyncpg.connect")
+    async def test_load_datafile_failure(self, db_mock, mock_log):
+        """Test a chunk failing after retries fails the load."""
+        db_mock.return_value = Connection()
+        await self._db.connection()
+        variants = [Variant(["C"], "T", INFO((1), "S", 3, None), 0.7, "snp", 3, start=start) for start in range(3)]
+        with unittest.mock.patch.object(self._db, "_copy_data_rows", side_effect=Exception("boom")) as mock_copy:
+            with self.assertRaises(LoadError) as context:
+                await self._db.load_datafile(variants, self.datafile, "DATASET1", n=2, retries=2, backoff=0)
+        self.assertEqual(2, mock_copy.call_count)
+        self.assertIn("failed at chunk 1 ending at chr1:2 after 2 attempt(s) -> boom", str(context.exception))
+        self.assertIn("--resume", str(context.exception))
+
+    @unittest.mock.patch("beacon_api.utils.db_load.LOG")
+    @unittest.mock.patch("beacon_api.utils.db_load.asyncpg.connect")
+    async def test_swap_dataset(self, db_mock, mock_log):
+        """Test loading into swap tables and swapping them in."""
+        db_mock.return_value = Connection()
+        await self._db.connection()
+        data_swap, mate_swap = swap_tables("DATASET1")
+        with unittest.mock.patch.object(self._db._conn, "execute", new_callable=unittest.mock.AsyncMock) as mock_execute:
+            await self._db.create_swap_tables("DATASET1")
+            self.assertIn(f"DROP TABLE IF EXISTS {data_swap}", mock_execute.await_args_list[0].args[0])
+            mock_execute.reset_mock()
+            with unittest.mock.patch.object(self._db._conn, "copy_records_to_table", new_callable=unittest.mock.AsyncMock) as mock_copy:
+                await self._db.insert_rows("DATASET1", [("DATASET1",)], [("DATASET1", "1", "2")], swap=True)
+            self.assertEqual([data_swap, mate_swap], [call.args[0] for call in mock_copy.await_args_list])
+            self.assertFalse(any("INSERT INTO beacon_mate_table" in call.args[0] for call in mock_execute.await_args_list))
+            await self._db.swap_dataset("DATASET1")
+        statements = [call.args[0] for call in mock_execute.await_args_list]
+        self.assertIn("DELETE FROM beacon_data_table WHERE datasetId=$1", statements)
+        self.assertIn(f"DROP TABLE {data_swap}, {mate_swap}", statements)
+        self.assertEqual(("DATASET1", 1, 2), mock_execute.await_args.args[1:])
+
+    @unittest.mock.patch("beacon_api.utils.db_load.LOG")
+    @unittest.mock.patch("beacon_api.utils.db_load.asyncpg.connect")
+    async def test_resume_swap_tables(self, db_mock, mock_log):
+        """Test a swap load is only resumed into swap tables with rows, which a crash of the database empties."""
+        db_mock.return_value = Connection()
+        await self._db.connection()
+        data_swap, _ = swap_tables("DATASET1")
+        with unittest.mock.patch.object(self._db._conn, "execute", new_callable=unittest.mock.AsyncMock) as mock_execute:
+            with unittest.mock.patch.object(self._db._conn, "fetchval", new_callable=unittest.mock.AsyncMock, side_effect=[True, True]):
+                self.assertTrue(await self._db.create_swap_tables("DATASET1", resume=True))
+            self.assertNotIn(f"DROP TABLE IF EXISTS {data_swap}", [call.args[0] for call in mock_execute.await_args_list])
+            # Existing but empty swap tables
+            with unittest.mock.patch.object(self._db._conn, "fetchval", new_callable=unittest.mock.AsyncMock, side_effect=[True, False]):
+                self.assertFalse(await self._db.create_swap_tables("DATASET1", resume=True))
+            self.assertIn(f"DROP TABLE IF EXISTS {data_swap}", [call.args[0] for call in mock_execute.await_args_list])
+            mock_log.warning.assert_called_once()
+            # Missing swap tables
+            with unittest.mock.patch.object(self._db._conn, "fetchval", new_callable=unittest.mock.AsyncMock, return_value=False) as mock_fetchval:
+                self.assertFalse(await self._db.create_swap_tables("DATASET1", resume=True))
+            mock_fetchval.assert_awaited_once()
+
+    @unittest.mock.patch("beacon_api.utils.db_load.LOG")
+    @unittest.mock.patch("beacon_api.utils.db_load.asyncpg.connect")
+    async def test_swap_dataset_partitioned(self, db_mock, mock_log):
+        """Test swapping in the partition of a dataset in a partitioned variant table."""
+        db_mock.return_value = Connection()
+        await self._db.connection()
+        partition = partition_name("DATASET1")
+        with unittest.mock.patch.object(self._db._conn, "fetchval", new_callable=unittest.mock.AsyncMock) as mock_fetchval:
+            # partitioned, quoted dataset id and an existing partition
+            mock_fetchval.side_effect = [True, "'DATASET1'", "'DATASET1'", True]
+            with unittest.mock.patch.object(self._db._conn, "execute", new_callable=unittest.mock.AsyncMock) as mock_execute:
+                await self._db.swap_dataset("DATASET1")
+        statements = [call.args[0] for call in mock_execute.await_args_list]
+        self.assertNotIn("DELETE FROM beacon_data_table WHERE datasetId=$1", statements)
+        self.assertIn(f"CREATE TABLE IF NOT EXISTS {partition}_swap_mt PARTITION OF {partition}_swap FOR VALUES IN (25)", statements)
+        self.assertIn(f"INSERT INTO {partition}_swap", "".join(statements))
+        self.assertIn(f"ALTER TABLE beacon_data_table DETACH PARTITION {partition}", statements)
+        self.assertIn(f"ALTER TABLE {partition}_swap_mt RENAME TO {partition}_mt", statements)
+        self.assertIn(f"ALTER TABLE beacon_data_table ATTACH PARTITION {partition} FOR VALUES IN ('DATASET1')", statements)
+
+    @unittest.mock.patch("beacon_api.utils.db_load.LOG")
+    @unittest.mock.patch("beacon_api.utils.db_load.asyncpg.connect")
+    async def test_create_partitions(self, db_mock, mock_log):
+        """Test creating the partitions of a dataset."""
+        db_mock.return_value = Connection()
+        await self._db.connection()
+        partition = partition_name("DATASET1")
+        with unittest.mock.patch.object(self._db._conn, "fetchval", new_callable=unittest.mock.AsyncMock) as mock_fetchval:
+            mock_fetchval.return_value = "'DATASET1'"
+            with unittest.mock.patch.object(self._db._conn, "execute", new_callable=unittest.mock.AsyncMock) as mock_execute:
+                await self._db.create_partitions("DATASET1")
+        mock_fetchval.assert_awaited_with("SELECT quote_literal($1)", "DATASET1")
+        statements = [call.args[0] for call in mock_execute.await_args_list]
+        self.assertIn("PARTITION OF beacon_data_table\n                    FOR VALUES IN ('DATASET1') PARTITION BY LIST (chromosome)", statements[0])
+        self.assertEqual(len(CHROMOSOMES) + 1, len(statements))
+        self.assertEqual(f"CREATE TABLE IF NOT EXISTS {partition}_x PARTITION OF {partition} FOR VALUES IN (23)", statements[23])
+
+    @unittest.mock.patch("beacon_api.utils.db_load.LOG")
+    @unittest.mock.patch("beacon_api.utils.db_load.asyncpg.connect")
+    async def test_build_filters(self, db_mock, mock_log):
+        """Test building a Bloom filter per chromosome of a dataset, empty for chromosomes without variants."""
+        db_mock.return_value = Connection()
+        await self._db.connection()
+        cursor = unittest.mock.AsyncMock()
+        cursor.fetch.side_effect = [[(1, 10), (2, 20)], [(3, 30)], []]
+        with unittest.mock.patch.object(self._db._conn, "fetch", new_callable=unittest.mock.AsyncMock, return_value=[(25, 3)]), unittest.mock.patch.object(
+            self._db._conn, "cursor", new_callable=unittest.mock.AsyncMock, return_value=cursor, create=True
+        ) as mock_cursor, unittest.mock.patch.object(self._db._conn, "executemany", new_callable=unittest.mock.AsyncMock, create=True) as mock_insert:
+            self.assertEqual(len(CHROMOSOMES), await self._db.build_filters("DATASET1", 0.01))
+        self.assertEqual(("DATASET1", 25), mock_cursor.await_args.args[1:])
+        # Rows without an alternate allele have no hash to add
+        self.assertIn("AND alleleHash IS NOT NULL", mock_cursor.await_args.args[0])
+        filters = {row[1]: row for row in mock_insert.await_args.args[1]}
+        self.assertEqual(("DATASET1", 1, 0, 0, 0, b""), filters[1])
+        _, _, size, hashes, variants, bits = filters[25]
+        self.assertEqual(3, variants)
+        bloom = BloomFilter(size, hashes, bits)
+        self.assertTrue(all(variant in bloom for variant in [(1, 10), (2, 20), (3, 30)]))
+
+    @unittest.mock.patch("beacon_api.utils.db_load.LOG")
+    @unittest.mock.patch("beacon_api.utils.db_load.asyncpg.connect")
+    async def test_build_summary(self, db_mock, mock_log):
+        """Test summarising the variants of a dataset on every chromosome."""
+        db_mock.return_value = Connection()
+        await self._db.connection()
+        summary = [{"variants": 3}, {"variants": 0}]
+        with unittest.mock.patch.object(self._db._conn, "fetch", new_callable=unittest.mock.AsyncMock, return_value=summary) as mock_fetch:
+            self.assertEqual(3, await self._db.build_summary("DATASET1"))
+        self.assertIn("LEFT JOIN beacon_data_table", mock_fetch.await_args.args[0])
+        self.assertEqual(("DATASET1", list(range(1, len(CHROMOSOMES) + 1))), mock_fetch.await_args.args[1:])
+
+    @unittest.mock.patch("beacon_api.utils.db_load.LOG")
+    @unittest.mock.patch("beacon_api.utils.db_load.asyncpg.connect")
+    async def test_notify(self, db_mock, mock_log):
+        """Test notifying the beacon servers of a loaded dataset."""
+        db_mock.return_value = Connection()
+        await self._db.connection()
+        with unittest.mock.patch.object(self._db._conn, "execute", new_callable=unittest.mock.AsyncMock) as mock_execute:
+            await self._db.notify("DATASET1")
+        self.assertEqual(("beacon_datasets", "DATASET1"), mock_execute.await_args.args[1:])
+
+    @unittest.mock.patch("beacon_api.utils.db_load.LOG")
+    async def test_setup_tables(self, mock_log):
+        """Test creating missing tables, partitioned on request."""
+        db = unittest.mock.AsyncMock()
+        db.check_tables.return_value = ["beacon_data_table"]
+        db.partitioned.return_value = True
+        await setup_tables(db, partitioned=True)
+        self.assertEqual(["data/partitioned.sql", "data/init.sql"], [call.args[0] for call in db.create_tables.await_args_list])
+        db.update_schema.assert_awaited()
+        self.assertIn("beacon_bloom_table", db.check_tables.await_args.args[0])
+        self.assertIn("beacon_summary_table", db.check_tables.await_args.args[0])
+        db.check_tables.return_value = []
+        db.partitioned.return_value = False
+        await setup_tables(db, partitioned=True)
+        self.assertEqual(2, db.create_tables.await_count)
+        mock_log.warning.assert_called_once()
+
+    @unittest.mock.patch("beacon_api.utils.db_load.LOG")
+    @unittest.mock.patch("beacon_api.utils.db_load.asyncpg.connect")
+    async def test_recount(self, db_mock, mock_log):
+        """Test recounting calls and variants of a dataset."""
+        db_mock.return_value = Connection()
+        await self._db.connection()
+        with unittest.mock.patch.object(self._db._conn, "execute", new_callable=unittest.mock.AsyncMock) as mock_execute:
+            self.assertEqual((1, 2), await self._db.recount("DATASET1"))
+            await self._db.add_counts("DATASET1", 3, 4)
+        self.assertEqual(("DATASET1", 1, 2), mock_execute.await_args_list[0].args[1:])
+        self.assertIn("coalesce(callCount, 0) + $2", mock_execute.await_args_list[1].args[0])
+
     @unittest.mock.patch("beacon_api.utils.db_load.LOG")
     @unittest.mock.patch("beacon_api.utils.db_load.asyncpg.connect")
     async def test_close(self, db_mock, mock_log):
@@ -348,18 +604,183 @@ class DatabaseTestCase(unittest.IsolatedAsyncioTestCase):
         result5 = self._db._unpack(variant_5)
         self.assertEqual(([0.3333333333333333], [1], ["INS"], ["TC"], 3, []), result5)
 
+    def test_unpack_batch(self):
+        """Test unpacking a chunk of records with allele count filtering."""
+        inf1 = INFO((20, 10, 1), "S", 100, None)
+        variant_1 = Variant(["C", "G", "T"], "A", inf1, 0.7, "snp", 50)
+        inf2 = INFO((1, 30), "S", 100, (0.01, 0.3))
+        variant_2 = Variant(["C", "G"], "A", inf2, 0.7, "snp", 50)
+        variant_3 = Variant(["C"], "A", inf1, 0.7, "snp", 50, aaf=0)
+        result = self._db._unpack_batch([variant_1, variant_2, variant_3], 5)
+        self.assertEqual([variant_1, variant_2], [variant for variant, _ in result])
+        self.assertEqual(([0.2, 0.1], [20, 10], ["SNP", "SNP"], ["C", "G"], 100, []), result[0][1])
+        # First allele is below the minimum, nothing is removed
+        self.assertEqual(([0.01, 0.3], [1, 30], ["SNP", "SNP"], ["C", "G"], 100, []), result[1][1])
+        self.assertEqual(
+            [(variant, self._db._unpack(variant)) for variant in [variant_1, variant_2]], self._db._unpack_batch([variant_1, variant_2, variant_3], 1)
+        )
+
+    def test_variant_rows(self):
+        """Test unpacking records into data and mate table rows."""
+        inf1 = INFO((20, 10, 1), "S", 100, None)
+        variant_1 = Variant(["C", "G", "T"], "A", inf1, 0.7, "snp", 50)
+        inf2 = INFO((1), None, 4, None, "BND", "137_2")
+        variant_2 = Variant(["N[CHR10:121482216["], "N", inf2, 0.7, "sv", 2, is_sv=True, ID="137_1")
+        variant_3 = Variant(["C"], "A", inf1, 0.7, "snp", 50, CHROM="GL000207.1")
+        data_rows, mate_rows = self._db._variant_rows("DATASET1", [variant_1, variant_2, variant_3], 5)
+        # Chromosome 1 and SNP are encoded, the variant on another contig is skipped
+        self.assertEqual(
+            [
+                ("DATASET1", 1, 10, "A", "C", 11, 6, 20, 100, 0.2, 6),
+                ("DATASET1", 1, 10, "A", "G", 11, 6, 10, 100, 0.1, 6),
+            ],
+            data_rows,
+        )
+        self.assertEqual([("DATASET1", "1", 10, "137_1", "10", 121482216, "137_2", "N", "N[CHR10:121482216[", 1, 4, 0.25, 11)], mate_rows)
+
+    @unittest.mock.patch("beacon_api.utils.db_load.LOG")
+    def test_variant_rows_unknown_type(self, mock_log):
+        """Test variant types without a code are stored as their nearest type with a code."""
+        inf1 = INFO((2), None, 4, None, "DEL")
+        variant_1 = Variant(["<DEL:ME:ALU>"], "A", inf1, 0.7, "sv", 2, is_sv=True)
+        inf2 = INFO((1), None, 4, None, "ALU")
+        variant_2 = Variant(["<ALU>"], "A", inf2, 0.7, "sv", 2, is_sv=True)
+        data_rows, _ = self._db._variant_rows("DATASET1", [variant_1, variant_2], 1)
+        # DEL:ME:ALU is stored as DEL:ME, ALU as UNKNOWN, and the aggregated type SV keeps its code
+        self.assertEqual([(9, 13), (14, 13)], [(row[10], row[6]) for row in data_rows])
+        mock_log.warning.assert_called_once()
+        self.assertIn("{'DEL:ME:ALU': 1, 'ALU': 1}", mock_log.warning.call_args.args[0])
+
+    @unittest.mock.patch("beacon_api.utils.db_load.LOG")
+    @unittest.mock.patch("beacon_api.utils.db_load.asyncpg.connect")
+    async def test_insert_variants(self, db_mock, mock_log):
+        """Test inserting variants through staging tables."""
+        db_mock.return_value = Connection()
+        await self._db.connection()
+        inf1 = INFO((1), "S", 3, None)
+        variant_1 = Variant(["C"], "T", inf1, 0.7, "snp", 3)
+        counts = await self._db.insert_rows(
+            "DATASET1", *self._db._variant_rows("DATASET1", [variant_1], 1), checkpoint=(self.datafile, None, 1, "chr1", 10, 2, 3)
+        )
+        self.assertEqual((3, 5), counts)
+        await self._db.insert_variants("DATASET1", [variant_1], 1)
+        self.assertTrue(self._db._staging)
+        mock_log.error.assert_not_called()
+        mock_log.debug.assert_called_with("Variants have been inserted")
+
     @unittest.mock.patch("beacon_api.utils.db_load.LOG")
     @unittest.mock.patch("beacon_api.utils.db_load.asyncpg.connect")
     async def test_chunks(self, db_mock, mock_log):
         """Test database URL fetching."""
         db_mock.return_value = Connection()
         await self._db.connection()
-        variant = [(1, 2), (2, 3)]
-        result = self._db._chunks(variant, 1)
-        lines = []
-        for i in result:
-            lines.append(list(i))
-        self.assertEqual([[(1, 2)], [(2, 3)]], lines)
+        records = [Record(Variant(alt, "T", INFO((1), "S", 3, None), 0.7, "snp", 3, start=start)) for start, alt in enumerate([["C"], ["C", "G"], ["A"]])]
+        chunks = [[record.start for record in chunk] for chunk in self._db._chunks(records, 2)]
+        self.assertEqual([[0], [1], [2]], chunks)
+        chunks = [[record.start for record in chunk] for chunk in self._db._chunks(records, 3)]
+        self.assertEqual([[0, 1], [2]], chunks)
+        chunks = [[record.start for record in chunk] for chunk in self._db._chunks(records, 10, records[0].nbytes)]
+        self.assertEqual([[0], [1], [2]], chunks)
+
+    def test_record(self):
+        """Test extracting the fields of a VCF record."""
+        variant = Variant(["C"], "T", INFO((1), "S", None, None), 0.7, "snp", 3)
+        record = Record(variant)
+        self.assertEqual(("chr1", 10, 11, "T", ["C"], 3), (record.CHROM, record.start, record.end, record.REF, record.ALT, record.num_called))
+        self.assertEqual({"AC": 1, "AN": None, "AF": None, "VT": "S", "SVTYPE": None, "MATEID": None}, record.INFO)
+        self.assertEqual(1, record.rows)
+        self.assertIsNone(Record(Variant(["C"], "T", INFO((1), "S", 3, None), 0.7, "snp", 3)).num_called)
+        self.assertEqual(self._db._variant_rows("DATASET1", [variant], 1), self._db._variant_rows("DATASET1", [record], 1))
+
+
+class ManifestTestCase(unittest.IsolatedAsyncioTestCase):
+    """Test loading datasets of a manifest."""
+
+    def setUp(self):
+        """Initialise temporary directory with two datasets."""
+        self._dir = TempDirectory()
+        for name in ["a.vcf", "a.json", "b.vcf", "b.json"]:
+            self._dir.write(name, b"")
+        self.manifest = self._dir.write(
+            "manifest.json", b'[{"datafile": "a.vcf", "metadata": "a.json"}, {"datafile": "b.vcf", "metadata": "b.json", "samples": "S1,S2"}]'
+        )
+
+    def tearDown(self):
+        """Remove temporary directory."""
+        self._dir.cleanup_all()
+
+    def test_read_manifest(self):
+        """Test reading datasets of a manifest relative to its directory."""
+        datasets = read_manifest(self.manifest)
+        self.assertEqual((f"{self._dir.path}/a.vcf", f"{self._dir.path}/a.json", None), datasets[0])
+        self.assertEqual("S1,S2", datasets[1][2])
+        missing = self._dir.write("missing.json", b'[{"datafile": "c.vcf", "metadata": "a.json"}]')
+        with self.assertRaises(LoadError):
+            read_manifest(missing)
+        invalid = self._dir.write("invalid.json", b'{"datafile": "a.vcf"}')
+        with self.assertRaises(LoadError):
+            read_manifest(invalid)
+
+    @unittest.mock.patch("beacon_api.utils.db_load.LOG")
+    @unittest.mock.patch("beacon_api.utils.db_load.load_dataset")
+    @unittest.mock.patch("beacon_api.utils.db_load.asyncpg.create_pool", new_callable=unittest.mock.AsyncMock)
+    async def test_load_manifest(self, mock_pool, mock_load, mock_log):
+        """Test all datasets of a manifest are loaded over a shared pool and failures are reported."""
+        pool = mock_pool.return_value
+        pool.acquire.return_value = Connection()
+        mock_load.side_effect = [("A", 10, 1.0), Exception("boom")]
+        with self.assertRaises(LoadError) as context:
+            await load_manifest(self.manifest, 2, 1, 0, {"resume": False, "swap": False})
+        self.assertEqual(2, mock_pool.await_args.kwargs["max_size"])
+        self.assertEqual(2, mock_load.await_count)
+        self.assertEqual(["S1", "S2"], mock_load.await_args_list[1].args[3])
+        self.assertIn("1 of 2 dataset(s)", str(context.exception))
+        self.assertIn(f"{self._dir.path}/b.vcf with {self._dir.path}/b.json: boom", str(context.exception))
+        self.assertEqual(pool.acquire.await_count, pool.release.await_count)
+        pool.close.assert_awaited_once()
+
+
+class RegionsTestCase(unittest.TestCase):
+    """Test splitting datafiles by region."""
+
+    def setUp(self):
+        """Initialise temporary directory."""
+        self._dir = TempDirectory()
+
+    def tearDown(self):
+        """Remove temporary directory."""
+        self._dir.cleanup_all()
+
+    def test_datafile_index(self):
+        """Test finding tabix and CSI indexes."""
+        datafile = self._dir.write("data.vcf.gz", b"")
+        self.assertIsNone(datafile_index(datafile))
+        index = self._dir.write("data.vcf.gz.csi", b"")
+        self.assertEqual(str(datafile_index(datafile)), index)
+
+    def test_datafile_regions(self):
+        """Test splitting contigs into regions."""
+        vcf = unittest.mock.MagicMock()
+        vcf.seqnames = ["1", "MT"]
+        vcf.seqlens = [25, 10]
+        self.assertEqual([("1", 0, None), ("MT", 0, None)], datafile_regions(vcf))
+        self.assertEqual([("1", 0, 10), ("1", 10, 20), ("1", 20, 25), ("MT", 0, 10)], datafile_regions(vcf, 10))
+
+    def test_region_name(self):
+        """Test naming regions for checkpoints."""
+        self.assertEqual("", region_name(None))
+        self.assertEqual("MT", region_name(("MT", 0, None)))
+        self.assertEqual("1:11-20", region_name(("1", 10, 20)))
+
+    def test_region_records(self):
+        """Test reading records starting inside a region."""
+        variants = [Variant(["C"], "T", None, 0.7, "snp", 3, start=start) for start in [8, 10, 19, 20]]
+        vcf = unittest.mock.MagicMock(return_value=variants)
+        result = list(region_records(vcf, ("1", 10, 20)))
+        vcf.assert_called_with("1:11-20")
+        self.assertEqual([10, 19], [variant.start for variant in result])
+        list(region_records(vcf, ("1", 0, None)))
+        vcf.assert_called_with("1")
 
 
 if __name__ == "__main__":
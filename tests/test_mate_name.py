@@ -14,6 +14,7 @@ class TestDataQueryFunctions(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result, [])
         result_miss = await find_fusion(None, "GRCh38", (), "Y", "T", "C", [], access_type, "MISS")
         self.assertEqual(result_miss, [])
+        self.assertEqual([False, True], [call.kwargs["misses"] for call in mock_filtered.call_args_list])
 
 
 if __name__ == "__main__":
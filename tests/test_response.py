@@ -1,5 +1,5 @@
 from beacon_api.api.info import beacon_info, ga4gh_info
-from beacon_api.api.query import query_request_handler
+from beacon_api.api.query import batch_request_handler, exact_variant, query_request_handler
 import unittest
 from beacon_api.schemas import load_schema
 from beacon_api.utils.validate_jwt import get_key
@@ -9,6 +9,7 @@ import json
 import aiohttp
 from aioresponses import aioresponses
 from aiocache import caches
+from beacon_api.utils.results import ResultCache
 
 
 mock_dataset_metadata = {
@@ -56,6 +57,14 @@ mock_data = [
 ]
 
 
+def mock_pool():
+    """Mock a database pool handing out one connection."""
+    connection = unittest.mock.MagicMock()
+    pool = unittest.mock.MagicMock()
+    pool.acquire.return_value.__aenter__.return_value = connection
+    return pool, connection
+
+
 class TestBasicFunctions(unittest.IsolatedAsyncioTestCase):
     """Test supporting functions."""
 
@@ -75,13 +84,14 @@ class TestBasicFunctions(unittest.IsolatedAsyncioTestCase):
         # if it is none no error occurred
         self.assertEqual(jsonschema.validate(json.loads(json.dumps(result)), load_schema("service-info")), None)
 
+    @unittest.mock.patch("beacon_api.api.query.RESULTS", ResultCache(2**20, 60))
     @unittest.mock.patch("beacon_api.api.query.find_datasets")
-    @unittest.mock.patch("beacon_api.api.query.fetch_datasets_access")
+    @unittest.mock.patch("beacon_api.api.query.CATALOG.access")
     async def test_beacon_query(self, fetch_req_datasets, data_find):
         """Test query data response."""
         data_find.return_value = mock_data
         fetch_req_datasets.return_value = mock_controlled
-        pool = unittest.mock.AsyncMock()
+        pool, connection = mock_pool()
         request = {
             "assemblyId": "GRCh38",
             "referenceName": "MT",
@@ -96,14 +106,24 @@ class TestBasicFunctions(unittest.IsolatedAsyncioTestCase):
         result = await query_request_handler(params)
         self.assertEqual(jsonschema.validate(json.loads(json.dumps(result)), load_schema("response")), None)
         data_find.assert_called()
-
+        # One connection in one read-only transaction serves the whole request
+        pool.acquire.assert_called_once()
+        connection.transaction.assert_called_once_with(isolation="serializable", readonly=True, deferrable=True)
+        self.assertIs(pool, fetch_req_datasets.call_args.args[0])
+        self.assertIs(connection, data_find.call_args.args[0])
+        # A repeated request is answered from the result cache, without a connection
+        self.assertEqual(result, await query_request_handler(params))
+        pool.acquire.assert_called_once()
+        data_find.assert_called_once()
+
+    @unittest.mock.patch("beacon_api.api.query.RESULTS", ResultCache(2**20, 60))
     @unittest.mock.patch("beacon_api.api.query.find_fusion")
-    @unittest.mock.patch("beacon_api.api.query.fetch_datasets_access")
+    @unittest.mock.patch("beacon_api.api.query.CATALOG.access")
     async def test_beacon_query_bnd(self, fetch_req_datasets, data_find):
         """Test query data response."""
         data_find.return_value = mock_data
         fetch_req_datasets.return_value = mock_controlled
-        pool = unittest.mock.AsyncMock()
+        pool, connection = mock_pool()
         request = {
             "assemblyId": "GRCh38",
             "referenceName": "MT",
@@ -119,6 +139,43 @@ class TestBasicFunctions(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(jsonschema.validate(json.loads(json.dumps(result)), load_schema("response")), None)
         data_find.assert_called()
 
+    @unittest.mock.patch("beacon_api.api.query.find_datasets")
+    @unittest.mock.patch("beacon_api.api.query.find_exact_variants")
+    @unittest.mock.patch("beacon_api.api.query.CATALOG.access")
+    async def test_batch_query(self, fetch_req_datasets, exact_find, data_find):
+        """Test batch query responses, exact variants are found together and the other requests one by one, in order."""
+        exact_find.return_value = [mock_data, []]
+        data_find.return_value = mock_data
+        fetch_req_datasets.return_value = mock_controlled
+        pool, connection = mock_pool()
+        exact = {"assemblyId": "GRCh38", "referenceName": "MT", "start": 0, "referenceBases": "C", "alternateBases": "T"}
+        wildcard = {**exact, "alternateBases": "N"}
+        batch = {"requests": [exact, wildcard, {**exact, "start": 1}], "includeDatasetResponses": "HIT", "datasetIds": []}
+
+        params = pool, "POST", batch, {"bona_fide_status": True, "permissions": None}, "localhost"
+        result = await batch_request_handler(params)
+        for response in result:
+            self.assertEqual(jsonschema.validate(json.loads(json.dumps(response)), load_schema("response")), None)
+        self.assertEqual([True, True, False], [response["exists"] for response in result])
+        self.assertEqual([0, 0, 1], [response["alleleRequest"]["start"] for response in result])
+        self.assertEqual("HIT", result[1]["alleleRequest"]["includeDatasetResponses"])
+        # Access is resolved once, and one connection in one read-only transaction serves the whole batch
+        fetch_req_datasets.assert_awaited_once()
+        pool.acquire.assert_called_once()
+        connection.transaction.assert_called_once_with(isolation="serializable", readonly=True, deferrable=True)
+        self.assertEqual([("GRCh38", "MT", 0, "C", "T"), ("GRCh38", "MT", 1, "C", "T")], exact_find.await_args.args[1])
+        self.assertEqual("HIT", exact_find.await_args.args[4])
+        data_find.assert_awaited_once()
+        self.assertEqual("N", data_find.await_args.args[5][1])
+
+    def test_exact_variant(self):
+        """Test requests of one variant with alleles without wildcards are exact variants."""
+        exact = {"assemblyId": "GRCh38", "referenceName": "MT", "start": 0, "referenceBases": "C", "alternateBases": "T"}
+        self.assertTrue(exact_variant(exact))
+        for request in [{**exact, "end": 1}, {**exact, "referenceBases": "N"}, {**exact, "mateName": "1"}, {"startMin": 0, "startMax": 1, **exact}]:
+            self.assertFalse(exact_variant(request), request)
+        self.assertFalse(exact_variant({"assemblyId": "GRCh38", "referenceName": "MT", "start": 0, "referenceBases": "C", "variantType": "SNP"}))
+
     @aioresponses()
     async def test_bad_retrieve_user_data(self, m):
         """Test a failing userdata call because token is bad."""
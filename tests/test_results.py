@@ -0,0 +1,127 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from beacon_api.utils.results import ResultCache, result_key
+
+RESULT = [{"datasetId": "DATASET1", "exists": True}]
+
+
+class TestResultCache(unittest.TestCase):
+    """Test the query result cache."""
+
+    def setUp(self):
+        """Create a cache holding two results."""
+        self.size = len('[{"datasetId":"DATASET1","exists":true}]')
+        self.cache = ResultCache(2 * self.size, 60)
+
+    def test_result_key(self):
+        """Test requests are keyed by their variant, the accessible datasets and the dataset responses queried."""
+        request = {"assemblyId": "GRCh38", "referenceName": "MT", "start": 10, "referenceBases": "T", "alternateBases": "C"}
+        key = result_key({**request, "includeDatasetResponses": "ALL"}, ["DATASET2", "DATASET1"], ["REGISTERED", "PUBLIC"])
+        self.assertEqual(key, result_key({**request, "includeDatasetResponses": "MISS"}, ["DATASET1", "DATASET2"], ["PUBLIC", "REGISTERED"]))
+        self.assertNotEqual(key, result_key({**request, "includeDatasetResponses": "HIT"}, ["DATASET1", "DATASET2"], ["PUBLIC", "REGISTERED"]))
+        self.assertNotEqual(key, result_key(request, ["DATASET1", "DATASET2"], ["PUBLIC", "REGISTERED"]))
+        self.assertNotEqual(key, result_key(request, ["DATASET1"], ["PUBLIC", "REGISTERED"]))
+        self.assertNotEqual(key, result_key({**request, "start": 11}, ["DATASET1", "DATASET2"], ["PUBLIC", "REGISTERED"]))
+
+    def test_get_put(self):
+        """Test results are cached, and the least recently used are evicted beyond the size of the cache."""
+        self.assertIsNone(self.cache.get("a"))
+        for key in ["a", "b"]:
+            self.cache.put(key, RESULT, ["DATASET1"], 0)
+        self.assertEqual(RESULT, self.cache.get("a"))
+        self.cache.put("c", RESULT, ["DATASET1"], 0)
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(["a", "c"], list(self.cache.entries))
+        self.assertEqual({"DATASET1": {"a", "c"}}, self.cache.keys)
+        self.cache.put("d", RESULT * 3, ["DATASET1"], 0)
+        self.assertIsNone(self.cache.get("d"))
+        metrics = self.cache.metrics()
+        self.assertEqual((1, 3, 1, 2, 2 * self.size), (metrics["hits"], metrics["misses"], metrics["evictions"], metrics["entries"], metrics["bytes"]))
+        self.assertEqual(0.25, metrics["hitRatio"])
+
+    def test_expired(self):
+        """Test results are dropped once their time to live has passed."""
+        self.cache.put("a", RESULT, ["DATASET1"], 0)
+        with mock.patch("beacon_api.utils.results.time.monotonic", return_value=10**9):
+            self.assertIsNone(self.cache.get("a"))
+        self.assertEqual((1, 0, {}), (self.cache.counts["expirations"], self.cache.bytes, self.cache.keys))
+
+    def test_invalidate(self):
+        """Test the results of a dataset are dropped, results found before an invalidation are not cached."""
+        self.cache.put("a", RESULT, ["DATASET1", "DATASET2"], 0)
+        self.cache.put("b", RESULT, ["DATASET2"], 0)
+        version = self.cache.version
+        self.cache.invalidate("DATASET1")
+        self.assertEqual(["b"], list(self.cache.entries))
+        self.assertEqual({"DATASET2": {"b"}}, self.cache.keys)
+        self.cache.put("a", RESULT, ["DATASET1"], version)
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(1, self.cache.counts["invalidations"])
+
+
+class TestCoalescing(unittest.IsolatedAsyncioTestCase):
+    """Test concurrent requests share lookups."""
+
+    def setUp(self):
+        """Create a cache, and a lookup waiting to be released."""
+        self.cache = ResultCache(2**20, 60)
+        self.released = asyncio.Event()
+        self.lookup = mock.AsyncMock(side_effect=self.released.wait)
+
+    async def test_find(self):
+        """Test concurrent requests of a key share one lookup, later requests are answered from the cache."""
+        self.lookup.side_effect = None
+        self.lookup.return_value = RESULT
+        requests = [self.cache.find("a", ["DATASET1"], self.lookup) for _ in range(3)]
+        self.assertEqual([RESULT] * 3, await asyncio.gather(*requests))
+        self.assertEqual(RESULT, await self.cache.find("a", ["DATASET1"], self.lookup))
+        self.lookup.assert_awaited_once()
+        self.assertEqual((2, 1, {}), (self.cache.counts["coalesced"], self.cache.counts["hits"], self.cache.flights))
+
+    async def test_find_keys(self):
+        """Test requests of different keys, e.g. of different accessible datasets, do not share lookups."""
+        requests = [asyncio.ensure_future(self.cache.find(key, ["DATASET1"], self.lookup)) for key in ["a", "b"]]
+        await asyncio.sleep(0)
+        self.released.set()
+        await asyncio.gather(*requests)
+        self.assertEqual(2, self.lookup.await_count)
+
+    async def test_find_cancelled(self):
+        """Test a lookup completes for the other requests when the request that started it is cancelled."""
+        first = asyncio.ensure_future(self.cache.find("a", ["DATASET1"], self.lookup))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(self.cache.find("a", ["DATASET1"], self.lookup))
+        await asyncio.sleep(0)
+        first.cancel()
+        self.released.set()
+        self.assertTrue(await second)
+        self.assertTrue(first.cancelled())
+        self.lookup.assert_awaited_once()
+
+    async def test_find_failed(self):
+        """Test the requests sharing a failed lookup all fail, the next request looks up again."""
+        self.lookup.side_effect = ValueError("lookup failed")
+        requests = [self.cache.find("a", ["DATASET1"], self.lookup) for _ in range(2)]
+        results = await asyncio.gather(*requests, return_exceptions=True)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        with self.assertRaises(ValueError):
+            await self.cache.find("a", ["DATASET1"], self.lookup)
+        self.assertEqual(2, self.lookup.await_count)
+
+    async def test_find_invalidated(self):
+        """Test requests after an invalidation do not share the lookups started before it."""
+        first = asyncio.ensure_future(self.cache.find("a", ["DATASET1"], self.lookup))
+        await asyncio.sleep(0)
+        self.cache.invalidate("DATASET1")
+        second = asyncio.ensure_future(self.cache.find("a", ["DATASET1"], self.lookup))
+        await asyncio.sleep(0)
+        self.released.set()
+        await asyncio.gather(first, second)
+        self.assertEqual(2, self.lookup.await_count)
+        self.assertEqual(["a"], list(self.cache.entries))
+
+
+if __name__ == "__main__":
+    unittest.main()
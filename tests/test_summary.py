@@ -0,0 +1,55 @@
+import unittest
+from unittest import mock
+
+import asyncpg
+
+from beacon_api.utils.summary import DatasetSummary, fetch_summaries, prune_datasets
+
+
+class TestDatasetSummary(unittest.IsolatedAsyncioTestCase):
+    """Test position summaries of datasets."""
+
+    def setUp(self):
+        """Summarise variants starting from 100 to 200 and ending from 101 to 300."""
+        self.summary = DatasetSummary("PUBLIC", "GRCh38", 10, 100, 200, 101, 300, frozenset([1, 6]))
+        self.record = {"datasetid": "DATASET1", "accesstype": "PUBLIC", "assemblyid": "GRCh38", "variants": 10}
+        self.record.update({"minstart": 100, "maxstart": 200, "minend": 101, "maxend": 300, "varianttypes": [1, 6]})
+
+    def test_rules_out(self):
+        """Test queries are ruled out by the positions, variant types and assembly of the summary."""
+        for parameters in [{"start": 100}, {"start": 200, "end": 300}, {"startMin": 150, "startMax": 250}, {"endMin": 300, "endMax": 400}, {"variantType": 6}]:
+            self.assertFalse(self.summary.rules_out("GRCh38", parameters), parameters)
+        ruled_out = [{"start": 99}, {"start": 150, "end": 301}, {"startMin": 201}, {"startMax": 99}, {"endMin": 301}, {"endMax": 100}, {"variantType": 2}]
+        for parameters in ruled_out:
+            self.assertTrue(self.summary.rules_out("GRCh38", parameters), parameters)
+        self.assertTrue(self.summary.rules_out("GRCh37", {"start": 100}))
+        self.assertTrue(self.summary._replace(variants=0, min_start=None, max_start=None).rules_out("GRCh38", {}))
+        self.assertTrue(self.summary._replace(min_end=None, max_end=None).rules_out("GRCh38", {"endMax": 400}))
+
+    @mock.patch.dict("beacon_api.utils.summary.SUMMARIES", clear=True)
+    async def test_prune_datasets(self):
+        """Test summaries are loaded once per time to live, datasets without summaries are kept."""
+        connection = mock.MagicMock()
+        connection.executemany = mock.AsyncMock()
+        connection.fetch = mock.AsyncMock(return_value=[self.record])
+        self.assertEqual((["DATASET1", "DATASET2"], {}), await prune_datasets(connection, ["DATASET1", "DATASET2"], 1, "GRCh38", {"start": 150}))
+        self.assertEqual((["DATASET2"], {"DATASET1": self.summary}), await prune_datasets(connection, ["DATASET1", "DATASET2"], 1, "GRCh38", {"start": 99}))
+        connection.fetch.assert_awaited_once()
+        self.assertEqual((["DATASET1", "DATASET2"], 1), connection.fetch.await_args.args[1:])
+        with mock.patch("beacon_api.utils.summary.SUMMARY_TTL", -1):
+            await fetch_summaries(connection, ["DATASET1"], 1)
+        self.assertEqual(2, connection.fetch.await_count)
+
+    @mock.patch.dict("beacon_api.utils.summary.SUMMARIES", clear=True)
+    @mock.patch("beacon_api.utils.summary.LOG")
+    async def test_fetch_summaries_no_table(self, mock_log):
+        """Test variants are queried without summaries on databases without beacon_summary_table."""
+        connection = mock.MagicMock()
+        connection.executemany = mock.AsyncMock()
+        connection.fetch = mock.AsyncMock(side_effect=asyncpg.UndefinedTableError("beacon_summary_table"))
+        self.assertEqual({"DATASET1": None}, await fetch_summaries(connection, ["DATASET1"], 1))
+        mock_log.warning.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()